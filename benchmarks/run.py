@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Benchmark the template, report and log hot paths on synthetic inputs.
+
+  python -m benchmarks.run                         # show the timings
+  python -m benchmarks.run --save                  # store them as baseline
+  python -m benchmarks.run --compare               # fail on regressions
+  python -m benchmarks.run --log-mb 500 -k errors  # only the big logs
+
+The baseline is only meaningful on the machine where it has been saved."""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from tektonasacode import github, render, utils
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# Size of the inputs, --quick is to check the benchmarks still works
+SIZES = {
+    "payload_commits": 2000,
+    "templates": 300,
+    "task_runs": 250,
+    "log_mb": 64,
+    "catalog_tasks": 500,
+}
+QUICK_SIZES = {
+    "payload_commits": 10,
+    "templates": 5,
+    "task_runs": 5,
+    "log_mb": 1,
+    "catalog_tasks": 5,
+}
+
+TEMPLATE_PARAMS = ("revision", "namespace", "repo_url",
+                   "pull_request.head.sha", "pull_request.user.login",
+                   "repository.owner.login", "pull_request.base.repo.full_name",
+                   "not.a.key")
+
+
+def webhook_payload(commits: int) -> Dict[str, Any]:
+    """A pull request payload, made large by the commits"""
+    return {
+        "pull_request": {
+            "number": 1,
+            "head": {"sha": "5ea1" * 10},
+            "user": {"login": "foo"},
+            "base": {"repo": {"full_name": "owner/repo"}},
+            "body": "x" * 65536,
+        },
+        "repository": {
+            "full_name": "owner/repo",
+            "owner": {"login": "owner"},
+        },
+        "commits": [{
+            "sha": f"{i:040x}",
+            "message": f"Commit number {i}\n\n" + "Some explanation. " * 20,
+            "author": {"name": "Foo Bar", "email": "foo@bar.com"},
+            "files": [f"dir/file{j}.py" for j in range(10)],
+        } for i in range(commits)],
+    }
+
+
+def template(index: int) -> str:
+    """A template using all kind of parameters"""
+    lines = [
+        "apiVersion: tekton.dev/v1beta1",
+        "kind: PipelineRun",
+        "metadata:",
+        f"  name: pipelinerun-{index}",
+        "spec:",
+        "  params:",
+    ]
+    for step in range(40):
+        param = TEMPLATE_PARAMS[step % len(TEMPLATE_PARAMS)]
+        lines += [
+            f"    - name: param-{step}",
+            f"      value: \"{{{{{param}}}}}\"",
+            "    - name: literal",
+            "      value: \"no parameters here\"",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def pipelinerun(task_runs: int) -> Dict[str, Any]:
+    """A finished pipelinerun with a lot of taskRuns"""
+    return {
+        "metadata": {"name": "pipelinerun"},
+        "status": {
+            "taskRuns": {
+                f"pipelinerun-task{i}-abcde": {
+                    "pipelineTaskName": f"task{i}",
+                    "status": {
+                        "startTime": "2020-01-01T00:00:00Z",
+                        "completionTime": "2020-01-01T00:01:30Z",
+                        "conditions": [{
+                            "type": "Succeeded",
+                            "status": "False" if i % 10 == 0 else "True",
+                        }],
+                    },
+                }
+                for i in range(task_runs)
+            }
+        },
+    }
+
+
+def log(megabytes: int) -> str:
+    """A log with about one error line every fifty lines"""
+    block = "".join(
+        f"[build : step-{i % 5}] Compiling module{i}.go in 0.{i:03d}s\n"
+        for i in range(49))
+    block += "[test : unit] tests/foo_test.go:42: Error: expected 1 got 2\n"
+    return block * (megabytes * 1024 * 1024 // len(block))
+
+
+def catalog(tasks: int) -> Dict[str, Any]:
+    """The tree of a catalog with a lot of tasks and versions"""
+    tree = []
+    for i in range(tasks):
+        for version in ("0.1", "0.2", "0.3", "0.9", "0.10"):
+            for filename in ("", "README.md", "tests/run.yaml",
+                             f"task{i}.yaml"):
+                path = f"task/task{i}/{version}"
+                tree.append({
+                    "path": f"{path}/{filename}" if filename else path,
+                    "url": f"https://api.github.com/{path}/{filename}",
+                })
+    return {"tree": tree}
+
+
+@contextlib.contextmanager
+def new_render_cache(directory: str):
+    """Render like a new process would, with an empty cache in memory and
+    what has been persisted in directory"""
+    previous = render.CACHE
+    render.CACHE = render.RenderCache(directory=directory)
+    try:
+        yield
+    finally:
+        render.CACHE = previous
+
+
+def bench_kapply(sizes: Dict[str, int]) -> Callable:
+    """Render hundreds of templates against a large payload in a new run,
+    nothing has been compiled before"""
+    jeez = webhook_payload(sizes["payload_commits"])
+    extras = {
+        "revision": "5ea1" * 10,
+        "namespace": "pull-1-5ea1c-ab",
+        "repo_url": "https://github.com/owner/repo",
+    }
+    templates = [template(i) for i in range(sizes["templates"])]
+    tutils = utils.Utils()
+
+    def run():
+        with tempfile.TemporaryDirectory() as directory, new_render_cache(
+                directory):
+            for index, content in enumerate(templates):
+                tutils.kapply(content, jeez, extras, name=f"template{index}")
+
+    return run
+
+
+def bench_kapply_new_revision(sizes: Dict[str, int]) -> Callable:
+    """Render the same templates for a new revision in a new run every time,
+    like the pushes to a pull request, reusing what the previous runs have
+    compiled"""
+    jeez = webhook_payload(sizes["payload_commits"])
+    templates = [template(i) for i in range(sizes["templates"])]
+    tutils = utils.Utils()
+    revisions = itertools.count()
+    directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+
+    def run():
+        extras = {
+            "revision": f"{next(revisions):040x}",
+            "namespace": "pull-1-5ea1c-ab",
+            "repo_url": "https://github.com/owner/repo",
+        }
+        with new_render_cache(directory.name):
+            for index, content in enumerate(templates):
+                tutils.kapply(content, jeez, extras, name=f"template{index}")
+
+    run()
+    return run
+
+
+def bench_process_pipelineresult(sizes: Dict[str, int]) -> Callable:
+    """Report the status of a pipelinerun with a lot of taskRuns"""
+    jeez = pipelinerun(sizes["task_runs"])
+    return lambda: utils.Utils.process_pipelineresult(jeez)
+
+
+def bench_get_errors(sizes: Dict[str, int]) -> Callable:
+    """Find the errors in big logs"""
+    text = log(sizes["log_mb"])
+    return lambda: utils.Utils.get_errors(text)
+
+
+def bench_get_task_latest_version(sizes: Dict[str, int]) -> Callable:
+    """Find the latest version of a task in a big catalog"""
+    tree = catalog(sizes["catalog_tasks"])
+    gh = github.Github("token")
+    gh.request = lambda *args, **kwargs: (None, tree)
+    task = f"task{sizes['catalog_tasks'] - 1}"
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            assert gh.get_task_latest_version("tektoncd/catalog",
+                                              task) == "0.10"
+
+    return run
+
+
+BENCHMARKS = {
+    "kapply": bench_kapply,
+    "kapply_new_revision": bench_kapply_new_revision,
+    "process_pipelineresult": bench_process_pipelineresult,
+    "get_errors": bench_get_errors,
+    "get_task_latest_version": bench_get_task_latest_version,
+}
+
+
+def run_benchmarks(sizes: Dict[str, int],
+                   repeat: int = 5,
+                   only: str = "") -> Dict[str, Dict[str, float]]:
+    """Run the benchmarks matching only and time them"""
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if only and only not in name:
+            continue
+        func = setup(sizes)
+        timings: List[float] = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        results[name] = {
+            "median": round(statistics.median(timings), 6),
+            "min": round(min(timings), 6),
+            "repeat": repeat,
+        }
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]],
+            baseline: Dict[str, Dict[str, float]],
+            tolerance: float) -> List[str]:
+    """Get the benchmarks slower than the baseline times the tolerance"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result["median"] / max(baseline[name]["median"], 1e-9)
+        if ratio > tolerance:
+            regressions.append(
+                f"{name}: {result['median']:.6f}s is {ratio:.2f}x the "
+                f"baseline {baseline[name]['median']:.6f}s")
+    return regressions
+
+
+def main() -> int:
+    """Run the benchmarks and save or compare them to the baseline"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("-k", dest="only", default="",
+                        help="Only run the benchmarks with this in the name")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true",
+                        help="Tiny inputs, to check the benchmarks work")
+    parser.add_argument("--log-mb", type=int,
+                        help=f"Size of the logs (default {SIZES['log_mb']})")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true",
+                        help="Save the results as the baseline")
+    parser.add_argument("--compare", action="store_true",
+                        help="Fail if slower than the baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="How much slower than the baseline is a "
+                        "regression")
+    args = parser.parse_args()
+
+    sizes = dict(QUICK_SIZES if args.quick else SIZES)
+    if args.log_mb:
+        sizes["log_mb"] = args.log_mb
+    results = run_benchmarks(sizes, args.repeat, args.only)
+    for name, result in results.items():
+        print(f"{name:<28} median {result['median']:.6f}s "
+              f"min {result['min']:.6f}s")
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            baseline = json.load(open(args.baseline))
+        baseline.update(results)
+        with open(args.baseline, "w") as fp:
+            json.dump(baseline, fp, indent=2, sort_keys=True)
+            fp.write("\n")
+        print(f"💾 Baseline saved in {args.baseline}")
+
+    if args.compare:
+        regressions = compare(results, json.load(open(args.baseline)),
+                              args.tolerance)
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            return 1
+        print("✅ No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,512 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Simulate complete runs without a cluster or GitHUB.
+
+A local GitHUB API stand-in and fake kubectl, tkn and git executables on the
+PATH let us drive the CLI end to end and measure how long it takes:
+
+  python -m benchmarks.simulator --runs 3 --log-lines 10000 \\
+      --latency kubectl=0.2 --latency logs=5
+
+This module is also what the fake executables run, so it only uses the
+standard library."""
+import argparse
+import base64
+import http.server
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+OWNER = "simulated"
+REPO = "repo"
+PULL_REQUEST_NUMBER = 1
+SHA = "5ea1c0ffee5ea1c0ffee5ea1c0ffee5ea1c0ffee"
+PIPELINERUN = "simulated"
+TASKS = ("clone", "lint", "test", "build")
+# Seconds each fake command takes, logs is for the whole tkn pr logs
+LATENCIES = {
+    "kubectl": 0.0,
+    "tkn": 0.0,
+    "git": 0.0,
+    "github": 0.0,
+    "logs": 1.0,
+}
+# Where the fake commands find the simulation state
+STATE_ENV = "TKAAC_SIMULATOR_DIR"
+FAKES = ("kubectl", "tkn", "git")
+
+PIPELINERUN_TEMPLATE = """---
+apiVersion: tekton.dev/v1beta1
+kind: PipelineRun
+metadata:
+  name: simulated
+spec:
+  pipelineSpec:
+    tasks:
+      - name: test
+        taskSpec:
+          steps:
+            - name: test
+              image: registry.access.redhat.com/ubi8/ubi-minimal
+              script: |
+                echo "Testing {{revision}} from {{repo_url}}"
+"""
+
+
+def write_repository(directory: str):
+    """Write a repository with a .tekton directory to check out"""
+    os.makedirs(os.path.join(directory, ".tekton"), exist_ok=True)
+    with open(os.path.join(directory, ".tekton", "pipelinerun.yaml"),
+              "w",
+              encoding="utf-8") as template:
+        template.write(PIPELINERUN_TEMPLATE)
+
+
+def pipelinerun(finished: bool, status: str) -> Dict[str, Any]:
+    """The PipelineRun as kubectl would show it, still running until the
+    logs are done"""
+    if not finished:
+        condition = {"type": "Succeeded", "status": "Unknown",
+                     "reason": "Running", "message": "Tasks are running"}
+    elif status == "Succeeded":
+        condition = {"type": "Succeeded", "status": "True",
+                     "reason": "Succeeded", "message": "All Tasks completed"}
+    else:
+        condition = {"type": "Succeeded", "status": "False",
+                     "reason": "Failed", "message": "Tasks have failed"}
+    task_runs = {}
+    for index, task in enumerate(TASKS):
+        task_status = {"startTime": "2020-01-01T00:00:00Z"}
+        task_condition = dict(condition)
+        if finished:
+            task_status["completionTime"] = f"2020-01-01T00:0{index}:30Z"
+            if status == "Succeeded" or index < len(TASKS) - 1:
+                task_condition.update(status="True", reason="Succeeded")
+        task_status["conditions"] = [task_condition]
+        task_runs[f"{PIPELINERUN}-{task}-abcde"] = {
+            "pipelineTaskName": task,
+            "status": task_status,
+        }
+    return {
+        "apiVersion": "tekton.dev/v1beta1",
+        "kind": "PipelineRun",
+        "metadata": {"name": PIPELINERUN, "namespace": "simulated"},
+        "status": {"conditions": [condition], "taskRuns": task_runs},
+    }
+
+
+def fake_kubectl(args: List[str], state: str, cfg: Dict) -> int:
+    """Answer the kubectl commands we run"""
+    configmap = os.path.join(state, "configmap.json")
+    if args[0] == "get" and "route" in args:
+        print("console.simulated.example.com", end="")
+    elif args[0] == "get" and "pipelinerun" in args:
+        print(json.dumps({"items": [pipelinerun(
+            os.path.exists(os.path.join(state, "logs-done")),
+            cfg["status"])]}))
+    elif args[0] == "get" and "configmap" in args:
+        if not os.path.exists(configmap):
+            print("Error from server (NotFound)", file=sys.stderr)
+            return 1
+        with open(configmap, encoding="utf-8") as stored:
+            print(stored.read())
+    elif args[0] == "get":
+        print(json.dumps({"items": []}))
+    elif args[0] in ("replace", "create") and "-f" in args:
+        with open(args[args.index("-f") + 1], encoding="utf-8") as applied:
+            content = applied.read()
+        if '"ConfigMap"' in content:
+            with open(configmap, "w", encoding="utf-8") as stored:
+                stored.write(content)
+    return 0
+
+
+def fake_tkn(args: List[str], state: str, cfg: Dict) -> int:
+    """Stream the logs and describe the PipelineRun"""
+    if "logs" in args:
+        lines = cfg["log_lines"]
+        # Write the logs in a few chunks spread over the logs latency
+        chunks = max(1, min(lines, 20))
+        for chunk in range(chunks):
+            start, end = chunk * lines // chunks, (chunk + 1) * lines // chunks
+            out = "".join(f"[{TASKS[i % len(TASKS)]} : step] line {i}\n"
+                          for i in range(start, end))
+            sys.stdout.write(out)
+            sys.stdout.flush()
+            time.sleep(cfg["latency"]["logs"] / chunks)
+        if cfg["status"] != "Succeeded":
+            print("[build : step] .tekton/pipelinerun.yaml:1: error: "
+                  "simulated failure")
+        with open(os.path.join(state, "logs-done"), "w", encoding="utf-8"):
+            pass
+    elif "describe" in args:
+        print(f"""Name:        {PIPELINERUN}
+
+🌡️  Status
+
+STARTED          DURATION     STATUS
+1 minute ago     1 minute     {cfg['status']}""")
+    return 0
+
+
+def fake_git(args: List[str], state: str, cfg: Dict) -> int:  # pylint: disable=unused-argument
+    """Checking out is copying the simulated repository here"""
+    if args[:2] == ["reset", "--hard"]:
+        for root, _, files in os.walk(cfg["repository"]):
+            target = os.path.join(
+                ".", os.path.relpath(root, cfg["repository"]))
+            os.makedirs(target, exist_ok=True)
+            for filename in files:
+                shutil.copy(os.path.join(root, filename), target)
+    return 0
+
+
+def fake(name: str, args: List[str]) -> int:
+    """Run a fake command"""
+    state = os.environ[STATE_ENV]
+    with open(os.path.join(state, "simulator.json"),
+              encoding="utf-8") as cfgfile:
+        cfg = json.load(cfgfile)
+    time.sleep(cfg["latency"].get(name, 0))
+    return {
+        "kubectl": fake_kubectl,
+        "tkn": fake_tkn,
+        "git": fake_git,
+    }[name](args, state, cfg)
+
+
+class GithubHandler(http.server.BaseHTTPRequestHandler):
+    """Answer the GitHUB API requests we do and record them"""
+    server: "GithubServer"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def reply(self, status: int, jeez: Any):
+        """Send a JSON reply"""
+        body = json.dumps(jeez).encode()
+        time.sleep(self.server.latency)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_request(self):
+        """Record the request and dispatch it"""
+        length = int(self.headers.get("Content-Length") or 0)
+        data = json.loads(self.rfile.read(length) or b"null")
+        path = self.path.split("?")[0]
+        self.server.requests.append((self.command, path, data))
+        prefix = f"/repos/{OWNER}/{REPO}"
+        if path == "/graphql":
+            self.reply(200, self.server.graphql())
+        elif path == f"{prefix}/check-runs":
+            self.reply(201, {
+                "id": 1,
+                "html_url": f"https://github.com/{OWNER}/{REPO}/runs/1",
+            })
+        elif path.startswith(f"{prefix}/check-runs/"):
+            self.reply(200, {"id": 1})
+        elif path.startswith(f"{prefix}/contents/"):
+            content = self.server.file_content(path[len(prefix) + 10:])
+            if content is None:
+                self.reply(404, {"message": "Not Found"})
+            else:
+                self.reply(200, {
+                    "content": base64.b64encode(content).decode(),
+                })
+        elif path.startswith(f"{prefix}/pulls/"):
+            self.reply(200, [{"filename": ".tekton/pipelinerun.yaml"}])
+        else:
+            self.reply(404, {"message": "Not Found"})
+
+    do_GET = do_POST = do_PATCH = handle_request
+
+
+class GithubServer(http.server.ThreadingHTTPServer):
+    """A GitHUB API stand-in serving the simulated repository"""
+    def __init__(self, repository: str, latency: float = 0.0):
+        super().__init__(("127.0.0.1", 0), GithubHandler)
+        self.repository = repository
+        self.latency = latency
+        self.requests: List = []
+
+    @property
+    def url(self) -> str:
+        """Where to point the GitHUB API URL"""
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def file_content(self, path: str) -> Optional[bytes]:
+        """Content of a file of the repository, None if there is none"""
+        path = os.path.join(self.repository, path)
+        return open(path, "rb").read() if os.path.isfile(path) else None
+
+    def graphql(self) -> Dict[str, Any]:
+        """The context query"""
+        blobs = {}
+        for name, path in (("owners", ".tekton/OWNERS"),
+                           ("tektonyaml", ".tekton/tekton.yaml")):
+            content = self.file_content(path)
+            blobs[name] = None if content is None else {
+                "text": content.decode()
+            }
+        repository = {"nameWithOwner": f"{OWNER}/{REPO}",
+                      "url": f"https://github.com/{OWNER}/{REPO}"}
+        return {"data": {
+            "repository": dict(blobs, pullRequest={
+                "number": PULL_REQUEST_NUMBER,
+                "title": "Simulated pull request",
+                "url": f"https://github.com/{OWNER}/{REPO}/pull/1",
+                "state": "OPEN",
+                "authorAssociation": "OWNER",
+                "author": {"login": OWNER},
+                "labels": {"nodes": []},
+                "headRefOid": SHA,
+                "headRefName": "simulated",
+                "headRepository": repository,
+                "baseRefOid": SHA,
+                "baseRefName": "main",
+                "baseRepository": repository,
+            }),
+            "user": {"organizations": {"nodes": []}},
+        }}
+
+    def check_runs(self) -> List[Dict]:
+        """What has been sent to the check run"""
+        return [data for method, path, data in self.requests
+                if "/check-runs" in path and method in ("POST", "PATCH")]
+
+
+def pull_request_event() -> Dict[str, Any]:
+    """The pull request event payload"""
+    return {
+        "action": "opened",
+        "pull_request": {
+            "number": PULL_REQUEST_NUMBER,
+            "author_association": "OWNER",
+            "head": {"sha": SHA},
+            "user": {"login": OWNER},
+            "base": {"repo": {"full_name": f"{OWNER}/{REPO}"}},
+        },
+        "repository": {
+            "full_name": f"{OWNER}/{REPO}",
+            "html_url": f"https://github.com/{OWNER}/{REPO}",
+            "owner": {"login": OWNER},
+        },
+    }
+
+
+class Simulator:
+    """Run the CLI against the fakes, the state (i.e: the result cache) is
+    kept between the runs of the same simulator"""
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 workdir: str,
+                 latency: Optional[Dict[str, float]] = None,
+                 log_lines: int = 100,
+                 status: str = "Succeeded",
+                 repository: str = ""):
+        self.workdir = workdir
+        self.state = os.path.join(workdir, "state")
+        os.makedirs(self.state, exist_ok=True)
+        if not repository:
+            repository = os.path.join(workdir, "source")
+            write_repository(repository)
+        self.cfg = {
+            "latency": dict(LATENCIES, **(latency or {})),
+            "log_lines": log_lines,
+            "status": status,
+            "repository": repository,
+        }
+        with open(os.path.join(self.state, "simulator.json"),
+                  "w",
+                  encoding="utf-8") as cfgfile:
+            json.dump(self.cfg, cfgfile)
+
+        self.bindir = os.path.join(workdir, "bin")
+        os.makedirs(self.bindir, exist_ok=True)
+        for name in FAKES:
+            path = os.path.join(self.bindir, name)
+            with open(path, "w", encoding="utf-8") as executable:
+                executable.write(
+                    f'#!/bin/sh\nexec "{sys.executable}" "{__file__}" '
+                    f'--fake {name} "$@"\n')
+            os.chmod(path, 0o755)
+        self.runs = 0
+
+    def environ(self, rundir: str, api_url: str) -> Dict[str, str]:
+        """Environment of a run"""
+        env = dict(os.environ)
+        env.update({
+            "PATH": self.bindir + os.pathsep + env.get("PATH", ""),
+            "PYTHONPATH": os.pathsep.join(
+                [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] +
+                ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else [])),
+            STATE_ENV: self.state,
+            "TKC_NAMESPACE": "tekton-asa-code",
+            "TKC_PIPELINERUN": "simulated",
+            "TKAAC_GITHUB_API_URL": api_url,
+            # Always the same like in the pod, the templates names have it
+            "TKAAC_REPOSITORY_DIR": os.path.join(self.workdir, "repository"),
+            "TKAAC_PIPELINERUN_START_DELAY": "0",
+            "TKAAC_BUNDLE_CACHE_DIR": os.path.join(self.workdir, "bundles"),
+            "TKAAC_RENDER_CACHE_DIR": os.path.join(self.workdir, "templates"),
+            "TKAAC_HISTORY_DB": os.path.join(self.workdir, "history.sqlite"),
+            "TKAAC_METRICS_JSON_FILE": os.path.join(rundir, "metrics.json"),
+        })
+        for name in ("TKAAC_METRICS_TEXTFILE", "TKAAC_METRICS_PUSHGATEWAY_URL"):
+            env.pop(name, None)
+        return env
+
+    def run(self, timeout: int = 600) -> Dict[str, Any]:
+        """Do a complete run through the CLI and report what happened and how
+        long it took"""
+        self.runs += 1
+        rundir = os.path.join(self.workdir, f"run-{self.runs}")
+        os.makedirs(rundir)
+        event_file = os.path.join(rundir, "github.json")
+        with open(event_file, "w", encoding="utf-8") as payload:
+            json.dump(pull_request_event(), payload)
+        logs_done = os.path.join(self.state, "logs-done")
+        if os.path.exists(logs_done):
+            os.remove(logs_done)
+
+        server = GithubServer(self.cfg["repository"],
+                              self.cfg["latency"]["github"])
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            start = time.monotonic()
+            process = subprocess.run(
+                [
+                    sys.executable, "-m", "tektonasacode.cli", "-f",
+                    event_file, "simulated-token"
+                ],
+                cwd=rundir,
+                env=self.environ(rundir, server.url),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                timeout=timeout,
+                check=False)
+            wall_clock = time.monotonic() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        timings: Dict[str, Any] = {"phases": {}, "calls": []}
+        if os.path.exists(os.path.join(rundir, "metrics.json")):
+            with open(os.path.join(rundir, "metrics.json"),
+                      encoding="utf-8") as metrics:
+                timings = json.load(metrics)
+        check_runs = server.check_runs()
+        final = [x for x in check_runs if x and x.get("conclusion")]
+        return {
+            "returncode": process.returncode,
+            "wall_clock": round(wall_clock, 6),
+            "phases": timings["phases"],
+            "calls": timings["calls"],
+            "conclusion": final[-1]["conclusion"] if final else None,
+            "title": final[-1]["output"]["title"] if final else None,
+            "check_runs": check_runs,
+            "output": process.stdout.decode(),
+        }
+
+
+def format_reports(reports: List[Dict[str, Any]]) -> str:
+    """The wall clock and phases of every run as a table"""
+    phases: List[str] = []
+    for report in reports:
+        phases += [x for x in report["phases"] if x not in phases]
+    header = ["run", "result", "wall_clock"] + phases
+    rows = [header]
+    for index, report in enumerate(reports):
+        rows.append([
+            str(index + 1),
+            str(report["conclusion"]),
+            f"{report['wall_clock']:.3f}",
+        ] + [
+            f"{report['phases'][x]:.3f}" if x in report["phases"] else "-"
+            for x in phases
+        ])
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    return "\n".join("  ".join(cell.rjust(width)
+                               for cell, width in zip(row, widths))
+                     for row in rows)
+
+
+def main() -> int:
+    """Run the simulations or be one of the fakes"""
+    if len(sys.argv) > 2 and sys.argv[1] == "--fake":
+        return fake(sys.argv[2], sys.argv[3:])
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", maxsplit=1)[0])
+    parser.add_argument("--runs", type=int, default=1,
+                        help="How many runs to do, the result cache is kept "
+                        "between them")
+    parser.add_argument("--log-lines", type=int, default=100,
+                        help="How many log lines the PipelineRun outputs")
+    parser.add_argument("--latency", action="append", default=[],
+                        metavar="NAME=SECONDS",
+                        help=f"Latency of {', '.join(LATENCIES)}")
+    parser.add_argument("--status", default="Succeeded",
+                        choices=("Succeeded", "Failed"))
+    parser.add_argument("--repository",
+                        default="",
+                        help="Check out this directory instead of a "
+                        "simulated repository")
+    parser.add_argument("--json", action="store_true",
+                        help="Output the reports as JSON")
+    parser.add_argument("--verbose", "-v", action="store_true",
+                        help="Show the output of the runs")
+    args = parser.parse_args()
+
+    latency = {}
+    for arg in args.latency:
+        name, _, seconds = arg.partition("=")
+        if name not in LATENCIES:
+            parser.error(f"unknown latency {name}")
+        latency[name] = float(seconds)
+
+    workdir = tempfile.mkdtemp(prefix="tkaac-simulator-")
+    try:
+        simulator = Simulator(workdir, latency, args.log_lines, args.status,
+                              os.path.abspath(args.repository)
+                              if args.repository else "")
+        reports = []
+        for _ in range(args.runs):
+            reports.append(simulator.run())
+            if args.verbose:
+                print(reports[-1]["output"])
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        for report in reports:
+            del report["output"]
+        print(json.dumps(reports, indent=2))
+    else:
+        print(format_reports(reports))
+    return 0 if all(x["returncode"] == 0 for x in reports) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -35,6 +35,7 @@ setup(
     entry_points={
         'console_scripts': [
             'tekton-asa-code=tektonasacode.cli:run',
+            'tekton-asa-code-catalog=tektonasacode.catalog:main',
         ],
     },
     install_requires=requirements,
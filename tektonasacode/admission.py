@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Wait for some room in the cluster before starting a run"""
+import json
+import os
+import random
+import re
+import subprocess
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from tektonasacode import config
+
+TICKET_LABEL = "tekton/asa-code-admission"
+QUANTITY_RE = re.compile(r"^([0-9.]+(?:[eE][-+]?[0-9]+)?)([a-zA-Z]*)$")
+QUANTITY_SUFFIXES = {
+    "": 1,
+    "n": 1e-9,
+    "u": 1e-6,
+    "m": 1e-3,
+    "k": 1e3,
+    "M": 1e6,
+    "G": 1e9,
+    "T": 1e12,
+    "P": 1e15,
+    "E": 1e18,
+    "Ki": 2**10,
+    "Mi": 2**20,
+    "Gi": 2**30,
+    "Ti": 2**40,
+    "Pi": 2**50,
+    "Ei": 2**60,
+}
+
+
+def parse_quantity(quantity) -> float:
+    """Parse a kubernetes quantity like 500m or 2Gi"""
+    match = QUANTITY_RE.match(str(quantity).strip())
+    if not match or match.group(2) not in QUANTITY_SUFFIXES:
+        raise ValueError(f"Invalid quantity {quantity}")
+    return float(match.group(1)) * QUANTITY_SUFFIXES[match.group(2)]
+
+
+def pod_requests(pod: Dict) -> Dict[str, float]:
+    """The cpu and memory a pod asks for, the init containers run one after
+    the other before the containers"""
+    requests = {}
+    for resource in ("cpu", "memory"):
+        def request(container, resource=resource):
+            return parse_quantity(
+                ((container.get("resources") or {}).get("requests")
+                 or {}).get(resource, 0))
+
+        spec = pod.get("spec", {})
+        requests[resource] = max(
+            [sum(request(x) for x in spec.get("containers", []))] +
+            [request(x) for x in spec.get("initContainers", [])])
+    return requests
+
+
+def count_running(namespaces: Dict, pipelineruns: Dict) -> int:
+    """How many of the active CI namespaces have a PipelineRun which has not
+    finished. The namespaces of the finished runs are kept (i.e: to look at a
+    failure) until they get cleaned up, they don't take any room"""
+    active = {
+        x["metadata"]["name"]
+        for x in namespaces.get("items", [])
+        if x.get("status", {}).get("phase", "Active") == "Active"
+    }
+    running = set()
+    for pipelinerun in pipelineruns.get("items", []):
+        namespace = pipelinerun["metadata"].get("namespace")
+        if namespace not in active:
+            continue
+        if not any(x.get("type") == "Succeeded"
+                   and x.get("status") in ("True", "False")
+                   for x in pipelinerun.get("status", {}).get(
+                       "conditions", [])):
+            running.add(namespace)
+    return len(running)
+
+
+class Admission:
+    """Check there is room in the cluster for another run: not too many CI
+    namespaces at the same time and/or enough cpu and memory not requested
+    on the nodes.
+
+    The waiting runs take a ticket, a ConfigMap, and only the oldest one is
+    checked so they don't all see the same room and start together. The
+    ticket is kept until the run has created what takes the room."""
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+    def __init__(self,
+                 utils_cls,
+                 max_namespaces: int = config.ADMISSION_MAX_NAMESPACES,
+                 min_free_cpu: str = config.ADMISSION_MIN_FREE_CPU,
+                 min_free_memory: str = config.ADMISSION_MIN_FREE_MEMORY,
+                 clock=time.monotonic,
+                 sleep=time.sleep,
+                 queue_namespace: Optional[str] = None,
+                 wall_clock=time.time):
+        self.utils = utils_cls
+        self.max_namespaces = max_namespaces
+        self.min_free_cpu = parse_quantity(min_free_cpu)
+        self.min_free_memory = parse_quantity(min_free_memory)
+        self.clock = clock
+        self.sleep = sleep
+        if queue_namespace is None:
+            queue_namespace = config.ADMISSION_QUEUE_NAMESPACE or os.environ.get(
+                "TKC_NAMESPACE", "")
+        self.queue_namespace = queue_namespace
+        self.wall_clock = wall_clock
+
+    @property
+    def enabled(self) -> bool:
+        """If we check anything"""
+        return bool(self.max_namespaces or self.min_free_cpu
+                    or self.min_free_memory)
+
+    def running_namespaces(self) -> int:
+        """How many CI namespaces have a run going on"""
+        namespaces = self.utils.kubectl_get(
+            "namespace", labels={"tekton.dev/generated-by": "tekton-asa-code"})
+        pipelineruns = self.utils.execute(
+            "kubectl get pipelineruns --all-namespaces -o json",
+            check_error="Cannot get the pipelineruns")
+        return count_running(namespaces,
+                             json.loads(pipelineruns.stdout.decode()))
+
+    def headroom(self) -> Tuple[float, float]:
+        """The cpu and memory allocatable on the ready nodes which is not
+        requested by the pods"""
+        free = {"cpu": 0.0, "memory": 0.0}
+        for node in self.utils.kubectl_get("node").get("items", []):
+            if node.get("spec", {}).get("unschedulable"):
+                continue
+            if not any(x["type"] == "Ready" and x["status"] == "True"
+                       for x in node.get("status", {}).get("conditions", [])):
+                continue
+            allocatable = node["status"].get("allocatable", {})
+            for resource in free:
+                free[resource] += parse_quantity(allocatable.get(resource, 0))
+
+        pods = self.utils.execute(
+            "kubectl get pods --all-namespaces -o json "
+            "--field-selector=status.phase!=Succeeded,status.phase!=Failed",
+            check_error="Cannot get the pods")
+        # The pending pods are counted too, they will need the room as well
+        for pod in json.loads(pods.stdout.decode()).get("items", []):
+            for resource, requested in pod_requests(pod).items():
+                free[resource] -= requested
+        return free["cpu"], free["memory"]
+
+    def check(self) -> str:
+        """Why we cannot start a run now, empty if we can"""
+        if self.max_namespaces:
+            running = self.running_namespaces()
+            if running >= self.max_namespaces:
+                return (f"{running} CI namespaces are running, the maximum is "
+                        f"{self.max_namespaces}")
+        if self.min_free_cpu or self.min_free_memory:
+            cpu, memory = self.headroom()
+            if cpu < self.min_free_cpu:
+                return (f"Only {cpu:.2f} cpu are free in the cluster, we need "
+                        f"{self.min_free_cpu:.2f}")
+            if memory < self.min_free_memory:
+                return (f"Only {memory / 2**30:.2f}Gi of memory are free in "
+                        f"the cluster, we need "
+                        f"{self.min_free_memory / 2**30:.2f}Gi")
+        return ""
+
+    def _namespace_str(self) -> str:
+        return f"-n {self.queue_namespace}" if self.queue_namespace else ""
+
+    def enqueue(self, ticket: str) -> bool:
+        """Take a ticket in the queue, False if we cannot"""
+        try:
+            self.utils.execute(
+                f"kubectl create configmap {ticket} {self._namespace_str()} "
+                f"--from-literal=heartbeat={self.wall_clock():.0f} && "
+                f"kubectl label configmap {ticket} {self._namespace_str()} "
+                f"{TICKET_LABEL}=queued",
+                check_error=f"Cannot queue {ticket}")
+        except subprocess.CalledProcessError:
+            return False
+        return True
+
+    def heartbeat(self, ticket: str):
+        """Show we are still waiting"""
+        patch = json.dumps({"data": {"heartbeat": f"{self.wall_clock():.0f}"}})
+        self.utils.execute(
+            f"kubectl patch configmap {ticket} {self._namespace_str()} "
+            f"--type merge -p '{patch}'",
+            check_error=f"Cannot refresh {ticket}")
+
+    def ahead(self, ticket: str) -> int:
+        """How many live tickets have been taken before ours"""
+        tickets = []
+        for item in self.utils.kubectl_get("configmap",
+                                           namespace=self.queue_namespace,
+                                           labels={
+                                               TICKET_LABEL: "queued"
+                                           }).get("items", []):
+            heartbeat = float((item.get("data") or {}).get("heartbeat", 0))
+            name = item["metadata"]["name"]
+            if (name != ticket and self.wall_clock() - heartbeat >
+                    config.ADMISSION_TICKET_TTL):
+                continue
+            tickets.append((item["metadata"].get("creationTimestamp",
+                                                 ""), name))
+        tickets.sort()
+        names = [name for _, name in tickets]
+        return names.index(ticket) if ticket in names else 0
+
+    def release(self, ticket: str):
+        """Give our ticket back, letting the next run in"""
+        if not ticket or not self.enabled:
+            return
+        try:
+            self.utils.execute(
+                f"kubectl delete configmap {ticket} {self._namespace_str()} "
+                "--ignore-not-found",
+                check_error=f"Cannot release {ticket}")
+        except subprocess.CalledProcessError:
+            pass
+
+    def wait(self,
+             on_queued: Callable[[str], None],
+             timeout: float = config.ADMISSION_TIMEOUT,
+             ticket: str = "") -> bool:
+        """Wait until we can start a run, backing off between the checks.
+        on_queued gets called with the reason every time it changes, return
+        False if we are still not allowed after timeout seconds.
+
+        With a ticket we wait for our turn in the queue, it has to be
+        released once the run has taken its room"""
+        if not self.enabled:
+            return True
+        if ticket and not self.enqueue(ticket):
+            print("⚠️ Cannot queue the run, checking the room without "
+                  "waiting for our turn")
+            ticket = ""
+        deadline = self.clock() + timeout
+        backoff = config.ADMISSION_BACKOFF
+        reason = ""
+        while True:
+            try:
+                ahead = 0
+                if ticket:
+                    self.heartbeat(ticket)
+                    ahead = self.ahead(ticket)
+                new_reason = (f"Number {ahead + 1} in the queue of the runs"
+                              if ahead else self.check())
+            except (subprocess.CalledProcessError, ValueError, KeyError) as error:
+                # Don't hold the runs when we cannot tell
+                print(f"⚠️ Cannot check the room in the cluster: {error}")
+                return True
+            if not new_reason:
+                return True
+            if new_reason != reason:
+                reason = new_reason
+                print(f"⏳ Queued: {reason}")
+                on_queued(reason)
+            if self.clock() >= deadline:
+                self.release(ticket)
+                return False
+            # The jitter avoids the queued runs all checking at the same time
+            self.sleep(
+                min(backoff * random.uniform(0.8, 1.2),
+                    max(deadline - self.clock(), 0)))
+            backoff = min(backoff * 2, config.ADMISSION_MAX_BACKOFF)
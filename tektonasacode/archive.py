@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Archive the logs and the PipelineRun of a run so we don't have to keep its
+namespace around to look at them"""
+import datetime
+import gzip
+import hashlib
+import hmac
+import html
+import http.client
+import json
+import os
+import urllib.parse
+from typing import Any, Dict, List, Optional
+
+from tektonasacode import config
+
+
+class ArchiveException(Exception):
+    """When we cannot store the archive"""
+
+
+class LocalStore:
+    """Store the archives in a directory, i.e: a volume served by a web
+    server"""
+    def __init__(self, directory: str, public_url: str = ""):
+        self.directory = directory
+        self.public_url = public_url
+
+    def put(self, key: str, data: bytes, content_type: str):  # pylint: disable=unused-argument
+        """Store some data"""
+        path = os.path.join(self.directory, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "wb") as fp:
+            fp.write(data)
+        os.replace(path + ".tmp", path)
+
+    def url(self, key: str) -> str:
+        """Where people can get it"""
+        if self.public_url:
+            return f"{self.public_url.rstrip('/')}/{key}"
+        return os.path.join(self.directory, key)
+
+
+def sigv4_headers(method: str, host: str, path: str, headers: Dict[str, str],
+                  payload_hash: str, access_key: str, secret_key: str,
+                  region: str, now: datetime.datetime) -> Dict[str, str]:
+    """Sign a S3 request with AWS signature version 4 and return the headers
+    to send"""
+    # pylint: disable=too-many-arguments,too-many-locals
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    headers = dict(headers, **{
+        "host": host,
+        "x-amz-date": amz_date,
+        "x-amz-content-sha256": payload_hash,
+    })
+    lowered = {key.lower(): str(value).strip() for key, value in headers.items()}
+    signed_headers = ";".join(sorted(lowered))
+    canonical_request = "\n".join([
+        method,
+        urllib.parse.quote(path, safe="/~"),
+        "",
+        "".join(f"{key}:{lowered[key]}\n" for key in sorted(lowered)),
+        signed_headers,
+        payload_hash,
+    ])
+    scope = f"{now.strftime('%Y%m%d')}/{region}/s3/aws4_request"
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256",
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode()).hexdigest(),
+    ])
+    key = ("AWS4" + secret_key).encode()
+    for part in (now.strftime('%Y%m%d'), region, "s3", "aws4_request"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    signature = hmac.new(key, string_to_sign.encode(),
+                         hashlib.sha256).hexdigest()
+    headers["Authorization"] = (
+        f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+        f"SignedHeaders={signed_headers}, Signature={signature}")
+    return headers
+
+
+class S3Store:
+    """Store the archives in a S3 compatible bucket (minio, ceph, AWS...)
+    with path style requests"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 endpoint: str,
+                 bucket: str,
+                 prefix: str = "",
+                 access_key: str = config.ARCHIVE_ACCESS_KEY,
+                 secret_key: str = config.ARCHIVE_SECRET_KEY,
+                 region: str = config.ARCHIVE_REGION,
+                 public_url: str = "",
+                 clock=datetime.datetime.utcnow):
+        self.endpoint = urllib.parse.urlparse(endpoint)
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.public_url = public_url
+        self.clock = clock
+
+    def path(self, key: str) -> str:
+        """Path of the key in the bucket"""
+        return "/".join(x for x in (self.endpoint.path.rstrip("/"),
+                                    self.bucket, self.prefix, key) if x)
+
+    def put(self, key: str, data: bytes, content_type: str):
+        """PUT an object"""
+        path = "/" + self.path(key).lstrip("/")
+        headers = {"Content-Type": content_type}
+        if self.access_key:
+            headers = sigv4_headers("PUT", self.endpoint.netloc, path,
+                                    headers,
+                                    hashlib.sha256(data).hexdigest(),
+                                    self.access_key, self.secret_key,
+                                    self.region, self.clock())
+        if self.endpoint.scheme == "http":
+            conn: http.client.HTTPConnection = http.client.HTTPConnection(
+                self.endpoint.netloc, timeout=60)
+        else:
+            conn = http.client.HTTPSConnection(self.endpoint.netloc,
+                                               timeout=60)
+        conn.request("PUT", path, body=data, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        if response.status >= 300:
+            raise ArchiveException(
+                f"Cannot PUT {path}: {response.status} "
+                f"{body.decode(errors='replace')[:500]}")
+
+    def url(self, key: str) -> str:
+        """Where people can get it"""
+        if self.public_url:
+            return "/".join(x for x in (self.public_url.rstrip("/"),
+                                        self.prefix, key) if x)
+        return (f"{self.endpoint.scheme}://{self.endpoint.netloc}/"
+                f"{self.path(key).lstrip('/')}")
+
+
+def store_from_url(url: str, public_url: str = config.ARCHIVE_PUBLIC_URL):
+    """Get the store for a s3://bucket/prefix URL, which uses the
+    ARCHIVE_S3_ENDPOINT, or for a local directory"""
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme == "s3":
+        return S3Store(config.ARCHIVE_S3_ENDPOINT,
+                       parsed.netloc,
+                       parsed.path,
+                       public_url=public_url)
+    if parsed.scheme in ("", "file"):
+        return LocalStore(parsed.path, public_url=public_url)
+    raise ArchiveException(f"Unknown archive store {url}")
+
+
+def chunks(filename: str, chunk_size: int):
+    """Read a file by chunks of about chunk_size bytes, only cut at the end of
+    a line"""
+    with open(filename, "rb") as fp:
+        chunk: List[bytes] = []
+        size = 0
+        for line in fp:
+            chunk.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                yield b"".join(chunk)
+                chunk, size = [], 0
+        if chunk:
+            yield b"".join(chunk)
+
+
+class Archiver:
+    """Write the logs as gzipped chunks and the documents as gzipped JSON,
+    with an index.json describing them and an index.html to browse them"""
+    def __init__(self, store, chunk_size: int = config.ARCHIVE_CHUNK_SIZE):
+        self.store = store
+        self.chunk_size = chunk_size
+
+    def archive(self, name: str, log_file: str,
+                documents: Optional[Dict[str, Any]] = None) -> str:
+        """Archive a run under name and get the URL of its index"""
+        files = []
+        line = 1
+        for index, chunk in enumerate(chunks(log_file, self.chunk_size)):
+            key = f"logs-{index:04d}.log.gz"
+            self.store.put(f"{name}/{key}", gzip.compress(chunk),
+                           "application/gzip")
+            lines = chunk.count(b"\n")
+            files.append({
+                "name": key,
+                "size": len(chunk),
+                "first_line": line,
+                "last_line": line + lines - 1,
+            })
+            line += lines
+        for document_name, document in (documents or {}).items():
+            data = json.dumps(document, indent=2).encode()
+            key = f"{document_name}.json.gz"
+            self.store.put(f"{name}/{key}", gzip.compress(data),
+                           "application/gzip")
+            files.append({"name": key, "size": len(data)})
+
+        self.store.put(f"{name}/index.json",
+                       json.dumps({"name": name, "files": files}).encode(),
+                       "application/json")
+        links = "\n".join(
+            f'<li><a href="{html.escape(x["name"])}">{html.escape(x["name"])}'
+            f'</a> ({x["size"]} bytes'
+            + (f', lines {x["first_line"]}-{x["last_line"]}'
+               if "first_line" in x else "") + ")</li>" for x in files)
+        self.store.put(
+            f"{name}/index.html",
+            f"<html><body><h1>{html.escape(name)}</h1><ul>\n{links}\n"
+            "</ul></body></html>\n".encode(), "text/html")
+        return self.store.url(f"{name}/index.html")
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Bundle templates in memory with tektonbundle and cache the result"""
+import hashlib
+import os
+import re
+import tempfile
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from tektonasacode import config, render, yamlutil
+
+# Values which can be put back in the bundle after it has been made, they
+# stay a plain YAML string whatever is around them (i.e: a revision).
+DEFERRABLE_RE = re.compile(r"[A-Za-z0-9_./-]+")
+SENTINEL_RE = re.compile(r"tkaacslot[0-9a-f]{16}")
+
+
+def sentinel(slot: str) -> str:
+    """Placeholder put in the bundle instead of the value of a slot"""
+    return "tkaacslot" + hashlib.sha1(slot.encode()).hexdigest()[:16]
+
+
+def split_parameters(
+        templates: Dict[str, str],
+        resolve: Callable[[str], str]) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """Split the values of the placeholders of the templates between the ones
+    which can change the bundle, rendered before bundling, and the ones only
+    carried over which are put back after"""
+    eager: Dict[str, str] = {}
+    deferred: Dict[str, str] = {}
+    for content in templates.values():
+        for slot in render.PLACEHOLDER_RE.findall(content):
+            value = resolve(slot)
+            if DEFERRABLE_RE.fullmatch(value) and isinstance(
+                    yamlutil.load(value), str):
+                deferred[slot] = value
+            else:
+                eager[slot] = value
+    return eager, deferred
+
+
+def put_back(thebundle: str, deferred: Dict[str, str]) -> str:
+    """Replace the sentinels of a bundle by the values of their slots"""
+    values = {sentinel(slot): value for slot, value in deferred.items()}
+    return SENTINEL_RE.sub(lambda match: values.get(match.group(0),
+                                                    match.group(0)),
+                           thebundle)
+
+
+def parse(templates: Dict[str, str],
+          parameters: Dict[str, str],
+          skip_inlining: List[str] = None) -> Dict:
+    """Run tektonbundle.parse on a dict of filename=>content, it only knows
+    about files"""
+    # Only needed when bundling, which is not the default, and slow to import.
+    from tektonbundle import tektonbundle  # pylint: disable=import-outside-toplevel
+
+    with tempfile.TemporaryDirectory() as directory:
+        files = []
+        for index, content in enumerate(templates.values()):
+            path = os.path.join(directory, f"{index}.yaml")
+            with open(path, "w", encoding="utf-8") as tmpfile:
+                tmpfile.write(content)
+            files.append(path)
+        return tektonbundle.parse(files, parameters, skip_inlining or [])
+
+
+class BundleCache:
+    """Cache bundles on disk keyed by the hash of the templates"""
+    def __init__(self, directory: str = config.BUNDLE_CACHE_DIR):
+        self.directory = directory
+
+    @staticmethod
+    def key(templates: Dict[str, str], eager: Dict[str, str],
+            deferred: Iterable[str]) -> str:
+        """Hash the templates before they are rendered, in the order they are
+        bundled, with the values rendered before bundling and the slots put
+        back after"""
+        digest = hashlib.sha256()
+        for content in templates.values():
+            digest.update(content.encode())
+            digest.update(b"\0")
+        for slot in sorted(eager):
+            digest.update(f"{slot}={eager[slot]}".encode())
+            digest.update(b"\0")
+        for slot in sorted(deferred):
+            digest.update(slot.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> str:
+        """Get a bundle from cache or an empty string if we don't have it"""
+        path = os.path.join(self.directory, f"{key}.yaml")
+        if not os.path.exists(path):
+            return ""
+        with open(path, encoding="utf-8") as cached:
+            return cached.read()
+
+    def set(self, key: str, content: str):
+        """Store a bundle in the cache"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmpfile = tempfile.NamedTemporaryFile("w",
+                                                  dir=self.directory,
+                                                  delete=False)
+            with tmpfile:
+                tmpfile.write(content)
+            os.replace(tmpfile.name,
+                       os.path.join(self.directory, f"{key}.yaml"))
+        except OSError as error:
+            print(f"⚠️ Cannot cache bundle in {self.directory}: {error}")
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""A local snapshot of the tekton catalog, so we don't have to ask GitHUB for
+the tasks"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import tarfile
+import tempfile
+import urllib.request
+from typing import Any, Dict, Optional, Tuple
+
+from tektonasacode import config
+from tektonasacode.github import parse_version
+
+INDEX = "index.json"
+# task/NAME/VERSION/NAME.yaml in the catalog
+TASK_PATH_RE = re.compile(r"^task/(\w[\w.-]*)/(\w[\w.-]*)/\1\.yaml$")
+
+
+class CatalogException(Exception):
+    """When the snapshot cannot be used"""
+
+
+def task_path(name: str, version: str) -> str:
+    """Path of a task in the catalog"""
+    return f"task/{name}/{version}/{name}.yaml"
+
+
+def is_tarball(path: str) -> bool:
+    """If the snapshot is a tarball rather than a directory"""
+    return path.endswith((".tar", ".tar.gz", ".tgz"))
+
+
+class CatalogSnapshot:
+    """A directory or a tarball with the tasks as they are in the catalog and
+    an index.json of their versions, read on the first lookup"""
+    def __init__(self, path: str):
+        self.path = path
+        self._index: Optional[Dict[str, Any]] = None
+        self._tarball: Optional[tarfile.TarFile] = None
+        self._members: Dict[str, tarfile.TarInfo] = {}
+
+    def read(self, path: str) -> Optional[bytes]:
+        """Read a file of the snapshot, None if it isn't there"""
+        if not is_tarball(self.path):
+            try:
+                with open(os.path.join(self.path, path), "rb") as fp:
+                    return fp.read()
+            except FileNotFoundError:
+                return None
+        if self._tarball is None:
+            self._tarball = tarfile.open(self.path)
+            self._members = {
+                os.path.normpath(member.name): member
+                for member in self._tarball.getmembers() if member.isfile()
+            }
+        member = self._members.get(path)
+        if member is None:
+            return None
+        fp = self._tarball.extractfile(member)
+        return fp.read() if fp else None
+
+    @property
+    def index(self) -> Dict[str, Any]:
+        """The versions of every task"""
+        if self._index is None:
+            try:
+                content = self.read(INDEX)
+            except (OSError, tarfile.TarError) as error:
+                raise CatalogException(
+                    f"Cannot read the catalog snapshot {self.path}: {error}"
+                ) from error
+            if content is None:
+                raise CatalogException(f"No {INDEX} in {self.path}")
+            try:
+                index = json.loads(content)
+                if not isinstance(index.get("tasks"), dict):
+                    raise ValueError("no tasks in it")
+            except (ValueError, AttributeError) as error:
+                raise CatalogException(
+                    f"Invalid {INDEX} in {self.path}: {error}") from error
+            self._index = index
+        return self._index
+
+    def latest_version(self, name: str) -> Optional[str]:
+        """The latest version of a task, None if we don't have it"""
+        task = self.index["tasks"].get(name)
+        return task["latest"] if task else None
+
+    def get(self, name: str, version: str) -> Optional[str]:
+        """The content of a task, None if we don't have it"""
+        task = self.index["tasks"].get(name)
+        if not task or version not in task["versions"]:
+            return None
+        try:
+            content = self.read(task_path(name, version))
+            return content.decode() if content is not None else None
+        except (OSError, tarfile.TarError, UnicodeDecodeError) as error:
+            raise CatalogException(
+                f"Cannot read {name}:{version} from the catalog snapshot "
+                f"{self.path}: {error}") from error
+
+    def resolve(self, task: str) -> Optional[Tuple[str, str, str]]:
+        """Get the name, version and content of a task as written in
+        tekton.yaml, i.e: name, name:latest or name:0.2. Raise a
+        CatalogException when the snapshot cannot be read"""
+        name, _, version = task.partition(":")
+        if not version or version == "latest":
+            version = self.latest_version(name) or ""
+        content = self.get(name, version) if version else None
+        if content is None:
+            return None
+        return name, version, content
+
+
+def build_index(tasks: Dict[str, list], repository: str,
+                ref: str) -> Dict[str, Any]:
+    """The index of the versions of the tasks"""
+    return {
+        "repository": repository,
+        "ref": ref,
+        "tasks": {
+            name: {
+                "latest": max(versions, key=parse_version),
+                "versions": sorted(versions, key=parse_version),
+            }
+            for name, versions in sorted(tasks.items())
+        },
+    }
+
+
+def catalog_files(source: str):
+    """Get the path in the catalog and the content of the tasks of a catalog
+    checkout or tarball, like the ones from GitHUB which have everything in
+    a top directory"""
+    if os.path.isdir(source):
+        for root, _, files in os.walk(source):
+            for filename in files:
+                full = os.path.join(root, filename)
+                path = os.path.relpath(full, source).replace(os.sep, "/")
+                if TASK_PATH_RE.match(path):
+                    with open(full, "rb") as fp:
+                        yield path, fp.read()
+        return
+
+    with tarfile.open(source) as tarball:
+        for member in tarball:
+            if not member.isfile():
+                continue
+            path = os.path.normpath(member.name)
+            if not TASK_PATH_RE.match(path):
+                path = path.partition("/")[2]
+                if not TASK_PATH_RE.match(path):
+                    continue
+            fp = tarball.extractfile(member)
+            if fp:
+                yield path, fp.read()
+
+
+def build(source: str, output: str, repository: str, ref: str) -> int:
+    """Build a snapshot from a catalog checkout or tarball, return how many
+    tasks it has"""
+    tasks: Dict[str, list] = {}
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix="tkaac-catalog-",
+                               dir=os.path.dirname(os.path.abspath(output)))
+    try:
+        tmpdir = os.path.join(workdir, "catalog")
+        for path, content in catalog_files(source):
+            name, version = TASK_PATH_RE.match(path).groups()  # type: ignore
+            tasks.setdefault(name, []).append(version)
+            os.makedirs(os.path.join(tmpdir, os.path.dirname(path)),
+                        exist_ok=True)
+            with open(os.path.join(tmpdir, path), "wb") as fp:
+                fp.write(content)
+        if not tasks:
+            raise CatalogException(f"No tasks found in {source}")
+        index = json.dumps(build_index(tasks, repository, ref),
+                           indent=2).encode()
+        with open(os.path.join(tmpdir, INDEX), "wb") as fp:
+            fp.write(index)
+
+        # Replace the previous snapshot only once the new one is complete
+        if is_tarball(output):
+            tmpfile = os.path.join(workdir, "catalog.tar")
+            with tarfile.open(tmpfile,
+                              "w:gz" if output.endswith("gz") else "w") as out:
+                out.add(os.path.join(tmpdir, INDEX), INDEX)
+                out.add(os.path.join(tmpdir, "task"), "task")
+            os.replace(tmpfile, output)
+        else:
+            previous = os.path.join(workdir, "previous")
+            if os.path.exists(output):
+                os.rename(output, previous)
+            os.rename(tmpdir, output)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return len(tasks)
+
+
+def download(repository: str, ref: str, token: str = "") -> str:
+    """Download a tarball of a repository from GitHUB"""
+    request = urllib.request.Request(
+        f"{config.GITHUB_API_URL}/repos/{repository}/tarball/{ref}",
+        headers={"Authorization": f"Bearer {token}"} if token else {})
+    tmpfile = tempfile.NamedTemporaryFile(suffix=".tar.gz", delete=False)
+    with tmpfile, urllib.request.urlopen(request, timeout=300) as response:
+        shutil.copyfileobj(response, tmpfile)
+    return tmpfile.name
+
+
+def main() -> int:
+    """Refresh a snapshot of the catalog"""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("output",
+                        nargs="?",
+                        default=config.CATALOG_SNAPSHOT,
+                        help="Directory or tarball (.tar.gz) to write the "
+                        "snapshot to")
+    parser.add_argument("--repository",
+                        default=config.TEKTON_CATALOG_REPOSITORY,
+                        help="The catalog repository on GitHUB")
+    parser.add_argument("--ref", default="main", help="Branch or tag")
+    parser.add_argument("--source",
+                        help="Use this catalog checkout or tarball instead "
+                        "of downloading it")
+    parser.add_argument("--token",
+                        default=os.environ.get("GITHUB_TOKEN", ""),
+                        help="GitHUB token to download the catalog with")
+    args = parser.parse_args()
+    if not args.output:
+        parser.error("need a directory or a tarball to write the snapshot to")
+
+    source = args.source or download(args.repository, args.ref, args.token)
+    try:
+        count = build(source, args.output, args.repository, args.ref)
+    except (CatalogException, OSError, tarfile.TarError) as error:
+        print(f"❌ {error}", file=sys.stderr)
+        return 1
+    finally:
+        if not args.source:
+            os.remove(source)
+    print(f"📚 {count} tasks from {args.repository}@{args.ref} in "
+          f"{args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
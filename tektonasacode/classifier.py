@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Classify the lines of the logs with the patterns of the logs section of
+tekton.yaml"""
+import re
+from typing import Dict, List, Optional, Pattern
+
+from tektonasacode import config
+
+# When a line matches the patterns of several categories it goes in the first
+# one, the ignored lines are not reported at all.
+CATEGORIES = ("ignore", "tests", "errors", "warnings")
+# The sections of the report in their order
+SECTIONS = {
+    "tests": "Tests summary",
+    "errors": "Errors detected",
+    "warnings": "Warnings detected",
+}
+DEFAULT_PATTERNS = {"errors": ["error", "failed", "fail"]}
+# Patterns without any of these are literal strings
+REGEX_CHARS = set(".^$*+?{}[]\\|()")
+
+
+class ClassifierException(Exception):
+    """When the patterns of the logs section are not valid"""
+
+
+class LogClassifier:
+    """Find the lines of the logs matching the patterns of every category.
+
+    All the patterns are combined in a single regexp without any group to
+    find the lines where one of them matches, so adding patterns doesn't add
+    passes on the logs. Only those lines get classified. When the patterns
+    are all literal strings we look for them in the lowercased logs, which is
+    a lot faster than a case insensitive regexp. The patterns are case
+    insensitive, the errors ones replace the default ones."""
+    def __init__(self, patterns: Optional[Dict[str, List[str]]] = None):
+        if patterns is not None and not isinstance(patterns, dict):
+            raise ClassifierException(
+                "The logs section should have the patterns of every category")
+        patterns = dict(DEFAULT_PATTERNS, **(patterns or {}))
+        unknown = sorted(set(patterns) - set(CATEGORIES))
+        if unknown:
+            raise ClassifierException(
+                f"Unknown categories in the logs section: {', '.join(unknown)}"
+                f", we know about {', '.join(CATEGORIES)}")
+
+        self.groups: Dict[str, str] = {}
+        self.highlights: Dict[str, Pattern] = {}
+        alternatives = []
+        scans = []
+        literals = []
+        for category in CATEGORIES:
+            category_patterns = patterns.get(category) or []
+            if not isinstance(category_patterns, list):
+                category_patterns = [category_patterns]
+            # The longest first so they win when they start at the same place
+            category_patterns = sorted((str(x) for x in category_patterns),
+                                       key=len,
+                                       reverse=True)
+            for pattern in category_patterns:
+                try:
+                    re.compile(pattern)
+                except re.error as error:
+                    raise ClassifierException(
+                        f"Invalid {category} pattern '{pattern}' in the logs "
+                        f"section: {error}") from error
+                group = f"_{category}{len(self.groups)}"
+                self.groups[group] = category
+                alternatives.append(f"(?P<{group}>{pattern})")
+                scans.append(f"(?:{pattern})")
+                if pattern and not REGEX_CHARS & set(pattern):
+                    literals.append(re.escape(pattern.lower()))
+            if category_patterns:
+                self.highlights[category] = re.compile(
+                    "|".join(f"(?:{x})" for x in category_patterns),
+                    re.IGNORECASE)
+        try:
+            self.regex = re.compile("|".join(alternatives),
+                                    re.IGNORECASE | re.MULTILINE)
+            self.scan = re.compile("|".join(scans),
+                                   re.IGNORECASE | re.MULTILINE)
+        except re.error as error:
+            raise ClassifierException(
+                f"Cannot combine the patterns of the logs section: {error}"
+            ) from error
+        self.literal_scan: Optional[Pattern] = None
+        if alternatives and len(literals) == len(alternatives):
+            self.literal_scan = re.compile("|".join(literals))
+        self.empty = not alternatives
+
+    def classify(self, text: str) -> Dict[str, List[str]]:
+        """Get the lines of every category (but ignore) in a single pass"""
+        found: Dict[str, List[str]] = {x: [] for x in SECTIONS}
+        if self.empty:
+            return found
+        scan, haystack = self.scan, text
+        if self.literal_scan:
+            lowered = text.lower()
+            # Some unicode characters are longer once lowercased
+            if len(lowered) == len(text):
+                scan, haystack = self.literal_scan, lowered
+        pos = 0
+        while True:
+            match = scan.search(haystack, pos)
+            if not match:
+                break
+            start = haystack.rfind("\n", 0, match.start()) + 1
+            end = haystack.find("\n", match.start())
+            if end == -1:
+                end = len(haystack)
+            categories = {
+                self.groups[x.lastgroup or ""]
+                for x in self.regex.finditer(text, start, end)
+            }
+            category = next((x for x in CATEGORIES if x in categories),
+                            "ignore")
+            if category != "ignore":
+                found[category].append(text[start:end].rstrip("\r"))
+            pos = end + 1
+        return found
+
+    def section(self, category: str, lines: List[str],
+                max_lines: int = 0) -> str:
+        """Show the lines of a category with what has matched in bold"""
+        max_lines = max_lines or config.MAX_REPORTED_ERRORS
+        ret = ""
+        for line in lines[:max_lines]:
+            line = self.highlights[category].sub(
+                lambda m: f"**{m.group(0)}**" if m.group(0) else "", line)
+            ret += f" * *{line}*\n"
+        if len(lines) > max_lines:
+            ret += f" * *... and {len(lines) - max_lines} more*\n"
+
+        if not ret:
+            return ""
+        return f"""
+    <details>
+        <summary>{SECTIONS[category]}</summary>
+        <pre>{ret}</pre>
+    </details>
+    """
+
+    def report(self, found: Dict[str, List[str]]) -> str:
+        """All the sections of the report"""
+        return "".join(
+            self.section(category, found[category]) for category in SECTIONS)
@@ -17,19 +17,57 @@
 import argparse
 import sys
 
-from tektonasacode import main
+from tektonasacode import config, event, github_app, main
 
 
 def run():
     """Console script for tektonasacode."""
     parser = argparse.ArgumentParser()
-    parser.add_argument('github_json', help="The full json from Github")
+    parser.add_argument('github_json',
+                        nargs='?',
+                        help="The full json from Github")
     parser.add_argument('github_token',
+                        nargs='?',
                         help="The Github token to do operation with")
+    parser.add_argument(
+        '--github-json-file',
+        '-f',
+        help="Read the json from Github from this file, from the github.json "
+        "file of this workspace directory or from stdin if it's -")
+    parser.add_argument(
+        '--application-id',
+        help="Get the Github token as this Github application instead")
+    parser.add_argument('--installation-id',
+                        help="The Github application installation id")
+    parser.add_argument('--private-key',
+                        default="/workspace/secrets/private.key",
+                        help="The Github application private key")
 
     args = parser.parse_args()
-    tkaac = main.TektonAsaCode(args.github_token, args.github_json)
-    tkaac.runwrap()
+    if args.github_json_file:
+        # Only the token has been passed as positional argument
+        github_token = args.github_token or args.github_json
+        github_json = event.read(args.github_json_file)
+    else:
+        github_token, github_json = args.github_token, args.github_json
+    if args.application_id:
+        if not args.installation_id:
+            parser.error("need an installation id with an application id")
+        github_token = github_app.GithubApp(
+            args.application_id,
+            args.private_key).installation_token(args.installation_id)
+    if not github_token or not github_json:
+        parser.error("need the json from Github and a Github token")
+
+    tkaac = main.TektonAsaCode(github_token, github_json)
+    if not config.PROFILE:
+        tkaac.runwrap()
+        return
+
+    from tektonasacode import profiling  # pylint: disable=import-outside-toplevel
+    with profiling.Profiler(config.PROFILE) as profiler:
+        tkaac.profile_url = profiler.url
+        tkaac.runwrap()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Spread the runs over several clusters"""
+import contextlib
+import hashlib
+import json
+import math
+import os
+import subprocess
+import tempfile
+from typing import Iterator, List, Optional, Tuple
+
+from tektonasacode import admission, config
+
+
+def parse_clusters(value: str) -> List[Tuple[str, float]]:
+    """Parse context=weight,context... the weight is 1 by default"""
+    clusters = []
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition("=")
+        clusters.append((name.strip(), float(weight) if weight else 1.0))
+    return clusters
+
+
+def rendezvous_score(key: str, name: str, weight: float) -> float:
+    """Weighted rendezvous hashing score, the cluster with the highest score
+    for a key gets it. Adding or removing a cluster only moves the keys of
+    that cluster"""
+    digest = hashlib.sha256(f"{key}\0{name}".encode()).digest()
+    # A number in ]0, 1[
+    unit = (int.from_bytes(digest[:8], "big") + 1) / (2**64 + 2)
+    return -weight / math.log(unit)
+
+
+class Cluster:
+    """A context of the kubeconfig we run the CI on"""
+    def __init__(self, name: str, weight: float = 1.0):
+        self.name = name
+        self.weight = weight
+
+    def __repr__(self):
+        return f"Cluster({self.name!r}, {self.weight})"
+
+    def kubectl(self, args: str) -> str:
+        """Run kubectl on that context of the kubeconfig"""
+        return subprocess.run(f"kubectl --context={self.name} {args}",
+                              shell=True,
+                              check=True,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE).stdout.decode()
+
+    def write_kubeconfig(self, directory: str) -> str:
+        """Write a kubeconfig with only this context in it in directory, so
+        kubectl, tkn and our kubernetes client all talk to this cluster. It
+        has the credentials inline, the directory has to go away after the
+        run"""
+        path = os.path.join(directory,
+                            f"{self.name.replace('/', '_')}.kubeconfig")
+        content = self.kubectl("config view --minify --flatten")
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as kubeconfig:
+            kubeconfig.write(content)
+        return path
+
+    @contextlib.contextmanager
+    def activate(self) -> Iterator["Cluster"]:
+        """Run everything in the block on this cluster"""
+        previous = os.environ.get("KUBECONFIG")
+        with tempfile.TemporaryDirectory(prefix="tkaac-kubeconfig-") as tmpdir:
+            os.environ["KUBECONFIG"] = self.write_kubeconfig(tmpdir)
+            try:
+                yield self
+            finally:
+                if previous is None:
+                    del os.environ["KUBECONFIG"]
+                else:
+                    os.environ["KUBECONFIG"] = previous
+
+    def running_namespaces(self) -> int:
+        """How many CI namespaces have a run going on the cluster"""
+        namespaces = json.loads(
+            self.kubectl("get namespace -o json "
+                         "-l tekton.dev/generated-by=tekton-asa-code"))
+        pipelineruns = json.loads(
+            self.kubectl("get pipelineruns --all-namespaces -o json"))
+        return admission.count_running(namespaces, pipelineruns)
+
+
+class ClusterSelector:
+    """Choose the cluster of a run, sticky: the same pull request always goes
+    to the same cluster (by weighted rendezvous hashing) so it finds its
+    images and caches again. load: the cluster with the less CI namespaces
+    for its weight"""
+    def __init__(self,
+                 clusters: Optional[List[Tuple[str, float]]] = None,
+                 mode: str = config.CLUSTER_SELECTION):
+        if clusters is None:
+            clusters = parse_clusters(config.CLUSTERS)
+        self.clusters = [Cluster(name, weight) for name, weight in clusters]
+        self.mode = mode
+
+    def ranked(self, key: str) -> List[Cluster]:
+        """The clusters in the order of preference for a key"""
+        return sorted(
+            self.clusters,
+            key=lambda cluster: rendezvous_score(key, cluster.name,
+                                                 cluster.weight),
+            reverse=True)
+
+    def select(self, key: str) -> Optional[Cluster]:
+        """Choose the cluster for a key (i.e: the pull request)"""
+        ranked = self.ranked(key)
+        if not ranked or self.mode != "load":
+            return ranked[0] if ranked else None
+
+        best: Optional[Cluster] = None
+        best_load = 0.0
+        for cluster in ranked:
+            try:
+                load = (cluster.running_namespaces() + 1) / cluster.weight
+            except (subprocess.CalledProcessError, ValueError) as error:
+                print(f"⚠️ Skipping cluster {cluster.name}: {error}")
+                continue
+            # Ties goes to the sticky order
+            if best is None or load < best_load:
+                best, best_load = cluster, load
+        return best or ranked[0]
@@ -17,14 +17,154 @@ import os
 
 TEKTON_ASA_CODE_DIR = os.environ.get("TEKTON_ASA_CODE_DIR", ".tekton")
 
-REPOSITORY_DIR = "/tmp/repository"
+REPOSITORY_DIR = os.environ.get("TKAAC_REPOSITORY_DIR", "/tmp/repository")
 
 GITHUB_RAW_URL = "https://raw.githubusercontent.com/tektoncd/catalog/main/task"
-GITHUB_API_URL = "https://api.github.com"
+GITHUB_API_URL = os.environ.get("TKAAC_GITHUB_API_URL",
+                                "https://api.github.com")
 
 COMMENT_ALLOWED_STRING = "/ok-to-test"
 COMMENT_RETEST_STRING = "/retest"
 
 TEKTON_CATALOG_REPOSITORY = "tektoncd/catalog"
+# A directory or a tarball with a snapshot of the catalog to get the tasks
+# from instead of GitHUB, see python -m tektonasacode.catalog to refresh it.
+CATALOG_SNAPSHOT = os.environ.get("TKAAC_CATALOG_SNAPSHOT", "")
 
 ALLOW_PRERUNS_CMD = False
+
+# Seconds we wait after applying the templates before following the logs
+PIPELINERUN_START_DELAY = float(
+    os.environ.get("TKAAC_PIPELINERUN_START_DELAY", "2"))
+
+# Minimum seconds between two progress updates of the check run
+CHECK_RUN_UPDATE_INTERVAL = int(
+    os.environ.get("TKAAC_CHECK_RUN_UPDATE_INTERVAL", "15"))
+# Seconds between two polls of the PipelineRun to report progress
+PROGRESS_POLL_INTERVAL = int(os.environ.get("TKAAC_PROGRESS_POLL_INTERVAL",
+                                            "5"))
+
+# Maximum number of annotations we add to a check run, the GitHUB API only
+# accepts 50 of them per request.
+MAX_ANNOTATIONS = int(os.environ.get("TKAAC_MAX_ANNOTATIONS", "200"))
+ANNOTATIONS_PER_REQUEST = 50
+# Maximum number of error lines we show in the report
+MAX_REPORTED_ERRORS = int(os.environ.get("TKAAC_MAX_REPORTED_ERRORS", "100"))
+
+# How many templates we keep compiled in memory with their last rendering
+RENDER_CACHE_MAX_ENTRIES = int(
+    os.environ.get("TKAAC_RENDER_CACHE_MAX_ENTRIES", "1024"))
+# Where we keep the compiled templates to reuse them across runs, only in
+# memory when empty. It needs to be on a volume shared by the runs.
+RENDER_CACHE_DIR = os.environ.get("TKAAC_RENDER_CACHE_DIR", "")
+
+# How many resources we create in parallel in the temporary namespace
+APPLY_CONCURRENCY = int(os.environ.get("TKAAC_APPLY_CONCURRENCY", "8"))
+
+# Where we cache the bundles generated by the moulinette, mount a volume in
+# there to reuse them across runs.
+BUNDLE_CACHE_DIR = os.environ.get("TKAAC_BUNDLE_CACHE_DIR",
+                                  "/tmp/tekton-asa-code/bundles")
+
+# ConfigMap in the tekton-asa-code namespace where we remember the successful
+# runs, set it to an empty string to disable the result cache.
+RESULT_CACHE_CONFIGMAP = os.environ.get("TKAAC_RESULT_CACHE_CONFIGMAP",
+                                        "tekton-asa-code-results")
+# How many successful runs we remember, a ConfigMap cannot be bigger than 1MB
+RESULT_CACHE_MAX_ENTRIES = int(
+    os.environ.get("TKAAC_RESULT_CACHE_MAX_ENTRIES", "500"))
+# How many times we retry storing a result when another run has updated the
+# ConfigMap in the meantime
+RESULT_CACHE_CONFLICT_RETRIES = int(
+    os.environ.get("TKAAC_RESULT_CACHE_CONFLICT_RETRIES", "5"))
+
+# Where we cache the GitHUB application installation tokens, mount a volume in
+# there to share them across runs.
+TOKEN_CACHE_DIR = os.environ.get("TKAAC_TOKEN_CACHE_DIR",
+                                 "/tmp/tekton-asa-code/tokens")
+# Seconds before their expiration we stop using cached installation tokens
+TOKEN_EXPIRY_MARGIN = int(os.environ.get("TKAAC_TOKEN_EXPIRY_MARGIN", "300"))
+
+# Where we write the timings of a run as JSON and as a Prometheus textfile,
+# and the Prometheus pushgateway to push them to, all optional.
+METRICS_JSON_FILE = os.environ.get("TKAAC_METRICS_JSON_FILE", "")
+METRICS_TEXTFILE = os.environ.get("TKAAC_METRICS_TEXTFILE", "")
+METRICS_PUSHGATEWAY_URL = os.environ.get("TKAAC_METRICS_PUSHGATEWAY_URL", "")
+
+# Profile the run, cpu or alloc, the profiles are written in PROFILE_DIR and
+# linked in the check run if we know the PROFILE_URL where it's served from.
+PROFILE = os.environ.get("TKAAC_PROFILE", "")
+PROFILE_DIR = os.environ.get("TKAAC_PROFILE_DIR",
+                             "/tmp/tekton-asa-code/profiles")
+PROFILE_URL = os.environ.get("TKAAC_PROFILE_URL", "")
+PROFILE_TOP = int(os.environ.get("TKAAC_PROFILE_TOP", "50"))
+
+# SQLite database where we keep how long the tasks took, disabled when empty.
+# It needs to be on a persistent volume, the pod doesn't keep anything.
+HISTORY_DB = os.environ.get("TKAAC_HISTORY_DB", "")
+# How many of the previous runs of a task we take the median of
+HISTORY_WINDOW = int(os.environ.get("TKAAC_HISTORY_WINDOW", "20"))
+# Runs of a task we need before flagging it as slower
+HISTORY_MIN_RUNS = int(os.environ.get("TKAAC_HISTORY_MIN_RUNS", "3"))
+# A task is slower when it took that many times its median and at least
+# HISTORY_MIN_SLOWDOWN seconds more
+HISTORY_SLOWDOWN_RATIO = float(
+    os.environ.get("TKAAC_HISTORY_SLOWDOWN_RATIO", "1.5"))
+HISTORY_MIN_SLOWDOWN = int(os.environ.get("TKAAC_HISTORY_MIN_SLOWDOWN", "30"))
+
+# How we follow the logs of the PipelineRun: tkn, or native to stream all the
+# steps concurrently through the kubernetes API.
+LOG_FOLLOWER = os.environ.get("TKAAC_LOG_FOLLOWER", "tkn")
+# Seconds between looking for new pods to stream the logs of
+LOG_FOLLOWER_POLL_INTERVAL = float(
+    os.environ.get("TKAAC_LOG_FOLLOWER_POLL_INTERVAL", "2"))
+# Seconds we hold the lines to merge them in the order of their timestamps
+LOG_FOLLOWER_MERGE_DELAY = float(
+    os.environ.get("TKAAC_LOG_FOLLOWER_MERGE_DELAY", "1"))
+# Seconds we keep following when we cannot get the PipelineRun (the API fails
+# or there is none) before failing the run
+LOG_FOLLOWER_LOST_TIMEOUT = float(
+    os.environ.get("TKAAC_LOG_FOLLOWER_LOST_TIMEOUT", "300"))
+
+# Where we archive the logs and the PipelineRun of every run, a directory or
+# s3://bucket/prefix on the ARCHIVE_S3_ENDPOINT. When set the namespace is
+# deleted right after the run whatever the outcome. Empty to disable it.
+ARCHIVE_URL = os.environ.get("TKAAC_ARCHIVE_URL", "")
+ARCHIVE_S3_ENDPOINT = os.environ.get("TKAAC_ARCHIVE_S3_ENDPOINT",
+                                     "https://s3.amazonaws.com")
+ARCHIVE_ACCESS_KEY = os.environ.get("TKAAC_ARCHIVE_ACCESS_KEY", "")
+ARCHIVE_SECRET_KEY = os.environ.get("TKAAC_ARCHIVE_SECRET_KEY", "")
+ARCHIVE_REGION = os.environ.get("TKAAC_ARCHIVE_REGION", "us-east-1")
+# Where the archives are served from, to link them in the check run
+ARCHIVE_PUBLIC_URL = os.environ.get("TKAAC_ARCHIVE_PUBLIC_URL", "")
+# Bytes of logs in each compressed chunk
+ARCHIVE_CHUNK_SIZE = int(
+    os.environ.get("TKAAC_ARCHIVE_CHUNK_SIZE", str(8 * 1024 * 1024)))
+
+# Hold the runs while there is no room for them in the cluster: when there are
+# already ADMISSION_MAX_NAMESPACES CI namespaces with an unfinished PipelineRun
+# (0 for no limit) or when the cpu or memory (kubernetes quantities) not
+# requested on the nodes is below the minimum.
+ADMISSION_MAX_NAMESPACES = int(
+    os.environ.get("TKAAC_ADMISSION_MAX_NAMESPACES", "0"))
+ADMISSION_MIN_FREE_CPU = os.environ.get("TKAAC_ADMISSION_MIN_FREE_CPU", "0")
+ADMISSION_MIN_FREE_MEMORY = os.environ.get("TKAAC_ADMISSION_MIN_FREE_MEMORY",
+                                           "0")
+# Seconds we wait between checks, doubling up to the max, and in total
+ADMISSION_BACKOFF = float(os.environ.get("TKAAC_ADMISSION_BACKOFF", "10"))
+ADMISSION_MAX_BACKOFF = float(
+    os.environ.get("TKAAC_ADMISSION_MAX_BACKOFF", "120"))
+ADMISSION_TIMEOUT = float(os.environ.get("TKAAC_ADMISSION_TIMEOUT", "3600"))
+# The runs waiting for room are queued with a ConfigMap in this namespace, the
+# one we run in when empty, so they are admitted first come first served. A
+# ticket not refreshed for ADMISSION_TICKET_TTL seconds is from a dead run.
+ADMISSION_QUEUE_NAMESPACE = os.environ.get("TKAAC_ADMISSION_QUEUE_NAMESPACE",
+                                           "")
+ADMISSION_TICKET_TTL = float(
+    os.environ.get("TKAAC_ADMISSION_TICKET_TTL", "300"))
+
+# Spread the runs over these contexts of the kubeconfig, with their weight
+# i.e: "east=3,west=1". sticky keeps a pull request on the same cluster, load
+# chooses the cluster with the less CI namespaces for its weight.
+CLUSTERS = os.environ.get("TKAAC_CLUSTERS", "")
+CLUSTER_SELECTION = os.environ.get("TKAAC_CLUSTER_SELECTION", "sticky")
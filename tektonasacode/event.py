@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Read the GitHUB webhook payload"""
+import json
+import os
+import sys
+from typing import Any, Dict, NamedTuple
+
+from tektonasacode import utils
+
+# File name of the payload when we get a workspace directory
+WORKSPACE_PAYLOAD_FILE = "github.json"
+
+
+def parse(payload: str) -> Dict[str, Any]:
+    """Parse the payload from a string, Tekton params may have newlines
+    inside the JSON strings so we don't parse it strictly"""
+    return json.loads(payload, strict=False)
+
+
+def read(source: str) -> Dict[str, Any]:
+    """Read and parse the payload from a file, a workspace directory
+    containing a github.json file or from stdin if the source is -"""
+    if source == "-":
+        return json.load(sys.stdin, strict=False)
+    if os.path.isdir(source):
+        source = os.path.join(source, WORKSPACE_PAYLOAD_FILE)
+    with open(source) as payload:
+        return json.load(payload, strict=False)
+
+
+class Event(NamedTuple):
+    """The fields of the pull request event we need for a run"""
+    repo_full_name: str
+    repo_owner_login: str
+    repo_html_url: str
+    base_repo_full_name: str
+    pull_request_number: str
+    pull_request_sha: str
+    pull_request_user_login: str
+
+    @classmethod
+    def from_json(cls, jeez: Dict[str, Any]) -> "Event":
+        """Extract the fields from the pull request event"""
+        return cls(
+            repo_full_name=utils.Utils.get_key("repository.full_name", jeez),
+            repo_owner_login=utils.Utils.get_key("repository.owner.login",
+                                                 jeez),
+            repo_html_url=utils.Utils.get_key("repository.html_url", jeez),
+            base_repo_full_name=utils.Utils.get_key(
+                "pull_request.base.repo.full_name", jeez),
+            pull_request_number=utils.Utils.get_key("pull_request.number",
+                                                    jeez),
+            pull_request_sha=utils.Utils.get_key("pull_request.head.sha",
+                                                 jeez),
+            pull_request_user_login=utils.Utils.get_key(
+                "pull_request.user.login", jeez),
+        )
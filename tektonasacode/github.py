@@ -18,11 +18,45 @@ import datetime
 import http.client
 import json
 import urllib.parse
-from typing import Any, Dict, Tuple, List
-
-import pkg_resources
-
-from tektonasacode import config
+from typing import Any, Dict, List, Optional, Tuple
+
+from tektonasacode import config, metrics
+
+
+CONTEXT_QUERY = """
+query($owner: String!, $name: String!, $login: String!, $owners: String!,
+      $tektonyaml: String!) {
+  repository(owner: $owner, name: $name) {
+    owners: object(expression: $owners) {
+      ... on Blob { text isTruncated }
+    }
+    tektonyaml: object(expression: $tektonyaml) {
+      ... on Blob { text isTruncated }
+    }
+  }
+  user(login: $login) {
+    organizations(first: 100) { nodes { login } }
+  }
+}
+"""
+
+
+def parse_version(version: str) -> Tuple:
+    """Parse a version like 0.1.2 to something we can compare, numbers are
+    compared as numbers and anything else as strings after them"""
+    return tuple((int(part), "") if part.isdigit() else (-1, part)
+                 for part in version.split("."))
+
+
+def endpoint_name(path: str) -> str:
+    """Name the API endpoint of an URL path without the ids and names in it,
+    i.e: /repos/owner/repo/check-runs/1 is repos/check-runs"""
+    parts = [part for part in path.split("/") if part]
+    if not parts:
+        return ""
+    if parts[0] == "repos" and len(parts) > 3:
+        return f"repos/{parts[3]}"
+    return parts[0]
 
 
 class GithubEventNotProcessed(Exception):
@@ -44,6 +78,9 @@ class Github:
     def __init__(self, token):
         self.token = token
         self.github_api_url = config.GITHUB_API_URL
+        # Filled by load_context(), used before going to the REST API
+        self.files_cache: Dict[Tuple[str, str], bytes] = {}
+        self.organizations_cache: Dict[str, List[str]] = {}
 
     def request(self,
                 method: str,
@@ -68,10 +105,16 @@ class Github:
         if params:
             url_path += "?" + urllib.parse.urlencode(params)
         data = data and json.dumps(data)
-        hostname = str(url_parsed.hostname)
-        conn = http.client.HTTPSConnection(hostname)
-        conn.request(method, url_path, body=data, headers=headers)
-        response = conn.getresponse()
+        with metrics.RECORDER.span(metrics.GITHUB_REQUEST,
+                                   method=method,
+                                   endpoint=endpoint_name(url_parsed.path)):
+            if url_parsed.scheme == "http":
+                conn = http.client.HTTPConnection(url_parsed.netloc)
+            else:
+                conn = http.client.HTTPSConnection(url_parsed.netloc)
+            conn.request(method, url_path, body=data, headers=headers)
+            response = conn.getresponse()
+            body = response.read()
 
         if response.status == 302:
             return self.request(method, response.headers["Location"])
@@ -80,10 +123,85 @@ class Github:
             headers.pop("Authorization", None)
             raise GitHUBAPIException(
                 response.status,
-                f"Error: {response.status} - {json.loads(response.read())} - {method} - {url} - {data} - {headers}"
+                f"Error: {response.status} - {json.loads(body)} - {method} - {url} - {data} - {headers}"
             )
 
-        return (response, json.loads(response.read().decode()))
+        return (response, json.loads(body.decode()))
+
+    def graphql(self, query: str, variables: Dict[str, Any]) -> Dict:
+        """Execute a GraphQL query and return its data"""
+        _, ret = self.request("POST",
+                              "/graphql",
+                              data={
+                                  "query": query,
+                                  "variables": variables
+                              })
+        if ret.get("errors") and not ret.get("data"):
+            raise GitHUBAPIException(
+                None, f"GraphQL query has failed: {ret['errors']}")
+        return ret["data"]
+
+    @staticmethod
+    def is_retest_comment(event_json) -> bool:
+        """Check if the event has a /retest in a pull_request comment, it can
+        be any line."""
+        return all([
+            "issue" in event_json, "pull_request" in event_json.get(
+                "issue", {}), "comment" in event_json,
+            config.COMMENT_RETEST_STRING
+            in event_json.get("comment", {}).get("body", "").split("\n")
+        ])
+
+    def load_context(self, event_json):
+        """Grab in a single GraphQL query what we need to decide if we run: the
+        OWNERS and tekton.yaml files from the default branch and the
+        organizations of the pull request author.
+
+        Files and organizations are cached so get_file_content and
+        check_organization_of_user don't have to go to the REST API, if we
+        cannot do it the REST API does the job.
+
+        The pull request of a /retest still comes from the REST API in
+        filter_event_json, the templates can reference any of its field."""
+        if "pull_request" in event_json:
+            login = event_json["pull_request"]["user"]["login"]
+        elif self.is_retest_comment(event_json):
+            login = event_json["issue"]["user"]["login"]
+        else:
+            return
+
+        owner_repo = event_json["repository"]["full_name"]
+        variables = {
+            "owner": owner_repo.split("/")[0],
+            "name": owner_repo.split("/")[1],
+            "login": login,
+            "owners": f"HEAD:{config.TEKTON_ASA_CODE_DIR}/OWNERS",
+            "tektonyaml": f"HEAD:{config.TEKTON_ASA_CODE_DIR}/tekton.yaml",
+        }
+        try:
+            data = self.graphql(CONTEXT_QUERY, variables)
+        except (GitHUBAPIException, KeyError, ValueError) as error:
+            print(f"⚠️ Cannot load context via GraphQL, using REST: {error}")
+            return
+
+        # Only cache what we really got, a null repository (partial error)
+        # or a truncated/binary blob is left to the REST API. A null object
+        # means the file doesn't exist on the branch.
+        repository = data.get("repository") or {}
+        for name, path in (("owners", "OWNERS"), ("tektonyaml",
+                                                   "tekton.yaml")):
+            if not repository or name not in repository:
+                continue
+            key = (owner_repo, f"{config.TEKTON_ASA_CODE_DIR}/{path}")
+            blob = repository[name]
+            if blob is None:
+                self.files_cache[key] = b""
+            elif blob.get("text") is not None and not blob.get("isTruncated"):
+                self.files_cache[key] = blob["text"].encode()
+        if data.get("user"):
+            self.organizations_cache[login] = [
+                org["login"] for org in data["user"]["organizations"]["nodes"]
+            ]
 
     def filter_event_json(self, event_json):
         """Filter the json received if it's a comment add the pull request
@@ -91,13 +209,7 @@ class Github:
         NotProcessed"""
         if "pull_request" in event_json:
             return event_json
-        # Check if the event has a /retest in a pull_request comment, it can be
-        # any line.
-        if all([
-                "issue" in event_json, "pull_request" in event_json["issue"],
-                "comment" in event_json, config.COMMENT_RETEST_STRING
-                in event_json["comment"]["body"].split("\n")
-        ]):
+        if self.is_retest_comment(event_json):
             response, pull_request = self.request(
                 "GET", event_json["issue"]["pull_request"]["url"])
             if response.status >= 400:
@@ -111,14 +223,42 @@ class Github:
 
     def get_file_content(self, owner_repo: str, path: str) -> bytes:
         """Get file path contents from GITHUB API"""
+        if (owner_repo, path) in self.files_cache:
+            return self.files_cache[(owner_repo, path)]
         try:
             _, content = self.request("GET",
                                       f"/repos/{owner_repo}/contents/{path}")
         except GitHUBAPIException as error:
             if error.status and error.status == 404:
+                self.files_cache[(owner_repo, path)] = b""
                 return b""
             raise error
-        return base64.b64decode(content['content'])
+        self.files_cache[(owner_repo, path)] = base64.b64decode(
+            content['content'])
+        return self.files_cache[(owner_repo, path)]
+
+    def get_pull_request_files(self, repo_full_name: str,
+                               pull_request_number: int) -> List[str]:
+        """Get all the files changed in a pull request, following the
+        pagination"""
+        files: List[str] = []
+        # The API doesn't return more than 3000 files
+        for page in range(1, 31):
+            _, pr_files = self.request(
+                "GET",
+                f"/repos/{repo_full_name}/pulls/{pull_request_number}/files",
+                params={
+                    "per_page": 100,
+                    "page": page,
+                },
+            )
+            for pr_file in pr_files:
+                files.append(pr_file["filename"])
+                if pr_file.get("previous_filename"):
+                    files.append(pr_file["previous_filename"])
+            if len(pr_files) < 100:
+                break
+        return files
 
     def get_task_latest_version(self, repository: str, task: str) -> str:
         """Use the github api to retrieve the latest task verison from a repository"""
@@ -149,8 +289,7 @@ class Github:
             if path.startswith(f"task/{task}") and path.endswith(
                     f"{task}.yaml"):
                 splitted = path.split("/")
-                if pkg_resources.parse_version(
-                        splitted[2]) > pkg_resources.parse_version(version[0]):
+                if parse_version(splitted[2]) > parse_version(version[0]):
                     version = (path.split("/")[2], tree["url"])
 
         if not version[1]:
@@ -170,6 +309,9 @@ class Github:
     ) -> bool:
         """Check if a user is part of an organization an deny her, unless a approved
            member leaves a /tekton ok-to-test comments"""
+        if pull_request_user_login in self.organizations_cache:
+            return organization in self.organizations_cache[
+                pull_request_user_login]
         _, _orgs = self.request(
             "GET",
             f"{self.github_api_url}/users/{pull_request_user_login}/orgs",
@@ -195,7 +337,7 @@ class Github:
         repository_full_name: str,
         check_run_id: int,
         target_url: str,
-        conclusion: str,
+        conclusion: Optional[str],
         output: Dict[str, str],
         status: str,
     ) -> str:
@@ -203,14 +345,24 @@ class Github:
         Set status on the GitHUB Check
         """
 
+        # GitHUB only accept a batch of annotations per request, we send the
+        # first batch with the status and append the others afterwards.
+        annotations = output.get("annotations", [])[:config.MAX_ANNOTATIONS]
+        output = dict(output,
+                      annotations=annotations[:config.ANNOTATIONS_PER_REQUEST])
+        if not output["annotations"]:
+            del output["annotations"]
         data = {
             "name": "Tekton CI",
             "status": status,
-            "conclusion": conclusion,
-            "completed_at":
-            datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ"),
             "output": output,
         }
+        # Only a completed check can have a conclusion, anything else is a
+        # progress update.
+        if status == "completed":
+            data["conclusion"] = conclusion
+            data["completed_at"] = datetime.datetime.now().strftime(
+                "%Y-%m-%dT%H:%M:%SZ")
         if target_url:
             data["details_url"] = target_url
 
@@ -221,6 +373,27 @@ class Github:
             data=data,
         )
 
+        for index in range(config.ANNOTATIONS_PER_REQUEST, len(annotations),
+                           config.ANNOTATIONS_PER_REQUEST):
+            self.request(
+                "PATCH",
+                f"/repos/{repository_full_name}/check-runs/{check_run_id}",
+                headers={
+                    "Accept": "application/vnd.github.antiope-preview+json"
+                },
+                data={
+                    "output": {
+                        "title":
+                        output["title"],
+                        "summary":
+                        output["summary"],
+                        "annotations":
+                        annotations[index:index +
+                                    config.ANNOTATIONS_PER_REQUEST],
+                    }
+                },
+            )
+
         return jeez
 
     def create_check_run(self,
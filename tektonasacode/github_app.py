@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Get installation tokens as a GitHUB application"""
+import base64
+import datetime
+import json
+import os
+import subprocess
+import tempfile
+import time
+from typing import Dict
+
+from tektonasacode import config, github
+
+
+def b64url(data: bytes) -> str:
+    """Base64 url encoding without padding as used by JWT"""
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+class GithubApp:
+    """Mint the application JWT and exchange it for installation tokens,
+    which are cached until shortly before they expire"""
+    def __init__(self,
+                 application_id: str,
+                 private_key_path: str,
+                 cache_dir: str = config.TOKEN_CACHE_DIR,
+                 clock=time.time):
+        self.application_id = application_id
+        self.private_key_path = private_key_path
+        self.cache_dir = cache_dir
+        self.clock = clock
+
+    def sign(self, message: bytes) -> bytes:
+        """Sign with RS256 using openssl, installed in the image for it"""
+        try:
+            return subprocess.run(
+                ["openssl", "dgst", "-sha256", "-sign", self.private_key_path],
+                input=message,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=True).stdout
+        except subprocess.CalledProcessError as exception:
+            print(f"Cannot sign the GitHUB application JWT: "
+                  f"{exception.stderr.decode()}")
+            raise exception
+
+    def jwt(self) -> str:
+        """Generate the application JWT, valid for 9mn to allow some clock
+        drift with GitHUB"""
+        now = int(self.clock())
+        header = b64url(json.dumps({"alg": "RS256", "typ": "JWT"}).encode())
+        payload = b64url(
+            json.dumps({
+                "iat": now - 60,
+                "exp": now + 540,
+                "iss": str(self.application_id),
+            }).encode())
+        signing_input = f"{header}.{payload}"
+        return f"{signing_input}.{b64url(self.sign(signing_input.encode()))}"
+
+    def _cache_path(self, installation_id: str) -> str:
+        # The same installation id can be used with another application
+        return os.path.join(
+            self.cache_dir,
+            f"installation-{self.application_id}-{installation_id}.json")
+
+    def _cached(self, installation_id: str) -> str:
+        path = self._cache_path(installation_id)
+        if not os.path.exists(path):
+            return ""
+        try:
+            with open(path, encoding="utf-8") as cachefile:
+                cached = json.load(cachefile)
+        except ValueError:
+            return ""
+        if (cached.get("expires_at", 0) - self.clock() <
+                config.TOKEN_EXPIRY_MARGIN):
+            return ""
+        return cached.get("token", "")
+
+    def _store(self, installation_id: str, cached: Dict):
+        try:
+            os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+            tmpfile = tempfile.NamedTemporaryFile("w",
+                                                  dir=self.cache_dir,
+                                                  delete=False)
+            with tmpfile:
+                json.dump(cached, tmpfile)
+            os.replace(tmpfile.name, self._cache_path(installation_id))
+        except OSError as error:
+            print(f"⚠️ Cannot cache the installation token: {error}")
+
+    def installation_token(self, installation_id: str) -> str:
+        """Get an installation token, from the cache if it's still valid"""
+        token = self._cached(installation_id)
+        if token:
+            print("🔑 Using cached installation token")
+            return token
+
+        _, access_token = github.Github(self.jwt()).request(
+            "POST",
+            f"/app/installations/{installation_id}/access_tokens",
+            headers={"Accept": "application/vnd.github.v3+json"},
+        )
+        expires_at = datetime.datetime.strptime(
+            access_token["expires_at"],
+            "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=datetime.timezone.utc)
+        self._store(installation_id, {
+            "token": access_token["token"],
+            "expires_at": expires_at.timestamp(),
+        })
+        return access_token["token"]
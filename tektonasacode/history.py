@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Remember how long the tasks took to spot the ones getting slower"""
+import datetime
+import os
+import sqlite3
+import statistics
+import time
+from typing import Dict, List, Tuple
+
+from tektonasacode import config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS durations (
+    id INTEGER PRIMARY KEY,
+    repo TEXT NOT NULL,
+    pipeline TEXT NOT NULL,
+    task TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS durations_task ON durations (repo, pipeline, task);
+"""
+
+
+class History:
+    """Task durations in a SQLite database keyed by repository, pipeline and
+    task, we only keep the last `window` durations of a task"""
+    def __init__(self,
+                 path: str = config.HISTORY_DB,
+                 window: int = config.HISTORY_WINDOW,
+                 clock=time.time):
+        self.path = path
+        self.window = window
+        self.clock = clock
+        self._connection = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Open the database the first time we need it"""
+        if self._connection is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # Other runs may be writing on the same volume
+            self._connection = sqlite3.connect(self.path, timeout=30)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def medians(self, repo: str, pipeline: str,
+                tasks: List[str]) -> Dict[str, Tuple[float, int]]:
+        """Get the median duration of the tasks and how many runs it comes
+        from"""
+        medians = {}
+        for task in tasks:
+            rows = self.connection.execute(
+                "SELECT seconds FROM durations "
+                "WHERE repo = ? AND pipeline = ? AND task = ? "
+                "ORDER BY id DESC LIMIT ?",
+                (repo, pipeline, task, self.window)).fetchall()
+            if rows:
+                medians[task] = (statistics.median(row[0] for row in rows),
+                                 len(rows))
+        return medians
+
+    def record(self, repo: str, pipeline: str, durations: Dict[str, float]):
+        """Add the durations of a run, forgetting the ones out of the
+        window"""
+        with self.connection:
+            for task, seconds in durations.items():
+                self.connection.execute(
+                    "INSERT INTO durations "
+                    "(repo, pipeline, task, seconds, created) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (repo, pipeline, task, seconds, self.clock()))
+                self.connection.execute(
+                    "DELETE FROM durations "
+                    "WHERE repo = ? AND pipeline = ? AND task = ? AND id NOT IN"
+                    " (SELECT id FROM durations "
+                    "WHERE repo = ? AND pipeline = ? AND task = ? "
+                    "ORDER BY id DESC LIMIT ?)",
+                    (repo, pipeline, task) * 2 + (self.window, ))
+
+    def slower(self, repo: str, pipeline: str,
+               durations: Dict[str, float]) -> Dict[str, Tuple[float, float]]:
+        """Get the tasks of this run which got significantly slower than
+        their median, with their duration and median"""
+        slower = {}
+        for task, (median, runs) in self.medians(repo, pipeline,
+                                                 list(durations)).items():
+            seconds = durations[task]
+            if runs < config.HISTORY_MIN_RUNS:
+                continue
+            if (seconds > median * config.HISTORY_SLOWDOWN_RATIO
+                    and seconds - median >= config.HISTORY_MIN_SLOWDOWN):
+                slower[task] = (seconds, median)
+        return slower
+
+    @staticmethod
+    def report(slower: Dict[str, Tuple[float, float]]) -> str:
+        """Markdown of the tasks which got slower"""
+        if not slower:
+            return ""
+        ret = "🐢 **Slower than usual:**\n\n"
+        for task, (seconds, median) in sorted(slower.items()):
+            ret += (f"• {task} took {datetime.timedelta(seconds=int(seconds))}"
+                    f" instead of {datetime.timedelta(seconds=int(median))}"
+                    f" ({seconds / max(median, 1):.1f}x)\n")
+        return ret
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Follow the logs of a PipelineRun through the kubernetes API, without tkn"""
+import base64
+import heapq
+import http.client
+import io
+import json
+import os
+import queue
+import ssl
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from tektonasacode import config, yamlutil
+
+SERVICE_ACCOUNT_DIR = "/var/run/secrets/kubernetes.io/serviceaccount"
+PIPELINERUNS_PATH = "/apis/tekton.dev/v1beta1/namespaces/{}/pipelineruns"
+# How many times we try to stream a container before giving up
+STREAM_ATTEMPTS = 3
+
+
+class KubeAPIException(Exception):
+    """When the kubernetes API has failed"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class KubeClient:
+    """The bare minimum to GET and stream from the kubernetes API"""
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 server: str,
+                 token: str = "",
+                 ca_file: str = "",
+                 insecure: bool = False,
+                 cert_file: str = "",
+                 key_file: str = ""):
+        self.server = urllib.parse.urlparse(server)
+        self.token = token
+        if self.server.scheme == "https":
+            self.context = ssl.create_default_context(cafile=ca_file or None)
+            if insecure:
+                self.context.check_hostname = False
+                self.context.verify_mode = ssl.CERT_NONE
+            if cert_file:
+                self.context.load_cert_chain(cert_file, key_file or None)
+
+    @classmethod
+    def from_environment(cls) -> "KubeClient":
+        """Use the current context of the KUBECONFIG like kubectl when it is
+        set, or the service account of the pod when we are in the cluster, or
+        the current context of the default kubeconfig"""
+        token_file = os.path.join(SERVICE_ACCOUNT_DIR, "token")
+        if not os.environ.get("KUBECONFIG") and os.environ.get(
+                "KUBERNETES_SERVICE_HOST") and os.path.exists(token_file):
+            return cls(
+                f"https://{os.environ['KUBERNETES_SERVICE_HOST']}:"
+                f"{os.environ.get('KUBERNETES_SERVICE_PORT', '443')}",
+                token=open(token_file).read().strip(),
+                ca_file=os.path.join(SERVICE_ACCOUNT_DIR, "ca.crt"))
+        return cls.from_kubeconfig(
+            os.environ.get("KUBECONFIG",
+                           os.path.expanduser("~/.kube/config")).split(
+                               os.pathsep)[0])
+
+    @classmethod
+    def from_kubeconfig(cls, path: str) -> "KubeClient":
+        """Use the cluster and user of the current context of a kubeconfig"""
+        kubeconfig = yamlutil.load(open(path))
+
+        def named(kind: str, name: str) -> Dict[str, Any]:
+            for item in kubeconfig.get(kind + "s") or []:
+                if item["name"] == name:
+                    return item[kind]
+            raise KubeAPIException(None, f"No {kind} {name} in {path}")
+
+        context = named("context", kubeconfig["current-context"])
+        cluster = named("cluster", context["cluster"])
+        user = named("user", context["user"]) if context.get("user") else {}
+
+        token = user.get("token", "")
+        if not token and user.get("tokenFile"):
+            with open(user["tokenFile"], encoding="utf-8") as token_file:
+                token = token_file.read().strip()
+
+        # The ssl context has read the certificates and the key once created,
+        # don't leave them behind.
+        with tempfile.TemporaryDirectory() as directory:
+
+            def data_file(key: str) -> str:
+                """Certificates are either files or base64 data in the
+                kubeconfig, we need files for ssl"""
+                section = cluster if key == "certificate-authority" else user
+                if section.get(key):
+                    return section[key]
+                if not section.get(key + "-data"):
+                    return ""
+                path = os.path.join(directory, key)
+                with open(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600),
+                          "wb") as data:
+                    data.write(base64.b64decode(section[key + "-data"]))
+                return path
+
+            return cls(cluster["server"],
+                       token=token,
+                       ca_file=data_file("certificate-authority"),
+                       insecure=cluster.get("insecure-skip-tls-verify",
+                                            False),
+                       cert_file=data_file("client-certificate"),
+                       key_file=data_file("client-key"))
+
+    def request(self,
+                path: str,
+                params: Optional[Dict[str, str]] = None,
+                timeout: Optional[float] = None) -> http.client.HTTPResponse:
+        """GET a path of the API"""
+        if self.server.scheme == "https":
+            conn: http.client.HTTPConnection = http.client.HTTPSConnection(
+                self.server.netloc, context=self.context, timeout=timeout)
+        else:
+            conn = http.client.HTTPConnection(self.server.netloc,
+                                              timeout=timeout)
+        headers = {"Accept": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if params:
+            path += "?" + urllib.parse.urlencode(params)
+        conn.request("GET", self.server.path.rstrip("/") + path,
+                     headers=headers)
+        response = conn.getresponse()
+        if response.status >= 400:
+            raise KubeAPIException(
+                response.status,
+                f"Error: {response.status} - GET {path} - "
+                f"{response.read().decode(errors='replace')}")
+        return response
+
+    def get(self,
+            path: str,
+            params: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """GET a path of the API as JSON"""
+        return json.loads(self.request(path, params, timeout=60).read())
+
+    def lines(self, path: str, params: Dict[str, str]) -> Iterator[str]:
+        """Stream the lines of a path of the API"""
+        response = self.request(path, params)
+        for line in io.TextIOWrapper(response,
+                                     encoding="utf-8",
+                                     errors="replace"):
+            yield line.rstrip("\n")
+
+
+def timestamp_key(timestamp: str) -> Tuple[str, int]:
+    """Something to sort the RFC3339Nano timestamps of the logs, the
+    nanoseconds have their trailing zeros removed so we can't compare them as
+    strings"""
+    seconds, _, fraction = timestamp.rstrip("Z").partition(".")
+    if not fraction.isdigit():
+        return (seconds, 0)
+    return (seconds, int(fraction[:9].ljust(9, "0")))
+
+
+def pipelinerun_status(pipelinerun: Dict[str, Any]) -> Tuple[str, str]:
+    """Get the status of a PipelineRun as tkn shows it, and its message"""
+    for condition in pipelinerun.get("status", {}).get("conditions", []):
+        if condition.get("type") != "Succeeded":
+            continue
+        reason = condition.get("reason", "")
+        message = f"{reason}: {condition.get('message', '')}"
+        if condition["status"] == "True":
+            return reason or "Succeeded", message
+        if condition["status"] == "Unknown":
+            return reason or "Running", message
+        if "fail" in reason.lower():
+            return reason, message
+        return f"Failed ({reason})", message
+    return "Unknown", ""
+
+
+class LogFollower:
+    """Follow the logs of all the steps of the PipelineRun in a namespace.
+
+    Every step container gets streamed in its own thread as soon as it has
+    started, the lines are merged in the order of their timestamps. Lines are
+    held `merge_delay` seconds so the ones from slower streams can get before
+    them.
+
+    We give up when we have not been able to get the PipelineRun for
+    `lost_timeout` seconds."""
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+    def __init__(self,
+                 client: KubeClient,
+                 namespace: str,
+                 poll_interval: float = config.LOG_FOLLOWER_POLL_INTERVAL,
+                 merge_delay: float = config.LOG_FOLLOWER_MERGE_DELAY,
+                 clock=time.monotonic,
+                 lost_timeout: float = config.LOG_FOLLOWER_LOST_TIMEOUT):
+        self.client = client
+        self.namespace = namespace
+        self.poll_interval = poll_interval
+        self.merge_delay = merge_delay
+        self.lost_timeout = lost_timeout
+        self.lost_reason = ""
+        self.clock = clock
+        self.lines: "queue.Queue[Tuple]" = queue.Queue()
+        self.pending: List[Tuple] = []
+        self.sequence = 0
+        self.threads: List[threading.Thread] = []
+        self.started: Set[Tuple[str, str]] = set()
+        self.attempts: Dict[Tuple[str, str], int] = {}
+        self.lock = threading.Lock()
+
+    def finished(self) -> Optional[bool]:
+        """Check if the PipelineRun has finished, None when we cannot get it"""
+        try:
+            items = self.client.get(PIPELINERUNS_PATH.format(
+                self.namespace))["items"]
+        except (KubeAPIException, OSError, ValueError) as error:
+            self.lost_reason = f"Cannot get the PipelineRun: {error}"
+            print(f"⚠️ {self.lost_reason}")
+            return None
+        if not items:
+            self.lost_reason = f"There is no PipelineRun in {self.namespace}"
+            return None
+        for condition in items[0].get("status", {}).get("conditions", []):
+            if condition.get("type") == "Succeeded":
+                return condition["status"] != "Unknown"
+        return False
+
+    def discover(self):
+        """Start to stream the step containers we don't stream yet"""
+        pods = self.client.get(f"/api/v1/namespaces/{self.namespace}/pods",
+                               {"labelSelector": "tekton.dev/pipelineRun"})
+        for pod in pods.get("items", []):
+            labels = pod["metadata"].get("labels") or {}
+            task = labels.get("tekton.dev/pipelineTask",
+                              labels.get("tekton.dev/taskRun", ""))
+            for container in pod.get("status", {}).get(
+                    "containerStatuses") or []:
+                name = container["name"]
+                key = (pod["metadata"]["name"], name)
+                if not name.startswith("step-") or key in self.started:
+                    continue
+                state = container.get("state") or {}
+                if "running" not in state and "terminated" not in state:
+                    continue
+                if self.attempts.get(key, 0) >= STREAM_ATTEMPTS:
+                    continue
+                with self.lock:
+                    self.started.add(key)
+                    self.attempts[key] = self.attempts.get(key, 0) + 1
+                thread = threading.Thread(
+                    target=self.stream,
+                    args=(key[0], name, f"{task} : {name[len('step-'):]}"),
+                    daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def stream(self, pod: str, container: str, prefix: str):
+        """Queue the lines of a container log with their timestamp"""
+        streamed = False
+        try:
+            for line in self.client.lines(
+                    f"/api/v1/namespaces/{self.namespace}/pods/{pod}/log", {
+                        "container": container,
+                        "follow": "true",
+                        "timestamps": "true"
+                    }):
+                streamed = True
+                timestamp, _, message = line.partition(" ")
+                self.lines.put((timestamp_key(timestamp), prefix, message))
+        except (KubeAPIException, OSError) as error:
+            if not streamed:
+                # Try again at the next discovery, the container may not be
+                # ready to give its logs yet.
+                with self.lock:
+                    self.started.discard((pod, container))
+                return
+            self.lines.put(((
+                "9999", 0), prefix, f"⚠️ Log stream interrupted: {error}"))
+
+    def emit(self, writer, force: bool = False):
+        """Write the lines which have waited long enough, in order"""
+        now = self.clock()
+        while True:
+            try:
+                key, prefix, message = self.lines.get_nowait()
+            except queue.Empty:
+                break
+            self.sequence += 1
+            heapq.heappush(self.pending,
+                           (key, self.sequence, now, prefix, message))
+        out = ""
+        while self.pending and (force or
+                                self.pending[0][2] <= now - self.merge_delay):
+            _, _, _, prefix, message = heapq.heappop(self.pending)
+            out += f"[{prefix}] {message}\n"
+        if out:
+            writer.write(out.encode())
+            writer.flush()
+            sys.stdout.write(out)
+
+    def follow(self, filename: str, callback=None):
+        """Follow the logs into filename until the PipelineRun has finished
+        and all the containers logs have been read, callback gets called
+        regularly while it runs"""
+        lost_since = None
+        with open(filename, "wb") as writer:
+            while True:
+                finished = self.finished()
+                if finished is None:
+                    if lost_since is None:
+                        lost_since = self.clock()
+                    elif self.clock() - lost_since >= self.lost_timeout:
+                        self.emit(writer, force=True)
+                        raise KubeAPIException(
+                            None, f"{self.lost_reason}, giving up following "
+                            f"the logs after {self.lost_timeout:.0f}s")
+                else:
+                    lost_since = None
+                try:
+                    self.discover()
+                except (KubeAPIException, OSError, ValueError) as error:
+                    print(f"⚠️ Cannot list the pods: {error}")
+                self.emit(writer)
+                if callback:
+                    callback()
+                self.threads = [x for x in self.threads if x.is_alive()]
+                if finished and not self.threads:
+                    break
+                time.sleep(self.poll_interval)
+            self.emit(writer, force=True)
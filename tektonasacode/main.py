@@ -2,29 +2,48 @@
 """
 Tekton as a CODE: Main script
 """
-import json
+import contextlib
 import os
 import random
 import re
+import sqlite3
 import string
+import subprocess
 import sys
 import tempfile
 import time
 import traceback
 
-from tektonasacode import config, github, process_templates, utils
+from tektonasacode import (admission, classifier, clusters, config, event,
+                           github, history, process_templates, metrics,
+                           progress, results, timing, utils,
+                           yamlutil)
+
+
+# The status of the PipelineRuns which have really succeeded, Completed when
+# some tasks have been skipped
+SUCCEEDED_STATUSES = ("Succeeded", "Completed")
 
 
 class TektonAsaCode:
     """Tekton as a Code main class"""
 
     def __init__(self, github_token, github_json):
+        """github_json is the event payload, either already parsed or as a
+        string"""
         self.utils = utils.Utils()
         self.github = github.Github(github_token)
         self.pcs = process_templates.Process(self.github)
+        self.results = results.ResultCache(self.utils)
+        self.history = history.History() if config.HISTORY_DB else None
         self.check_run_id = None
+        self.profile_url = ""
+        self.archive_url = ""
+        self.cluster = None
+        self.log_classifier = None
         self.repo_full_name = ""
-        self.github_json = github_json.replace("\n", " ").replace("\r", " ")
+        self.event_json = github_json if isinstance(
+            github_json, dict) else event.parse(github_json)
         self.console_pipelinerun_link = f"{self.utils.get_openshift_console_url(os.environ.get('TKC_NAMESPACE'))}{os.environ.get('TKC_PIPELINERUN')}/logs/tekton-asa-code"
 
     def github_checkout_pull_request(self, repo_owner_login, repo_html_url,
@@ -57,6 +76,21 @@ class TektonAsaCode:
                 (repo_html_url, pull_request_sha),
             )
 
+    def pull_request_is_relevant(self, pr_event: event.Event) -> bool:
+        """Check the files changed in the pull request against the paths
+        filters of the tekton.yaml from the main branch, we do this before
+        checking out anything"""
+        cfg = yamlutil.load(
+            self.github.get_file_content(
+                pr_event.base_repo_full_name,
+                os.path.join(config.TEKTON_ASA_CODE_DIR, "tekton.yaml")))
+        if not isinstance(cfg, dict) or not (cfg.get('paths')
+                                             or cfg.get('paths_ignore')):
+            return True
+        changed_files = self.github.get_pull_request_files(
+            self.repo_full_name, pr_event.pull_request_number)
+        return self.pcs.match_paths(cfg, changed_files)
+
     def create_temporary_namespace(self, namespace, repo_full_name,
                                    pull_request_number):
         """Create a temporary namespace and labels"""
@@ -72,32 +106,60 @@ class TektonAsaCode:
             f'kubectl label namespace {namespace} tekton.dev/pr="{repo_full_name.replace("/", "-")}-{pull_request_number}"'
         )
 
-    def grab_output(self, namespace):
+    def grab_output(self, namespace, reporter=None):
         """Grab output of the last pipelinerun in a namespace"""
         output_file = tempfile.NamedTemporaryFile(delete=False).name
-        self.utils.stream(
-            f"tkn pr logs -n {namespace} --follow --last",
-            output_file,
-            f"Cannot show Pipelinerun log in {namespace}",
-        )
+        if config.LOG_FOLLOWER == "native":
+            from tektonasacode import logs  # pylint: disable=import-outside-toplevel
+            logs.LogFollower(logs.KubeClient.from_environment(),
+                             namespace).follow(output_file,
+                                               callback=reporter
+                                               and reporter.poll)
+        else:
+            self.utils.stream(
+                f"tkn pr logs -n {namespace} --follow --last",
+                output_file,
+                f"Cannot show Pipelinerun log in {namespace}",
+                callback=reporter and reporter.poll,
+            )
+        if reporter:
+            reporter.flush()
         output = open(output_file).read()
 
-        # TODO: Need a better way!
-        tkn_describe_output = self.utils.execute(
-            f"tkn pr describe -n {namespace} --last").stdout.decode()
-        regexp = re.compile(r"^STARTED\s*DURATION\s*STATUS\n(.*)$",
-                            re.MULTILINE)
-        status = regexp.findall(tkn_describe_output)[0].split(" ")[-1]
-
         pipelinerun_jeez = self.utils.kubectl_get("pipelinerun",
                                                   output_type="json",
                                                   namespace=namespace)
+        if config.LOG_FOLLOWER == "native":
+            status, tkn_describe_output = logs.pipelinerun_status(
+                pipelinerun_jeez['items'][0])
+        else:
+            # TODO: Need a better way!
+            tkn_describe_output = self.utils.execute(
+                f"tkn pr describe -n {namespace} --last").stdout.decode()
+            regexp = re.compile(r"^STARTED\s*DURATION\s*STATUS\n(.*)$",
+                                re.MULTILINE)
+            status = regexp.findall(tkn_describe_output)[0].split(" ")[-1]
         pipelinerun_status = "\n".join(
             self.utils.process_pipelineresult(pipelinerun_jeez['items'][0]))
+        slower_report = self.compare_history(pipelinerun_jeez['items'][0])
+        try:
+            pods = self.utils.kubectl_get("pods",
+                                          namespace=namespace).get('items')
+        except subprocess.CalledProcessError:
+            pods = None
+        timeline = timing.render(
+            timing.analyze(pipelinerun_jeez['items'][0], pods))
+        log_classifier = self.log_classifier or classifier.LogClassifier()
+        with self.phase("log_classification"):
+            classified = log_classifier.classify(output)
 
         report = f"""{pipelinerun_status}
 
-{self.utils.get_errors(output)}
+{slower_report}
+
+{timeline}
+
+{log_classifier.report(classified)}
 
 <details>
  <summary>More detailled status</summary>
@@ -105,47 +167,158 @@ class TektonAsaCode:
 </details>
 
     """
+        if self.profile_url:
+            report += f"\n🔬 [Profile of this run]({self.profile_url})\n"
+        if config.ARCHIVE_URL:
+            with self.phase("archive"):
+                self.archive_url = self.archive_run(
+                    namespace, output_file, pipelinerun_jeez['items'][0])
+        if self.archive_url:
+            report += f"\n🗄️ [Logs and PipelineRun archive]({self.archive_url})\n"
+        if self.cluster:
+            report += f"\n🌍 Ran on the **{self.cluster.name}** cluster\n"
         status_emoji = "❌" if "failed" in status.lower() else "✅"
         report_output = {
             "title": "CI Run: Report",
             "summary": f"{status_emoji} CI has **{status}**",
-            "text": report
+            "text": report,
+            "annotations": self.utils.get_error_annotations(
+                output, config.REPOSITORY_DIR, classified["errors"]),
         }
 
         return status, tkn_describe_output, report_output
 
+    def archive_run(self, namespace, log_file, pipelinerun) -> str:
+        """Archive the logs, the pipelinerun and its taskruns, return the URL
+        of the archive or an empty string if we couldn't"""
+        from tektonasacode import archive  # pylint: disable=import-outside-toplevel
+        try:
+            taskruns = self.utils.kubectl_get("taskrun", namespace=namespace)
+        except subprocess.CalledProcessError:
+            taskruns = {}
+        try:
+            return archive.Archiver(archive.store_from_url(
+                config.ARCHIVE_URL)).archive(
+                    f"{self.repo_full_name}/{namespace}", log_file, {
+                        "pipelinerun": pipelinerun,
+                        "taskruns": taskruns,
+                    })
+        except (archive.ArchiveException, OSError) as error:
+            print(f"⚠️ Cannot archive the run: {error}")
+            return ""
+
+    def wait_for_admission(self, gate, check_run_id, target_url,
+                           ticket) -> bool:
+        """Wait for our turn and some room in the cluster, showing the check
+        run as queued meanwhile"""
+        queued = []
+
+        def on_queued(reason):
+            queued.append(reason)
+            self.github.set_status(self.repo_full_name,
+                                   check_run_id,
+                                   target_url,
+                                   conclusion=None,
+                                   output={
+                                       "title": "CI Run: Queued",
+                                       "summary":
+                                       "⏳ Waiting for room in the cluster",
+                                       "text": reason,
+                                   },
+                                   status="queued")
+
+        admitted = gate.wait(on_queued, ticket=ticket)
+        if admitted and queued:
+            self.github.set_status(self.repo_full_name,
+                                   check_run_id,
+                                   target_url,
+                                   conclusion=None,
+                                   output={
+                                       "title": "CI Run: In Progress",
+                                       "summary": "🏃 CI is starting",
+                                       "text": "",
+                                   },
+                                   status="in_progress")
+        return admitted
+
+    def compare_history(self, pipelinerun) -> str:
+        """Record how long the tasks of the pipelinerun took and report the
+        ones which got slower than usual"""
+        if not self.history:
+            return ""
+        durations = self.utils.task_durations(pipelinerun)
+        pipeline = pipelinerun['metadata'].get('labels', {}).get(
+            'tekton.dev/pipeline', pipelinerun['metadata']['name'])
+        try:
+            slower = self.history.slower(self.repo_full_name, pipeline,
+                                         durations)
+            self.history.record(self.repo_full_name, pipeline, durations)
+        except (sqlite3.Error, OSError) as error:
+            print(f"⚠️ Cannot use the tasks history: {error}")
+            return ""
+        return self.history.report(slower)
+
     def main(self):
         """main function"""
-        jeez = self.github.filter_event_json(json.loads(self.github_json))
-        self.repo_full_name = self.utils.get_key("repository.full_name", jeez)
+        with self.phase("event_filtering"):
+            self.github.load_context(self.event_json)
+            jeez = self.github.filter_event_json(self.event_json)
+            pr_event = event.Event.from_json(jeez)
+        self.repo_full_name = pr_event.repo_full_name
         random_str = "".join(
             random.choices(string.ascii_letters + string.digits, k=2)).lower()
-        pull_request_sha = self.utils.get_key("pull_request.head.sha", jeez)
-        pull_request_number = self.utils.get_key("pull_request.number", jeez)
-        repo_owner_login = self.utils.get_key("repository.owner.login", jeez)
-        repo_html_url = self.utils.get_key("repository.html_url", jeez)
-        namespace = f"pull-{pull_request_number}-{pull_request_sha[:5]}-{random_str}"
+        namespace = f"pull-{pr_event.pull_request_number}-{pr_event.pull_request_sha[:5]}-{random_str}"
 
         # Extras template parameters to add aside of the stuff from json
         parameters_extras = {
-            "revision": pull_request_sha,
-            "repo_url": repo_html_url,
-            "repo_owner": repo_owner_login,
+            "revision": pr_event.pull_request_sha,
+            "repo_url": pr_event.repo_html_url,
+            "repo_owner": pr_event.repo_owner_login,
             "namespace": namespace,
             "openshift_console_pipelinerun_href":
             self.console_pipelinerun_link,
         }
 
-        target_url = self.utils.get_openshift_console_url(namespace)
+        if config.CLUSTERS:
+            with self.phase("cluster_selection"):
+                self.cluster = clusters.ClusterSelector().select(
+                    f"{self.repo_full_name}#{pr_event.pull_request_number}")
+            if self.cluster:
+                print(f"🌍 Running on the {self.cluster.name} cluster")
 
-        check_run = self.github.create_check_run(self.repo_full_name,
-                                                 target_url, pull_request_sha)
+        with self.phase("check_run_creation"):
+            with self.on_cluster():
+                target_url = self.utils.get_openshift_console_url(namespace)
+            check_run = self.github.create_check_run(
+                self.repo_full_name, target_url, pr_event.pull_request_sha)
 
         self.check_run_id = check_run['id']
 
-        self.github_checkout_pull_request(repo_owner_login, repo_html_url,
-                                          pull_request_number,
-                                          pull_request_sha)
+        with self.phase("path_filtering"):
+            relevant = self.pull_request_is_relevant(pr_event)
+        if not relevant:
+            self.github.set_status(
+                self.repo_full_name,
+                check_run['id'],
+                "",
+                conclusion='neutral',
+                status="completed",
+                output={
+                    "title":
+                    "CI Run: Skipped",
+                    "summary":
+                    "Skipping this check 🤷🏻‍♀️",
+                    "text":
+                    "None of the files changed in this pull request match the `paths` or `paths_ignore` of `tekton.yaml`",
+                })
+            print("🙈 No relevant files changed in this pull request")
+            return
+
+        with self.phase("checkout"):
+            self.github_checkout_pull_request(pr_event.repo_owner_login,
+                                              pr_event.repo_html_url,
+                                              pr_event.pull_request_number,
+                                              pr_event.pull_request_sha)
 
         # Exit if there is not tekton directory
         if not os.path.exists(config.TEKTON_ASA_CODE_DIR):
@@ -167,13 +340,15 @@ class TektonAsaCode:
             print("😿 No tekton directory has been found")
             sys.exit(0)
 
-        processed = self.pcs.process_tekton_dir(jeez, parameters_extras)
+        with self.phase("template_processing"):
+            processed = self.pcs.process_tekton_dir(jeez, parameters_extras)
+        self.log_classifier = processed.get('log_classifier')
         if processed['allowed']:
             print(
-                f"✅ User {self.utils.get_key('pull_request.user.login', jeez)} is allowed to run this PR"
+                f"✅ User {pr_event.pull_request_user_login} is allowed to run this PR"
             )
         else:
-            message = f"❌👮‍♂️ Skipping running the CI since the user **{self.utils.get_key('pull_request.user.login', jeez)}** is not in the owner file or section"
+            message = f"❌👮‍♂️ Skipping running the CI since the user **{pr_event.pull_request_user_login}** is not in the owner file or section"
             self.github.set_status(
                 self.repo_full_name,
                 check_run['id'],
@@ -188,47 +363,144 @@ class TektonAsaCode:
             )
             raise Exception(message)
 
-        self.create_temporary_namespace(namespace, self.repo_full_name,
-                                        pull_request_number)
-        self.pcs.apply(processed['templates'], namespace)
-
-        if config.ALLOW_PRERUNS_CMD and 'prerun' in processed:
-            for cmd in processed['prerun']:
-                _, cmd_processed = self.utils.kapply(cmd,
-                                                     jeez,
-                                                     parameters_extras,
-                                                     name="command")
-                print(f"⚙️  Running prerun command {cmd_processed}")
-                self.utils.execute(
-                    cmd_processed,
-                    check_error=f"Cannot run command '{cmd_processed}'")
-
-        time.sleep(2)
+        # Skip the run if the same inputs has already passed, unless the user
+        # explicitly asked for a /retest
+        fingerprint = self.results.fingerprint(
+            processed['templates'], pr_event.pull_request_sha,
+            [namespace, self.console_pipelinerun_link])
+        cached = self.results.get(fingerprint)
+        if cached and not self.github.is_retest_comment(self.event_json):
+            print(f"♻️  Same inputs already passed in {cached['check_run_url']}")
+            self.github.set_status(
+                self.repo_full_name,
+                check_run['id'],
+                cached['target_url'],
+                conclusion="success",
+                output={
+                    "title":
+                    "CI Run: Cached",
+                    "summary":
+                    "✅ CI has already succeeded with the same inputs",
+                    "text":
+                    f"Reusing the result of the [previous run]({cached['check_run_url']}) "
+                    f"from {cached['date']}, comment `{config.COMMENT_RETEST_STRING}` to run it again.",
+                },
+                status="completed")
+            return
 
-        status, describe_output, report_output = self.grab_output(namespace)
-        print(describe_output)
+        # Everything touching the namespace happens on the chosen cluster
+        with self.on_cluster():
+            gate = admission.Admission(self.utils)
+            ticket = f"admission-{namespace}"
+            with self.phase("admission"):
+                admitted = self.wait_for_admission(gate, check_run['id'],
+                                                   target_url, ticket)
+            if not admitted:
+                self.github.set_status(
+                    self.repo_full_name,
+                    check_run['id'],
+                    target_url,
+                    conclusion="neutral",
+                    output={
+                        "title": "CI Run: Not admitted",
+                        "summary": "⌛ There was no room in the cluster",
+                        "text":
+                        f"Waited {int(config.ADMISSION_TIMEOUT)} seconds for some room in the cluster, comment `{config.COMMENT_RETEST_STRING}` to try again.",
+                    },
+                    status="completed")
+                print("⌛ No room in the cluster to run the CI")
+                return
+
+            # Our ticket holds the next runs until our namespace and
+            # PipelineRun are there to be counted
+            try:
+                with self.phase("namespace_creation"):
+                    self.create_temporary_namespace(
+                        namespace, self.repo_full_name,
+                        pr_event.pull_request_number)
+                with self.phase("apply"):
+                    self.pcs.apply(processed['templates'], namespace)
+            finally:
+                gate.release(ticket)
+
+            if config.ALLOW_PRERUNS_CMD and 'prerun' in processed:
+                for cmd in processed['prerun']:
+                    _, cmd_processed = self.utils.kapply(cmd,
+                                                         jeez,
+                                                         parameters_extras,
+                                                         name="command")
+                    print(f"⚙️  Running prerun command {cmd_processed}")
+                    self.utils.execute(
+                        cmd_processed,
+                        check_error=f"Cannot run command '{cmd_processed}'")
+
+            time.sleep(config.PIPELINERUN_START_DELAY)
+
+            reporter = progress.ProgressReporter(self.github, self.utils,
+                                                 self.repo_full_name,
+                                                 check_run["id"], target_url,
+                                                 namespace)
+            with self.phase("log_follow"):
+                status, describe_output, report_output = self.grab_output(
+                    namespace, reporter)
+            print(describe_output)
 
         # Set final status
-        self.github.set_status(
-            self.repo_full_name,
-            check_run["id"],
-            # Only set target_url which goest to the namespace in case of failure,
-            # since we delete the namespace in case of success.
-            ("failed" in status.lower() and target_url
-             or self.console_pipelinerun_link),
-            ("failed" in status.lower() and "failure" or "success"),
-            report_output,
-            status="completed")
+        with self.phase("status_update"):
+            self.github.set_status(
+                self.repo_full_name,
+                check_run["id"],
+                # Only set target_url which goest to the namespace in case of
+                # failure, since we delete the namespace in case of success.
+                ("failed" in status.lower()
+                 and (self.archive_url or target_url)
+                 or self.console_pipelinerun_link),
+                ("failed" in status.lower() and "failure" or "success"),
+                report_output,
+                status="completed")
+
+        # Everything is in the archive, no need to keep the namespace around
+        # even when it has failed.
+        if self.archive_url:
+            with self.phase("cleanup"), self.on_cluster():
+                self.utils.execute(
+                    f"kubectl delete ns {namespace} --wait=false",
+                    f"Cannot delete temporary namespace {namespace}",
+                )
 
         if "failed" in status.lower():
             sys.exit(1)
 
+        # Not a cancelled or an unknown run, which would be reused by all the
+        # next runs with the same inputs
+        if status in SUCCEEDED_STATUSES:
+            self.results.set(
+                fingerprint, {
+                    "check_run_url": check_run.get("html_url", ""),
+                    "target_url": self.console_pipelinerun_link,
+                })
+
+        if self.archive_url:
+            return
+
         # Delete the namespace on success ,since this consumes too much
         # resources to be kept. Maybe do this as variable?
-        self.utils.execute(
-            f"echo kubectl delete ns {namespace}",
-            "Cannot delete temporary namespace {namespace}",
-        )
+        with self.phase("cleanup"), self.on_cluster():
+            self.utils.execute(
+                f"echo kubectl delete ns {namespace}",
+                "Cannot delete temporary namespace {namespace}",
+            )
+
+    def on_cluster(self):
+        """Run the block on the cluster chosen for this run, if any"""
+        if self.cluster:
+            return self.cluster.activate()
+        return contextlib.nullcontext()
+
+    @staticmethod
+    def phase(name: str):
+        """Measure a phase of the run"""
+        return metrics.RECORDER.span(metrics.PHASE, phase=name)
 
     def runwrap(self):
         """Wrap main() and catch errors to report if we can"""
@@ -249,7 +521,12 @@ class TektonAsaCode:
                     output={
                         "title": "CI Run: Failure",
                         "summary": "Tekton asa code has failed 💣",
-                        "text": f'<pre>{"<br/>".join(tracebackerr)}</pre>',
+                        "text": f'<pre>{"<br/>".join(tracebackerr)}</pre>' +
+                        (f"\n🔬 [Profile of this run]({self.profile_url})"
+                         if self.profile_url else ""),
                     },
                     status="completed")
             raise err
+        finally:
+            if self.repo_full_name:
+                metrics.RECORDER.export(repo=self.repo_full_name)
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Record how long things take and export it as metrics"""
+import contextlib
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, Iterator, List, Tuple
+
+from tektonasacode import config
+
+PHASE = "phase"
+EXECUTE = "execute"
+GITHUB_REQUEST = "github_request"
+RENDER = "render"
+
+
+def escape(value: str) -> str:
+    """Escape a Prometheus label value"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace(
+        "\n", "\\n")
+
+
+class Recorder:
+    """Record spans, a span has a kind (phase, execute, github_request,
+    render), some labels and a duration"""
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.spans: List[Tuple[str, Tuple[Tuple[str, str], ...], float]] = []
+
+    def record(self, kind: str, duration: float, **labels: str):
+        """Record a span which has already been measured"""
+        with self.lock:
+            self.spans.append((kind, tuple(sorted(labels.items())), duration))
+
+    @contextlib.contextmanager
+    def span(self, kind: str, **labels: str) -> Iterator[None]:
+        """Measure the block of code, even if it fails"""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.record(kind, self.clock() - start, **labels)
+
+    def summary(self) -> Dict:
+        """Aggregate the spans: phases are summed by name and the calls are
+        summed and counted by their labels"""
+        phases: Dict[str, float] = {}
+        calls: Dict[str, Dict] = {}
+        with self.lock:
+            spans = list(self.spans)
+        for kind, labels, duration in spans:
+            if kind == PHASE:
+                name = dict(labels)["phase"]
+                phases[name] = round(phases.get(name, 0) + duration, 6)
+                continue
+            key = kind + ":" + ",".join(value for _, value in labels)
+            call = calls.setdefault(key, {
+                "kind": kind,
+                "labels": dict(labels),
+                "count": 0,
+                "total": 0.0,
+                "max": 0.0,
+            })
+            call["count"] += 1
+            call["total"] = round(call["total"] + duration, 6)
+            call["max"] = round(max(call["max"], duration), 6)
+        return {"phases": phases, "calls": list(calls.values())}
+
+    def to_json(self) -> str:
+        """The summary as JSON"""
+        return json.dumps(self.summary(), sort_keys=True)
+
+    def to_prometheus(self, **extra_labels: str) -> str:
+        """The summary in the Prometheus text exposition format, which is what
+        the textfile collector and the pushgateway wants"""
+        def labels_str(labels: Dict[str, str]) -> str:
+            labels = dict(extra_labels, **labels)
+            return "{" + ",".join(f'{key}="{escape(value)}"'
+                                  for key, value in sorted(labels.items())) + "}"
+
+        summary = self.summary()
+        lines = [
+            "# HELP tkaac_phase_duration_seconds Duration of a run phase",
+            "# TYPE tkaac_phase_duration_seconds gauge",
+        ]
+        for phase, duration in sorted(summary["phases"].items()):
+            lines.append("tkaac_phase_duration_seconds"
+                         f"{labels_str({'phase': phase})} {duration}")
+        lines += [
+            "# HELP tkaac_call_duration_seconds Duration of commands and "
+            "GitHUB requests",
+            "# TYPE tkaac_call_duration_seconds summary",
+        ]
+        for call in summary["calls"]:
+            labels = labels_str(dict(call["labels"], kind=call["kind"]))
+            lines.append(
+                f"tkaac_call_duration_seconds_sum{labels} {call['total']}")
+            lines.append(
+                f"tkaac_call_duration_seconds_count{labels} {call['count']}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, **extra_labels: str):
+        """Print the summary and write or push the metrics where configured"""
+        print(f"📊 Timings: {self.to_json()}")
+        try:
+            if config.METRICS_JSON_FILE:
+                open(config.METRICS_JSON_FILE, "w").write(self.to_json())
+            if config.METRICS_TEXTFILE:
+                open(config.METRICS_TEXTFILE,
+                     "w").write(self.to_prometheus(**extra_labels))
+        except OSError as error:
+            print(f"⚠️ Cannot write metrics: {error}")
+
+        if config.METRICS_PUSHGATEWAY_URL:
+            request = urllib.request.Request(
+                config.METRICS_PUSHGATEWAY_URL.rstrip('/') +
+                "/metrics/job/tekton-asa-code",
+                data=self.to_prometheus(**extra_labels).encode(),
+                method="PUT",
+                headers={"Content-Type": "text/plain; version=0.0.4"})
+            try:
+                urllib.request.urlopen(request, timeout=10).close()
+            except (urllib.error.URLError, OSError) as error:
+                print(f"⚠️ Cannot push metrics: {error}")
+
+
+# Used everywhere during a run
+RECORDER = Recorder()
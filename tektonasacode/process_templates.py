@@ -13,14 +13,24 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 """Do some processing of the templates"""
+import fnmatch
 import os
 import tempfile
-from typing import Dict
+from typing import Dict, List, Tuple
 
-import yaml
-from tektonbundle import tektonbundle
+from tektonasacode import (bundle, classifier, config, metrics, utils,
+                           yamlutil)
 
-from tektonasacode import config, utils
+# Author associations from the GitHUB API that means the user has already
+# contributed to the repository
+TRUSTED_AUTHOR_ASSOCIATIONS = ("OWNER", "MEMBER", "COLLABORATOR", "CONTRIBUTOR")
+
+# Kinds which needs to be created after the ones of the previous wave,
+# everything else (Secrets, ConfigMaps, Tasks...) goes first.
+APPLY_WAVES = (
+    ("pipeline", ),
+    ("pipelinerun", "taskrun"),
+)
 
 
 class Process:
@@ -31,27 +41,112 @@ class Process:
         self.github = github_cls
         self.checked_repo = config.REPOSITORY_DIR
         self.moulinette = False
+        self.bundle_cache = bundle.BundleCache()
+        # The templates before rendering, for the bundle cache
+        self.sources: Dict[str, str] = {}
+        self.catalog = None
+        if config.CATALOG_SNAPSHOT:
+            from tektonasacode import catalog  # pylint: disable=import-outside-toplevel
+            self.catalog = catalog.CatalogSnapshot(config.CATALOG_SNAPSHOT)
 
-    def apply(self, processed_templates, namespace):
-        """Apply templates from a dict of filename=>content"""
-        for filename in processed_templates:
-            print(f"🌊 Processing {filename} in {namespace}")
-            content = processed_templates[filename]
-            tmpfile = tempfile.NamedTemporaryFile(delete=False).name
-            open(tmpfile, "w").write(content)
+    @staticmethod
+    def plan_apply(
+            processed_templates: Dict[str, str]) -> List[List[Tuple[str, str]]]:
+        """Split every documents of the templates in waves according to their
+        kind, so a Pipeline is always created before the PipelineRun using it"""
+        waves: List[List[Tuple[str, str]]] = [
+            [] for _ in range(len(APPLY_WAVES) + 1)
+        ]
+        for filename, content in processed_templates.items():
+            try:
+                documents = [x for x in yamlutil.load_all(content) if x]
+            except yamlutil.YAMLError:
+                # Let kubectl tell the user what's wrong with it
+                waves[0].append((filename, content))
+                continue
+            for document in documents:
+                kind = str(document.get("kind", "")).lower() if isinstance(
+                    document, dict) else ""
+                wave = next((index + 1
+                             for index, kinds in enumerate(APPLY_WAVES)
+                             if kind in kinds), 0)
+                waves[wave].append((filename, yamlutil.dump(document)))
+        return [wave for wave in waves if wave]
+
+    def _create(self, filename: str, content: str, namespace: str):
+        """Create a single template in a namespace"""
+        print(f"🌊 Processing {filename} in {namespace}")
+        tmpfile = tempfile.NamedTemporaryFile(delete=False).name
+        open(tmpfile, "w").write(content)
+        try:
             self.utils.execute(
                 f"kubectl create -f {tmpfile} -n {namespace}",
                 f"Cannot create {filename} in {namespace}",
             )
+        finally:
             os.remove(tmpfile)
 
+    def apply(self, processed_templates, namespace):
+        """Apply templates from a dict of filename=>content, every wave is
+        created in parallel and we wait for it before starting the next one"""
+        import concurrent.futures  # pylint: disable=import-outside-toplevel
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=config.APPLY_CONCURRENCY) as executor:
+            for wave in self.plan_apply(processed_templates):
+                futures = [
+                    executor.submit(self._create, filename, content, namespace)
+                    for filename, content in wave
+                ]
+                for future in futures:
+                    future.result()
+
+    @staticmethod
+    def match_paths(cfg: Dict, changed_files: List[str]) -> bool:
+        """Check if the changed files are relevant according to the paths and
+        paths_ignore sections of tekton.yaml"""
+        def matches(path, patterns):
+            for pattern in patterns:
+                if pattern.endswith("/"):
+                    pattern += "*"
+                if fnmatch.fnmatchcase(path, pattern):
+                    return True
+            return False
+
+        paths = cfg.get('paths') or []
+        paths_ignore = cfg.get('paths_ignore') or []
+        for changed in changed_files:
+            # Always run when the CI itself has been changed.
+            if changed.startswith(config.TEKTON_ASA_CODE_DIR + "/"):
+                return True
+            if paths and not matches(changed, paths):
+                continue
+            if matches(changed, paths_ignore):
+                continue
+            return True
+        return False
+
+    def _kapply(self, source, jeez, parameters_extras, name=None):
+        """Render a template, remembering its content before rendering when
+        we are going to bundle it"""
+        ret = self.utils.kapply(source, jeez, parameters_extras, name=name)
+        if self.moulinette:
+            if os.path.exists(source):
+                with open(source, encoding="utf-8") as template:
+                    self.sources[ret[0]] = template.read()
+            else:
+                self.sources[ret[0]] = source
+        return ret
+
     def process_owner_section_or_file(self, jeez):
         """Process the owner section from config or a file on the tip branch"""
+        with metrics.RECORDER.span(metrics.PHASE, phase="acl"):
+            return self._process_owner_section_or_file(jeez)
+
+    def _process_owner_section_or_file(self, jeez):
         pr_login = self.utils.get_key("pull_request.user.login", jeez)
         repo_owner = self.utils.get_key("repository.owner.login", jeez)
         owner_repo = self.utils.get_key("pull_request.base.repo.full_name",
                                         jeez)
-        repo_full_name = self.utils.get_key("repository.full_name", jeez)
 
         # Always allow the repo owner to submit.
         if repo_owner == pr_login:
@@ -66,7 +161,7 @@ class Process:
                 if x != ""
             ]
         else:
-            owner_content = yaml.safe_load(
+            owner_content = yamlutil.load(
                 self.github.get_file_content(
                     owner_repo,
                     os.path.join(config.TEKTON_ASA_CODE_DIR, "tekton.yaml")))
@@ -85,14 +180,78 @@ class Process:
                 if owner == pr_login:
                     allowed = True
 
-        if pr_login in self.github.get_repo_contributors(repo_full_name):
+        # The author association tells us already if the user has
+        # contributed to the repo, only ask the API when we don't have it.
+        association = self.utils.get_key("pull_request.author_association",
+                                         jeez,
+                                         error=False)
+        if association:
+            if association in TRUSTED_AUTHOR_ASSOCIATIONS:
+                allowed = True
+        elif pr_login in self.github.get_repo_contributors(
+                self.utils.get_key("repository.full_name", jeez)):
             allowed = True
 
         return allowed
 
+    def get_secrets(self, owner_repo: str,
+                    secrets: List[str]) -> Dict[str, str]:
+        """Get the secrets asked in tekton.yaml as templates, they are all
+        listed in a single call and indexed by name"""
+        owner, repo = owner_repo.split("/")[0], owner_repo.split("/")[1]
+        # Do not pass input from cfg to kubectl_get or this could get
+        # exploited.
+        all_secrets_for_repo = {
+            item['metadata']['name']: item
+            for item in self.utils.kubectl_get(
+                "secret",
+                output_type="json",
+                labels={
+                    "tekton/asa-code-repository-name": repo,
+                    "tekton/asa-code-repository-owner": owner
+                })['items']
+        }
+        return {
+            f"{secret}.secret.yaml": yamlutil.dump(all_secrets_for_repo[secret])
+            for secret in secrets if secret in all_secrets_for_repo
+        }
+
+    def get_task(self, task: str) -> Tuple[str, str]:
+        """Get the URL of a task of tekton.yaml and the file it has been
+        downloaded to, or its content when it comes from the catalog
+        snapshot"""
+        if 'http://' in task or 'https://' in task:
+            return task, self.utils.retrieve_url(task)
+
+        if self.catalog:
+            from tektonasacode import catalog  # pylint: disable=import-outside-toplevel
+            try:
+                found = self.catalog.resolve(task)
+            except catalog.CatalogException as error:
+                print(f"⚠️ {error}, getting {task} from GitHUB")
+                found = None
+            else:
+                if not found:
+                    print(f"⚠️ Task {task} is not in the catalog snapshot, "
+                          "getting it from GitHUB")
+            if found:
+                name, version, content = found
+                return (f"{config.GITHUB_RAW_URL}/{name}/{version}/{name}.yaml",
+                        content)
+
+        if ':' in task and not task.endswith(":latest"):
+            name, version = task.split(":")
+        else:
+            name = task.replace(":latest",
+                                "") if task.endswith(":latest") else task
+            version = self.github.get_task_latest_version(
+                config.TEKTON_CATALOG_REPOSITORY, name)
+        url = f"{config.GITHUB_RAW_URL}/{name}/{version}/{name}.yaml"
+        return url, self.utils.retrieve_url(url)
+
     def process_yaml_ini(self, yaml_file, jeez, parameters_extras):
         """Process yaml ini files"""
-        cfg = yaml.safe_load(open(yaml_file, 'r'))
+        cfg = yamlutil.load(open(yaml_file, 'r'))
         if not cfg:
             return {'allowed': False, 'templates': []}
 
@@ -103,24 +262,16 @@ class Process:
         if 'bundled' in cfg and cfg['bundled']:
             self.moulinette = True
 
+        # Check the patterns now so we fail before creating anything
+        processed['log_classifier'] = classifier.LogClassifier(cfg.get('logs'))
+
         if 'tasks' in cfg:
             for task in cfg['tasks']:
-                if 'http://' in task or 'https://' in task:
-                    url = task
-                else:
-                    if ':' in task and not task.endswith(":latest"):
-                        name, version = task.split(":")
-                    else:
-                        name = task.replace(
-                            ":latest",
-                            "") if task.endswith(":latest") else task
-                        version = self.github.get_task_latest_version(
-                            config.TEKTON_CATALOG_REPOSITORY, name)
-                    url = f"{config.GITHUB_RAW_URL}/{name}/{version}/{name}.yaml"
-                ret = self.utils.kapply(self.utils.retrieve_url(url),
-                                        jeez,
-                                        parameters_extras,
-                                        name=url)
+                url, content = self.get_task(task)
+                ret = self._kapply(content,
+                                   jeez,
+                                   parameters_extras,
+                                   name=url)
                 processed['templates'][ret[0]] = ret[1]
 
         processed['allowed'] = self.process_owner_section_or_file(jeez)
@@ -128,24 +279,8 @@ class Process:
         # Only get secrets that belong to that owner/repo, so malicious user
         # cannot get things they should not.
         if 'secrets' in cfg:
-            # Do not pass input from cfg to kubectl_get or this could get
-            # exploited.
-            all_secrets_for_repo = self.utils.kubectl_get(
-                "secret",
-                output_type="yaml",
-                labels={
-                    "tekton/asa-code-repository-name":
-                    owner_repo.split("/")[1],
-                    "tekton/asa-code-repository-owner":
-                    owner_repo.split("/")[0]
-                })
-            for secret in cfg['secrets']:
-                for allsecretin in all_secrets_for_repo['items']:
-                    secretname = allsecretin['metadata']['name']
-                    if secretname == secret:
-                        processed['templates'][
-                            f"{secretname}.secret.yaml"] = yaml.safe_dump(
-                                allsecretin)
+            processed['templates'].update(
+                self.get_secrets(owner_repo, cfg['secrets']))
 
         # TODO: i don't like this, i probably goign to remove it
         # we just need this temporary because of the operator and
@@ -162,7 +297,7 @@ class Process:
                     raise Exception(
                         f"{filepath} does not exists in {config.TEKTON_ASA_CODE_DIR} directory"
                     )
-                ret = self.utils.kapply(fpath, jeez, parameters_extras)
+                ret = self._kapply(fpath, jeez, parameters_extras)
                 processed['templates'][ret[0]] = ret[1]
         else:
             processed['templates'].update(
@@ -184,33 +319,44 @@ class Process:
                 continue
             filename = os.path.join(self.checked_repo,
                                     config.TEKTON_ASA_CODE_DIR, filename)
-            ret = self.utils.kapply(filename, jeez, parameters_extras)
+            ret = self._kapply(filename, jeez, parameters_extras)
             processed['templates'][ret[0]] = ret[1]
 
         return processed
 
-    def mouline_this(self, templates: Dict[str, str]):  # pylint: disable=no-self-use
-        """Takes the templates"""
-        bundled = []
+    def mouline_this(self, templates: Dict[str, str], resolve=None):
+        """Bundle all the templates in a single PipelineRun, reusing the
+        previous bundle if the templates haven't changed.
+
+        The bundle is made from the templates before rendering, the values
+        which can't change it (i.e: the revision) are put back after so a new
+        push can reuse it."""
         print("🍝 Files bundled: ")
         for template in templates:
-            if template.startswith("https://"):
-                local_path = os.path.join(config.REPOSITORY_DIR,
-                                          config.TEKTON_ASA_CODE_DIR,
-                                          os.path.basename(template))
-                open(local_path, 'w').write(templates[template])
-                bundled.append(local_path)
-                print(" • " +
-                      template.replace(config.GITHUB_RAW_URL + "/", ""))
-            else:
-                print(" • " +
-                      template.replace(config.REPOSITORY_DIR + "/", ""))
-                bundled.append(template)
-        bundled = tektonbundle.parse(bundled, parameters=[], skip_inlining=[])
-        thebundle = f"--- \n{bundled['bundle']}--- \n"
-        thebundle += "--- \n".join(bundled['ignored_not_k8'] +
-                                   bundled['ignored_not_tekton'])
-        return {'bundled-file.yaml': thebundle}
+            print(" • " + template.replace(config.GITHUB_RAW_URL + "/", "").
+                  replace(config.REPOSITORY_DIR + "/", ""))
+
+        sources = {
+            name: self.sources.get(name, content)
+            for name, content in templates.items()
+        }
+        eager, deferred = bundle.split_parameters(
+            sources, resolve or (lambda param: "{{%s}}" % (param)))
+        key = self.bundle_cache.key(sources, eager, deferred)
+        thebundle = self.bundle_cache.get(key)
+        if thebundle:
+            print(f"🍝 Reusing cached bundle {key[:12]}")
+        else:
+            bundled = bundle.parse(sources, {
+                **eager,
+                **{slot: bundle.sentinel(slot)
+                   for slot in deferred}
+            })
+            thebundle = f"--- \n{bundled['bundle']}--- \n"
+            thebundle += "--- \n".join(bundled['ignored_not_k8'] +
+                                       bundled['ignored_not_tekton'])
+            self.bundle_cache.set(key, thebundle)
+        return {'bundled-file.yaml': bundle.put_back(thebundle, deferred)}
 
     def process_tekton_dir(self, jeez, parameters_extras):
         """Apply templates according, check first for tekton.yaml and then
@@ -229,6 +375,8 @@ class Process:
             ret = self.process_all_yaml_in_dir(jeez, parameters_extras)
 
         if self.moulinette and ret['templates']:
-            ret['templates'] = self.mouline_this(ret['templates'])
+            ret['templates'] = self.mouline_this(
+                ret['templates'],
+                self.utils.template_resolver(jeez, parameters_extras))
 
         return ret
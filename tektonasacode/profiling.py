@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Profile a run on demand"""
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from typing import Dict, List, Set, Tuple
+
+from tektonasacode import config
+
+MODES = ("cpu", "alloc")
+# Deeper stacks than this are cut when folding the cpu profile
+MAX_DEPTH = 64
+
+
+def func_name(func: Tuple[str, int, str]) -> str:
+    """Name a function from pstats as file:line(name)"""
+    filename, line, name = func
+    if filename == "~":
+        return name
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def fold_pstats(stats: Dict) -> List[str]:
+    """Fold the pstats call graph into collapsed stacks for flamegraphs.
+
+    cProfile only knows about caller/callee pairs, so the time of a function
+    is split between its callers according to how much of its cumulative time
+    came from each of them.
+
+    A function is only expanded once at a given depth, when we get to it again
+    from another caller its cumulative time is folded in its frame, or the
+    number of stacks would explode with the callers sharing callees."""
+    children: Dict[Tuple, List[Tuple]] = {}
+    for func, (_, _, _, cumulative, callers) in stats.items():
+        for caller, (_, _, _, edge_cumulative) in callers.items():
+            children.setdefault(caller, []).append(
+                (func, edge_cumulative / cumulative if cumulative else 0))
+
+    folded: Dict[str, float] = {}
+    expanded: Set[Tuple[Tuple, int]] = set()
+
+    def walk(func, stack, ratio):
+        stack = stack + [func_name(func)]
+        if len(stack) >= MAX_DEPTH or (func, len(stack)) in expanded:
+            own = stats[func][3] * ratio
+            descend = False
+        else:
+            expanded.add((func, len(stack)))
+            own = stats[func][2] * ratio
+            descend = True
+        if own:
+            key = ";".join(stack)
+            folded[key] = folded.get(key, 0) + own
+        if not descend:
+            return
+        for child, child_ratio in children.get(func, []):
+            if func_name(child) not in stack:
+                walk(child, stack, ratio * child_ratio)
+
+    for func, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            walk(func, [], 1.0)
+
+    return [
+        f"{stack} {int(seconds * 1000000)}"
+        for stack, seconds in sorted(folded.items())
+        if int(seconds * 1000000)
+    ]
+
+
+class Profiler:
+    """Profile what runs inside of it and write the profile in a directory"""
+    def __init__(self,
+                 mode: str,
+                 directory: str = config.PROFILE_DIR,
+                 base_url: str = config.PROFILE_URL,
+                 top: int = config.PROFILE_TOP):
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode}, use one of "
+                             f"{', '.join(MODES)}")
+        self.mode = mode
+        self.directory = directory
+        self.top = top
+        self.name = f"{mode}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.url = f"{base_url.rstrip('/')}/{self.name}.txt" if base_url else ""
+        self.profile = cProfile.Profile() if mode == "cpu" else None
+
+    def path(self, extension: str) -> str:
+        """Path of a profile file"""
+        return os.path.join(self.directory, f"{self.name}.{extension}")
+
+    def __enter__(self) -> "Profiler":
+        if self.profile:
+            self.profile.enable()
+        else:
+            tracemalloc.start(MAX_DEPTH)
+        return self
+
+    def __exit__(self, *_):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.profile:
+            self.profile.disable()
+            self.write_cpu()
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self.write_alloc(snapshot)
+        print(f"🔬 Profile written to {self.path('txt')}")
+
+    def write_cpu(self):
+        """Write the raw pstats, the top functions and the collapsed stacks"""
+        self.profile.dump_stats(self.path("pstats"))
+        text = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=text)
+        stats.sort_stats("cumulative").print_stats(self.top)
+        open(self.path("txt"), "w").write(text.getvalue())
+        open(self.path("collapsed"),
+             "w").write("\n".join(fold_pstats(stats.stats)) + "\n")  # type: ignore
+
+    def write_alloc(self, snapshot: tracemalloc.Snapshot):
+        """Write the top allocation sites and the collapsed allocation stacks"""
+        snapshot = snapshot.filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__), ))
+        lines = [f"Top {self.top} allocation sites:"]
+        for stat in snapshot.statistics("lineno")[:self.top]:
+            lines.append(f"{stat.traceback[0]}: {stat.size} bytes "
+                         f"in {stat.count} blocks")
+        open(self.path("txt"), "w").write("\n".join(lines) + "\n")
+
+        collapsed = []
+        for stat in snapshot.statistics("traceback"):
+            stack = ";".join(f"{os.path.basename(frame.filename)}:{frame.lineno}"
+                             for frame in stat.traceback)
+            collapsed.append(f"{stack} {stat.size}")
+        open(self.path("collapsed"), "w").write("\n".join(collapsed) + "\n")
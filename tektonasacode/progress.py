@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Report the progress of a PipelineRun on the check run while it runs"""
+import subprocess
+import time
+from typing import Dict, List, Optional
+
+from tektonasacode import config, github
+
+
+class ProgressReporter:
+    """Push the task level status of the PipelineRun to the check run.
+
+    Updates are coalesced so we never PATCH the check run more than once every
+    `interval` seconds, flush() sends the last pending update."""
+
+    # pylint: disable=too-many-instance-attributes,too-many-arguments
+    def __init__(self,
+                 github_cls,
+                 utils_cls,
+                 repo_full_name: str,
+                 check_run_id: int,
+                 target_url: str,
+                 namespace: str,
+                 interval: int = config.CHECK_RUN_UPDATE_INTERVAL,
+                 poll_interval: int = config.PROGRESS_POLL_INTERVAL,
+                 clock=time.monotonic):
+        self.github = github_cls
+        self.utils = utils_cls
+        self.repo_full_name = repo_full_name
+        self.check_run_id = check_run_id
+        self.target_url = target_url
+        self.namespace = namespace
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.last_sent: Optional[float] = None
+        self.last_poll: Optional[float] = None
+        self.sent_output: Optional[Dict[str, str]] = None
+        self.pending: Optional[Dict[str, str]] = None
+
+    def poll(self):
+        """Get the PipelineRun from the cluster and report it if it changed,
+        this is meant to be called as often as we like."""
+        now = self.clock()
+        if (self.last_poll is not None
+                and now - self.last_poll < self.poll_interval):
+            return
+        self.last_poll = now
+        try:
+            pipelinerun_jeez = self.utils.kubectl_get("pipelinerun",
+                                                      output_type="json",
+                                                      namespace=self.namespace)
+        except subprocess.CalledProcessError:
+            return
+        if not pipelinerun_jeez or not pipelinerun_jeez.get('items'):
+            return
+        pipelinerun = pipelinerun_jeez['items'][0]
+        if 'status' not in pipelinerun:
+            return
+        self.update(self.utils.process_pipelineresult(pipelinerun))
+
+    def update(self, task_statuses: List[str]):
+        """Queue a new status and send it if we are allowed to"""
+        output = {
+            "title": "CI Run: In Progress",
+            "summary": "🏃 CI is running",
+            "text": "\n".join(task_statuses),
+        }
+        # Nothing new since the last PATCH, drop what we may have queued.
+        self.pending = None if output == self.sent_output else output
+        self.send()
+
+    def flush(self):
+        """Always send the last pending update"""
+        self.send(force=True)
+
+    def send(self, force: bool = False):
+        """PATCH the check run with the pending update unless we already did
+        it recently"""
+        if self.pending is None:
+            return
+        now = self.clock()
+        if (not force and self.last_sent is not None
+                and now - self.last_sent < self.interval):
+            return
+        try:
+            self.github.set_status(self.repo_full_name,
+                                   self.check_run_id,
+                                   self.target_url,
+                                   conclusion=None,
+                                   output=self.pending,
+                                   status="in_progress")
+        except github.GitHUBAPIException as error:
+            print(f"⚠️ Cannot update the check run progress: {error}")
+        self.sent_output = self.pending
+        self.pending = None
+        self.last_sent = now
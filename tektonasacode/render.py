@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Render the {{placeholders}} of the templates, remembering the templates we
+have already seen"""
+import collections
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tektonasacode import config, metrics
+
+PLACEHOLDER_RE = re.compile(r"\{\{([_a-zA-Z0-9\.]*)\}\}")
+# Where a placeholder starts and ends in a template, and its name
+Span = List[Any]
+
+
+class RenderCache:
+    """Templates compiled to their text segments and placeholder slots, keyed
+    by the hash of their content, with the values they have been rendered
+    with last.
+
+    A template seen for the first time is a miss, one rendered again with the
+    same values a hit and gets the same output back, a partial hit when some
+    values have changed (i.e: the revision on a new push) which only joins the
+    segments with the new values.
+
+    The placeholders found in the templates are kept in memory and appended
+    to an index in a directory, every run being a new process the templates
+    compiled by a previous run only need to be cut at the same offsets and are
+    partial hits."""
+    def __init__(self,
+                 max_entries: int = config.RENDER_CACHE_MAX_ENTRIES,
+                 directory: str = config.RENDER_CACHE_DIR,
+                 clock=time.perf_counter):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries: "collections.OrderedDict[str, Dict[str, Any]]" = (
+            collections.OrderedDict())
+        self.spans: Optional[Dict[str, List[Span]]] = None
+        self.stats = {"hit": 0, "partial": 0, "miss": 0}
+
+    @property
+    def index(self) -> str:
+        """The file where we append the placeholders of the templates"""
+        return os.path.join(self.directory, "index.jsonl")
+
+    def _load(self) -> Dict[str, List[Span]]:
+        """Read the placeholders of the templates compiled by the previous
+        runs, compacting the index when it has grown over max_entries"""
+        spans: "collections.OrderedDict[str, List[Span]]" = (
+            collections.OrderedDict())
+        lines = 0
+        try:
+            with open(self.index, encoding="utf-8") as index:
+                for line in index:
+                    lines += 1
+                    try:
+                        key, found = json.loads(line)
+                    except ValueError:
+                        # Cut by a run writing it at the same time
+                        continue
+                    spans[key] = found
+                    spans.move_to_end(key)
+        except OSError:
+            return spans
+
+        if lines > self.max_entries:
+            while len(spans) > self.max_entries:
+                spans.popitem(last=False)
+            try:
+                tmpfile = tempfile.NamedTemporaryFile("w",
+                                                      dir=self.directory,
+                                                      delete=False,
+                                                      encoding="utf-8")
+                with tmpfile:
+                    tmpfile.writelines(
+                        json.dumps([key, found]) + "\n"
+                        for key, found in spans.items())
+                os.replace(tmpfile.name, self.index)
+            except OSError as error:
+                print(f"⚠️ Cannot compact {self.index}: {error}")
+        return spans
+
+    def _store(self, key: str, found: List[Span]):
+        """Append the placeholders of a template to the index"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # A single write in append mode, the runs sharing the directory
+            # don't mix their lines
+            with open(self.index, "a", encoding="utf-8") as index:
+                index.write(json.dumps([key, found]) + "\n")
+        except OSError as error:
+            print(f"⚠️ Cannot cache template in {self.directory}: {error}")
+
+    def compile(self, key: str, content: str) -> Tuple[List[str], str]:
+        """Cut content in its text segments and placeholders, at the offsets
+        in the index when a previous run has compiled it already"""
+        found = None
+        if self.directory:
+            with self.lock:
+                if self.spans is None:
+                    self.spans = self._load()
+                found = self.spans.get(key)
+        outcome = "partial"
+        if found is None:
+            found = [[match.start(), match.end(),
+                      match.group(1)]
+                     for match in PLACEHOLDER_RE.finditer(content)]
+            outcome = "miss"
+            if self.directory:
+                self._store(key, found)
+                with self.lock:
+                    self.spans[key] = found  # type: ignore
+
+        # Odd indexes are the placeholders
+        parts, position = [], 0
+        for start, end, slot in found:
+            parts += [content[position:start], slot]
+            position = end
+        parts.append(content[position:])
+        return parts, outcome
+
+    def render(self, content: str, resolve: Callable[[str], str]) -> str:
+        """Replace the placeholders of content with what resolve gives for
+        them"""
+        start = self.clock()
+        key = hashlib.sha256(content.encode()).hexdigest()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        outcome = "partial"
+        if entry is None:
+            parts, outcome = self.compile(key, content)
+            with self.lock:
+                entry = self.entries.setdefault(
+                    key, {
+                        "parts": parts,
+                        "slots": list(dict.fromkeys(parts[1::2])),
+                        "values": None,
+                        "rendered": "",
+                    })
+                if len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+
+        # Every placeholder is only resolved once
+        values = {slot: resolve(slot) for slot in entry["slots"]}
+        if entry["values"] == values:
+            outcome = "hit"
+            rendered = entry["rendered"]
+        else:
+            parts = list(entry["parts"])
+            parts[1::2] = [values[slot] for slot in parts[1::2]]
+            rendered = "".join(parts)
+            with self.lock:
+                entry["values"], entry["rendered"] = values, rendered
+
+        with self.lock:
+            self.stats[outcome] += 1
+        metrics.RECORDER.record(metrics.RENDER,
+                                self.clock() - start,
+                                cache=outcome)
+        return rendered
+
+
+# Shared by all the renders of the process
+CACHE = RenderCache()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Remember the runs which have succeeded so we don't run them again"""
+import datetime
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+from tektonasacode import config
+
+
+class ResultCache:
+    """Store the successful runs in a ConfigMap keyed by a fingerprint of
+    their inputs"""
+    def __init__(self,
+                 utils_cls,
+                 configmap: str = config.RESULT_CACHE_CONFIGMAP,
+                 namespace: Optional[str] = None):
+        self.utils = utils_cls
+        self.configmap = configmap
+        self.namespace = os.environ.get("TKC_NAMESPACE",
+                                        "") if namespace is None else namespace
+
+    @staticmethod
+    def fingerprint(templates: Dict[str, str], head_sha: str,
+                    volatiles: List[str]) -> str:
+        """Fingerprint the rendered templates and the head SHA.
+
+        The volatiles values (i.e: the random namespace) are different on
+        every run, they are taken out so they don't change the fingerprint"""
+        digest = hashlib.sha256(head_sha.encode())
+        for name in sorted(templates):
+            content = templates[name]
+            for volatile in volatiles:
+                if volatile:
+                    content = content.replace(volatile, "")
+            digest.update(b"\0" + name.encode() + b"\0" + content.encode())
+        return digest.hexdigest()
+
+    def _load(self) -> Tuple[Dict[str, str], str]:
+        """Get the data of the ConfigMap and its resourceVersion"""
+        namespace_str = f"-n {self.namespace}" if self.namespace else ""
+        out = self.utils.execute(
+            f"kubectl get configmap {namespace_str} {self.configmap} -o json")
+        if not out or out.returncode != 0:
+            return ({}, "")
+        configmap = json.loads(out.stdout.decode())
+        return (configmap.get("data") or {},
+                configmap.get("metadata", {}).get("resourceVersion", ""))
+
+    def get(self, fingerprint: str) -> Dict[str, str]:
+        """Get the result of a previous successful run with this fingerprint"""
+        if not self.configmap:
+            return {}
+        try:
+            cached = self._load()[0].get(fingerprint)
+        except ValueError:
+            return {}
+        return json.loads(cached) if cached else {}
+
+    def set(self, fingerprint: str, result: Dict[str, str]):
+        """Remember a successful run, starting again from what is in the
+        ConfigMap when another run has updated it in the meantime"""
+        if not self.configmap:
+            return
+        entry = json.dumps(
+            dict(result,
+                 date=datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%SZ")))
+        for _ in range(config.RESULT_CACHE_CONFLICT_RETRIES):
+            try:
+                data, resource_version = self._load()
+            except ValueError:
+                data, resource_version = {}, ""
+            data[fingerprint] = entry
+            # Only keep the most recent ones
+            if len(data) > config.RESULT_CACHE_MAX_ENTRIES:
+                data = dict(
+                    sorted(data.items(),
+                           key=lambda item: json.loads(item[1]).get("date", ""))
+                    [-config.RESULT_CACHE_MAX_ENTRIES:])
+            if self._store(data, resource_version):
+                return
+        print(f"⚠️ Cannot store the run result in {self.configmap}: "
+              "too many conflicts")
+
+    def _store(self, data: Dict[str, str], resource_version: str) -> bool:
+        """Write the ConfigMap, only if it's still at resource_version or
+        doesn't exist when we don't have one. Return False if it has been
+        changed in the meantime"""
+        metadata = {"name": self.configmap}
+        if resource_version:
+            metadata["resourceVersion"] = resource_version
+        tmpfile = tempfile.NamedTemporaryFile("w", delete=False)
+        with tmpfile:
+            json.dump(
+                {
+                    "apiVersion": "v1",
+                    "kind": "ConfigMap",
+                    "metadata": metadata,
+                    "data": data,
+                }, tmpfile)
+        namespace_str = f"-n {self.namespace}" if self.namespace else ""
+        # Not using apply, the last-applied annotation would double the size
+        # of the ConfigMap. replace fails with a Conflict when the
+        # resourceVersion is not the current one anymore.
+        verb = "replace" if resource_version else "create"
+        try:
+            self.utils.execute(
+                f"kubectl {verb} {namespace_str} -f {tmpfile.name}",
+                check_error=f"Cannot store the run result in {self.configmap}")
+        except subprocess.CalledProcessError as error:
+            output = error.output.decode() if isinstance(
+                error.output, bytes) else str(error.output)
+            # Anything else has already been printed, no point retrying it
+            return "Conflict" not in output and "AlreadyExists" not in output
+        finally:
+            os.remove(tmpfile.name)
+        return True
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""Where the time of a PipelineRun went: critical path, time pending versus
+running and parallelism"""
+import datetime
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+from tektonasacode import utils
+
+TASK_RESULT_RE = re.compile(r"\$\(tasks\.([^.]+)\.results\.")
+TIMELINE_WIDTH = 40
+
+
+def parse_time(value: Optional[str]) -> Optional[datetime.datetime]:
+    """Parse a kubernetes timestamp"""
+    if not value:
+        return None
+    return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%SZ')
+
+
+def duration(seconds: float) -> str:
+    """Human duration"""
+    return str(datetime.timedelta(seconds=int(seconds)))
+
+
+def dependencies(pipelinerun: Dict[str, Any]) -> Optional[Dict[str, List[str]]]:
+    """Get the tasks each task waits for from the pipeline spec, the runAfter
+    and the results of other tasks it uses. None if we don't have the spec"""
+    spec = pipelinerun['status'].get('pipelineSpec')
+    if not spec:
+        return None
+    tasks = spec.get('tasks', [])
+    deps: Dict[str, List[str]] = {}
+    for task in tasks:
+        waits = list(task.get('runAfter', []))
+        waits += TASK_RESULT_RE.findall(
+            json.dumps([task.get('params', []),
+                        task.get('when', [])]))
+        for resource in task.get('resources', {}).get('inputs', []):
+            waits += resource.get('from', [])
+        deps[task['name']] = sorted(set(waits) - {task['name']})
+    # finally tasks wait for all the others
+    for task in spec.get('finally', []):
+        deps[task['name']] = [x['name'] for x in tasks]
+    return deps
+
+
+def analyze(pipelinerun: Dict[str, Any],
+            pods: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Analyze the timings of the tasks of a PipelineRun, the pods (from the
+    PipelineRun namespace) lets us tell how long the tasks waited for a node.
+
+    A task is pending from its start until its first step starts (waiting to
+    be scheduled, pulling images, running the init containers) and running
+    until it completes."""
+    # pylint: disable=too-many-locals
+    pods_by_name = {
+        pod['metadata']['name']: pod
+        for pod in pods or []
+    }
+    pname = pipelinerun['metadata']['name']
+    tasks: Dict[str, Dict[str, Any]] = {}
+    for taskrun_name, taskrun in pipelinerun['status'].get('taskRuns',
+                                                            {}).items():
+        result = taskrun['status']
+        start = parse_time(result.get('startTime'))
+        if not start:
+            continue
+        step_starts = []
+        step_ends = []
+        for step in result.get('steps', []):
+            state = step.get('terminated') or step.get('running') or {}
+            if parse_time(state.get('startedAt')):
+                step_starts.append(parse_time(state.get('startedAt')))
+            if parse_time(state.get('finishedAt')):
+                step_ends.append(parse_time(state.get('finishedAt')))
+        end = parse_time(result.get('completionTime')) or (
+            max(step_ends) if step_ends else None)
+        running_start = min(step_starts) if step_starts else start
+        timings = {
+            "start": start,
+            "running_start": running_start,
+            "end": end,
+            "pending": (running_start - start).total_seconds(),
+            "running": ((end - running_start).total_seconds() if end else 0),
+            "scheduling": None,
+        }
+        pod = pods_by_name.get(result.get('podName', ''))
+        if pod:
+            created = parse_time(pod['metadata'].get('creationTimestamp'))
+            for condition in pod.get('status', {}).get('conditions', []):
+                scheduled = parse_time(condition.get('lastTransitionTime'))
+                if (condition['type'] == 'PodScheduled'
+                        and condition['status'] == 'True' and created
+                        and scheduled):
+                    timings["scheduling"] = (scheduled -
+                                             created).total_seconds()
+        tasks[utils.Utils.pipeline_task_name(pname, taskrun_name,
+                                             taskrun)] = timings
+
+    if not tasks:
+        return {}
+
+    start = parse_time(pipelinerun['status'].get('startTime')) or min(
+        x["start"] for x in tasks.values())
+    ends = [x["end"] for x in tasks.values() if x["end"]]
+    end = parse_time(pipelinerun['status'].get('completionTime')) or (
+        max(ends) if ends else start)
+    wall_clock = max((end - start).total_seconds(), 0)
+
+    # Peak of the tasks running at the same time
+    events = []
+    for timings in tasks.values():
+        if timings["end"]:
+            events += [(timings["running_start"], 1), (timings["end"], -1)]
+    peak = current = 0
+    for _, change in sorted(events, key=lambda event: (event[0], event[1])):
+        current += change
+        peak = max(peak, current)
+
+    running = sum(x["running"] for x in tasks.values())
+    return {
+        "start": start,
+        "wall_clock": wall_clock,
+        "tasks": tasks,
+        "critical_path": critical_path(tasks, dependencies(pipelinerun)),
+        "pending": sum(x["pending"] for x in tasks.values()),
+        "running": running,
+        "parallelism": running / wall_clock if wall_clock else 0,
+        "peak": peak,
+    }
+
+
+def critical_path(tasks: Dict[str, Dict[str, Any]],
+                  deps: Optional[Dict[str, List[str]]]) -> List[str]:
+    """The chain of tasks which gated the end of the PipelineRun: from the
+    task which finished last, go back to the dependency which finished last.
+    Without the dependencies, the one which finished last before it
+    started."""
+    finished = {name: x for name, x in tasks.items() if x["end"]}
+    if not finished:
+        return []
+    current = max(finished, key=lambda name: finished[name]["end"])
+    path = [current]
+    while True:
+        if deps is not None:
+            candidates = [
+                x for x in deps.get(current, [])
+                if x in finished and x not in path
+            ]
+        else:
+            candidates = [
+                x for x in finished if x not in path
+                and finished[x]["end"] <= finished[current]["start"]
+            ]
+        if not candidates:
+            break
+        current = max(candidates, key=lambda name: finished[name]["end"])
+        path.append(current)
+    return list(reversed(path))
+
+
+def render(analysis: Dict[str, Any], width: int = TIMELINE_WIDTH) -> str:
+    """The analysis as a summary and a timeline, ░ is pending and █ running,
+    the tasks on the critical path have a ★"""
+    if not analysis:
+        return ""
+    tasks = analysis["tasks"]
+    scale = width / analysis["wall_clock"] if analysis["wall_clock"] else 0
+
+    def column(when: datetime.datetime) -> int:
+        return min(
+            width,
+            max(0,
+                round((when - analysis["start"]).total_seconds() * scale)))
+
+    path_seconds = sum(tasks[x]["pending"] + tasks[x]["running"]
+                       for x in analysis["critical_path"])
+    summary = (
+        f"⏱️ **{duration(analysis['wall_clock'])}** wall clock, "
+        f"critical path {' → '.join(analysis['critical_path'])} "
+        f"({duration(path_seconds)}), "
+        f"{duration(analysis['pending'])} pending and "
+        f"{duration(analysis['running'])} running, "
+        f"{analysis['parallelism']:.1f} tasks running on average "
+        f"(peak {analysis['peak']})")
+
+    name_width = max(len(name) for name in tasks)
+    lines = []
+    for name, timings in sorted(tasks.items(),
+                                key=lambda item: item[1]["start"]):
+        bar_start = column(timings["start"])
+        bar_running = column(timings["running_start"])
+        bar_end = column(timings["end"]) if timings["end"] else width
+        line = (" " * bar_start + "░" * (bar_running - bar_start) + "█" *
+                max(bar_end - bar_running, 1 if timings["end"] else 0))
+        star = "★" if name in analysis["critical_path"] else " "
+        details = (f"{duration(timings['pending'])} pending, "
+                   f"{duration(timings['running'])} running")
+        if timings["scheduling"] is not None:
+            details += f", {duration(timings['scheduling'])} to schedule"
+        lines.append(f"{star} {name:<{name_width}} "
+                     f"|{line[:width]:<{width}}| {details}")
+    timeline = "\n".join(lines)
+    return f"""{summary}
+
+<details>
+ <summary>Timeline</summary>
+ <pre>{timeline}</pre>
+</details>
+"""
@@ -23,9 +23,12 @@ import sys
 import time
 import urllib.error
 import urllib.request
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional
 
-import yaml
+from tektonasacode import classifier, config, metrics, render, yamlutil
+
+# Something looking like path/to/file.ext:line
+FILE_LINE_RE = re.compile(r"(?P<path>[\w./@+-]+\.\w+):(?P<line>\d+)")
 
 
 # pylint: disable=unnecessary-pass
@@ -42,10 +45,12 @@ class Utils:
         """Execute commmand"""
         result = ""
         try:
-            result = subprocess.run(["/bin/sh", "-c", command],
-                                    stdout=subprocess.PIPE,
-                                    stderr=subprocess.STDOUT,
-                                    check=True)
+            with metrics.RECORDER.span(metrics.EXECUTE,
+                                       name=command.split(" ")[0]):
+                result = subprocess.run(["/bin/sh", "-c", command],
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT,
+                                        check=True)
         except subprocess.CalledProcessError as exception:
             if check_error:
                 print(check_error)
@@ -66,28 +71,64 @@ class Utils:
                 f"• <i>{cond['message']}</i>"
                 for cond in jeez['status']['conditions']
             ]
-        for task in jeez['status']['taskRuns']:
-            result = jeez['status']['taskRuns'][task]['status']
-            elapsed = "N/A"
-            if 'completionTime' in result and 'startTime' in result:
-                elapsed = str(
-                    datetime.datetime.strptime(result['completionTime'],
-                                               '%Y-%m-%dT%H:%M:%SZ') -
-                    datetime.datetime.strptime(result['startTime'],
-                                               '%Y-%m-%dT%H:%M:%SZ'))
+        for task, taskrun in jeez['status']['taskRuns'].items():
+            result = taskrun['status']
+            elapsed = Utils.taskrun_elapsed(result)
+            if elapsed is None:
+                elapsed = "N/A"
             emoji = "✅"
-            for condition in result['conditions']:
-                if condition['status'] != 'True':
+            for condition in result.get('conditions', []):
+                if condition['status'] == 'Unknown':
+                    emoji = "🏃"
+                elif condition['status'] != 'True':
                     emoji = "❌"
 
-            bname = task.replace(pname + '-', '')
-            bname = bname.replace("-" + bname.split("-")[-1], '')
-            ret.append(f"{emoji} {elapsed} {bname}")
+            ret.append(f"{emoji} {elapsed} "
+                       f"{Utils.pipeline_task_name(pname, task, taskrun)}")
         return ret
 
+    @staticmethod
+    def taskrun_elapsed(result) -> Optional[datetime.timedelta]:
+        """How long the taskRun of a status took, None if it hasn't
+        finished"""
+        if 'completionTime' not in result or 'startTime' not in result:
+            return None
+        return (datetime.datetime.strptime(result['completionTime'],
+                                           '%Y-%m-%dT%H:%M:%SZ') -
+                datetime.datetime.strptime(result['startTime'],
+                                           '%Y-%m-%dT%H:%M:%SZ'))
+
+    @staticmethod
+    def pipeline_task_name(pname: str, taskrun_name: str, taskrun) -> str:
+        """Get the name of the task in the pipeline of a taskRun, guess it from
+        the taskRun name when tekton doesn't tell us"""
+        name = taskrun.get('pipelineTaskName')
+        if not name:
+            name = taskrun_name.replace(pname + '-', '')
+            name = name.replace("-" + name.split("-")[-1], '')
+        return name
+
+    @staticmethod
+    def task_durations(jeez) -> Dict[str, float]:
+        """Get the seconds each task of a pipelinerun took, only for the ones
+        which have succeeded"""
+        durations: Dict[str, float] = {}
+        pname = jeez['metadata']['name']
+        for task, taskrun in jeez['status'].get('taskRuns', {}).items():
+            result = taskrun['status']
+            elapsed = Utils.taskrun_elapsed(result)
+            if elapsed is None:
+                continue
+            if not all(condition['status'] == 'True'
+                       for condition in result.get('conditions', [])):
+                continue
+            durations[Utils.pipeline_task_name(
+                pname, task, taskrun)] = elapsed.total_seconds()
+        return durations
+
     def kubectl_get(self,
                     obj: str,
-                    output_type: str = "yaml",
+                    output_type: str = "json",
                     raw: bool = False,
                     namespace: str = "",
                     labels: Optional[dict] = None) -> Dict:
@@ -111,7 +152,7 @@ class Utils:
         if raw or not output_type:
             return out
         if output_type == "yaml":
-            ret = yaml.safe_load(out)
+            ret = yamlutil.load(out)
         if output_type == "json":
             ret = json.loads(out)
 
@@ -144,8 +185,8 @@ class Utils:
 
     # https://stackoverflow.com/a/18422264
     @staticmethod
-    def stream(command, filename, check_error=""):
-        """Stream command"""
+    def stream(command, filename, check_error="", callback=None):
+        """Stream command, callback gets called regularly while it runs"""
         with io.open(filename, "wb") as writer, io.open(filename, "rb",
                                                         0) as reader:
             try:
@@ -156,6 +197,8 @@ class Utils:
 
             while process.poll() is None:
                 sys.stdout.write(reader.read().decode())
+                if callback:
+                    callback()
                 time.sleep(0.5)
             # Read the remaining
             sys.stdout.write(reader.read().decode())
@@ -176,24 +219,52 @@ class Utils:
         return curr
 
     @staticmethod
-    def get_errors(text):
+    def get_errors(text, log_classifier=None):
         """ Get all errors coming from """
-        errorstrings = r"(error|fail(ed)?)"
-        errorre = re.compile("^(.*%s.*)$" % (errorstrings),
-                             re.IGNORECASE | re.MULTILINE)
-        ret = ""
-        for i in errorre.findall(text):
-            i = re.sub(errorstrings, r"**\1**", i[0], flags=re.IGNORECASE)
-            ret += f" * *{i}*\n"
-
-        if not ret:
-            return ""
-        return f"""
-    <details>
-        <summary>Errors detected</summary>
-        <pre>{ret}</pre>
-    </details>
-    """
+        log_classifier = log_classifier or classifier.LogClassifier()
+        return log_classifier.section("errors",
+                                      log_classifier.classify(text)["errors"])
+
+    @staticmethod
+    def get_error_annotations(text: str,
+                              repo_dir: str,
+                              errors: Optional[List[str]] = None) -> List[Dict]:
+        """Get check run annotations for the errors referencing a file:line
+        which exists in the repository, errors are the error lines of the
+        text when it has already been classified"""
+        if errors is None:
+            errors = classifier.LogClassifier().classify(text)["errors"]
+        annotations: List[Dict] = []
+        seen = set()
+        for error in errors:
+            line = error.strip()
+            for match in FILE_LINE_RE.finditer(line):
+                # Logs usually have the full path of where the repo has been
+                # checked out, strip the leading directories until we find the
+                # file in the repository.
+                parts = match.group("path").split("/")
+                path = ""
+                while parts:
+                    candidate = os.path.normpath(os.path.join(*parts))
+                    if not candidate.startswith("..") and os.path.isfile(
+                            os.path.join(repo_dir, candidate)):
+                        path = candidate
+                        break
+                    parts = parts[1:]
+                if not path or (path, match.group("line")) in seen:
+                    continue
+                seen.add((path, match.group("line")))
+                annotations.append({
+                    "path": path,
+                    "start_line": int(match.group("line")),
+                    "end_line": int(match.group("line")),
+                    "annotation_level": "failure",
+                    "title": "Error detected",
+                    "message": line[:1000],
+                })
+                if len(annotations) >= config.MAX_ANNOTATIONS:
+                    return annotations
+        return annotations
 
     def kapply(self, yaml_string_or_file, jeez, parameters_extras, name=None):
         """Apply kubernetes yaml template in a namespace with simple transformations
@@ -205,6 +276,18 @@ class Utils:
         else:
             return ("", "")
 
+        if os.path.exists(yaml_string_or_file) and not name:
+            name = yaml_string_or_file
+
+        return (name,
+                render.CACHE.render(
+                    yaml_string, self.template_resolver(jeez,
+                                                        parameters_extras)))
+
+    def template_resolver(self, jeez,
+                          parameters_extras) -> Callable[[str], str]:
+        """Get what a {{placeholder}} of a template is replaced with, left as
+        is when we don't know it"""
         def tpl_apply(param):
             if param in parameters_extras:
                 return parameters_extras[param]
@@ -213,12 +296,4 @@ class Utils:
 
             return "{{%s}}" % (param)
 
-        if os.path.exists(yaml_string_or_file) and not name:
-            name = yaml_string_or_file
-
-        content = re.sub(
-            r"\{\{([_a-zA-Z0-9\.]*)\}\}",
-            lambda m: tpl_apply(m.group(1)),
-            yaml_string,
-        )
-        return (name, content)
+        return tpl_apply
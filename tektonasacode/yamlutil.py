@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Author: Chmouel Boudjnah <chmouel@chmouel.com>
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+"""YAML loading and dumping, with the libyaml C bindings when we have them"""
+from typing import Any, Iterator, List
+
+import yaml
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeDumper, SafeLoader  # type: ignore
+
+YAMLError = yaml.YAMLError
+
+
+def load(stream) -> Any:
+    """Load a single YAML document from a string or a file"""
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def load_all(stream) -> Iterator[Any]:
+    """Load all YAML documents from a string or a file"""
+    return yaml.load_all(stream, Loader=SafeLoader)
+
+
+def dump(data: Any, **kwargs) -> str:
+    """Dump a document as YAML"""
+    return yaml.dump(data, Dumper=SafeDumper, **kwargs)
+
+
+def dump_all(documents: List[Any], **kwargs) -> str:
+    """Dump documents as a YAML stream"""
+    return yaml.dump_all(documents, Dumper=SafeDumper, **kwargs)
@@ -0,0 +1,240 @@
+"""Test waiting for some room in the cluster"""
+# pylint: disable=too-few-public-methods
+import json
+import subprocess
+
+import pytest
+from tektonasacode import admission, config, utils
+
+
+class FakeUtils(utils.Utils):
+    """A cluster with two nodes and some pods"""
+    namespaces = 3
+
+    @staticmethod
+    def node(cpu, memory, ready="True", unschedulable=False):
+        """A node"""
+        return {
+            "spec": {
+                "unschedulable": unschedulable
+            },
+            "status": {
+                "allocatable": {
+                    "cpu": cpu,
+                    "memory": memory
+                },
+                "conditions": [{
+                    "type": "Ready",
+                    "status": ready
+                }]
+            }
+        }
+
+    @staticmethod
+    def pipelinerun(namespace, succeeded):
+        """A pipelinerun"""
+        return {
+            "metadata": {
+                "namespace": namespace
+            },
+            "status": {
+                "conditions": [{
+                    "type": "Succeeded",
+                    "status": succeeded
+                }]
+            }
+        }
+
+    def execute(self, command, check_error=""):  # pylint: disable=arguments-differ,unused-argument
+        """Answer kubectl"""
+        if " namespace " in command:
+            ret = {
+                "items": [{
+                    "metadata": {
+                        "name": f"pull-{index}"
+                    },
+                    "status": {
+                        "phase": "Active"
+                    }
+                } for index in range(self.namespaces + 1)] + [{
+                    "metadata": {
+                        "name": "pull-terminating"
+                    },
+                    "status": {
+                        "phase": "Terminating"
+                    }
+                }]
+            }
+        elif " pipelineruns " in command:
+            # The last namespace is kept after its run has finished
+            ret = {
+                "items": [
+                    self.pipelinerun(f"pull-{index}", "Unknown")
+                    for index in range(self.namespaces)
+                ] + [
+                    self.pipelinerun(f"pull-{self.namespaces}", "False"),
+                    self.pipelinerun("pull-terminating", "Unknown"),
+                    self.pipelinerun("tekton-asa-code", "Unknown"),
+                ]
+            }
+        elif " node " in command:
+            ret = {
+                "items": [
+                    self.node("4", "16Gi"),
+                    self.node("3500m", "8Gi"),
+                    self.node("64", "1Ti", ready="False"),
+                    self.node("64", "1Ti", unschedulable=True),
+                ]
+            }
+        else:
+            ret = {
+                "items": [{
+                    "spec": {
+                        "containers": [{
+                            "resources": {
+                                "requests": {
+                                    "cpu": "1",
+                                    "memory": "4Gi"
+                                }
+                            }
+                        }, {
+                            "resources": {}
+                        }],
+                        "initContainers": [{
+                            "resources": {
+                                "requests": {
+                                    "cpu": "2",
+                                    "memory": "1Gi"
+                                }
+                            }
+                        }],
+                    }
+                }]
+            }
+        return subprocess.CompletedProcess(command, 0,
+                                           json.dumps(ret).encode())
+
+
+def test_parse_quantity():
+    """Test kubernetes quantities"""
+    assert admission.parse_quantity("500m") == 0.5
+    assert admission.parse_quantity("2Gi") == 2 * 2**30
+    assert admission.parse_quantity("1e3") == 1000
+    assert admission.parse_quantity("1.5k") == 1500
+    assert admission.parse_quantity(4) == 4
+    with pytest.raises(ValueError):
+        admission.parse_quantity("12Zi")
+
+
+def test_check():
+    """Test the reasons we cannot run"""
+    assert admission.Admission(FakeUtils(), max_namespaces=4).check() == ""
+    assert admission.Admission(
+        FakeUtils(), max_namespaces=3).check() == (
+            "3 CI namespaces are running, the maximum is 3")
+
+    # 7.5 cpu and 24Gi on the ready nodes, 2 cpu and 4Gi requested
+    gate = admission.Admission(FakeUtils(), 0, "5", "20Gi")
+    assert gate.headroom() == (5.5, 20 * 2**30)
+    assert gate.check() == ""
+    assert admission.Admission(FakeUtils(), 0, "6",
+                               "0").check().startswith("Only 5.50 cpu")
+    assert admission.Admission(FakeUtils(), 0, "0",
+                               "21Gi").check().startswith("Only 20.00Gi")
+
+
+def test_wait():
+    """Test we back off until there is room or we give up"""
+    now = [0.0]
+    sleeps = []
+    release_after = [3]
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+        if len(sleeps) == release_after[0]:
+            FakeUtils.namespaces = 1
+
+    queued = []
+    gate = admission.Admission(FakeUtils(),
+                               max_namespaces=2,
+                               clock=lambda: now[0],
+                               sleep=sleep)
+    try:
+        assert gate.wait(queued.append, timeout=3600)
+        assert queued == ["3 CI namespaces are running, the maximum is 2"]
+        assert len(sleeps) == 3
+        assert 16 <= sleeps[1] <= 24
+
+        FakeUtils.namespaces = 5
+        release_after[0] = 0
+        sleeps.clear()
+        assert not gate.wait(queued.append, timeout=30)
+        assert sum(sleeps) == pytest.approx(30)
+    finally:
+        FakeUtils.namespaces = 3
+
+    assert admission.Admission(FakeUtils(), 0, "0", "0").wait(None)
+
+
+class QueueUtils(FakeUtils):
+    """Keep the tickets ConfigMaps in memory"""
+    def __init__(self):
+        self.tickets = {}
+
+    def execute(self, command, check_error=""):
+        """Answer the tickets commands"""
+        if "configmap" not in command:
+            return super().execute(command, check_error)
+        name = command.split()[3]
+        if command.startswith("kubectl create configmap"):
+            self.tickets[name] = {
+                "metadata": {
+                    "name": name,
+                    "creationTimestamp": f"2020-01-01T00:00:{len(self.tickets):02d}Z"
+                },
+                "data": {
+                    "heartbeat": command.split("heartbeat=")[1].split()[0]
+                },
+            }
+        elif command.startswith("kubectl patch configmap"):
+            self.tickets[name]["data"] = json.loads(
+                command.split("-p '")[1].rstrip("'"))["data"]
+        elif command.startswith("kubectl delete configmap"):
+            self.tickets.pop(name, None)
+        elif command.startswith("kubectl get"):
+            return subprocess.CompletedProcess(
+                command, 0,
+                json.dumps({
+                    "items": list(self.tickets.values())
+                }).encode())
+        return subprocess.CompletedProcess(command, 0, b"")
+
+
+def test_wait_queue(monkeypatch):
+    """Test the runs are admitted in the order they have been queued"""
+    monkeypatch.setattr(config, "ADMISSION_TICKET_TTL", 300)
+    now = [1000.0]
+    fakeutils = QueueUtils()
+
+    def gate():
+        return admission.Admission(fakeutils,
+                                   max_namespaces=4,
+                                   clock=lambda: now[0],
+                                   sleep=lambda seconds: None,
+                                   queue_namespace="tkaac",
+                                   wall_clock=lambda: now[0])
+
+    # The first run is admitted and holds its ticket until it's released
+    assert gate().wait(None, ticket="first")
+    queued = []
+    assert not gate().wait(queued.append, timeout=0, ticket="second")
+    assert queued == ["Number 2 in the queue of the runs"]
+    assert list(fakeutils.tickets) == ["first"]
+
+    gate().release("first")
+    assert gate().wait(None, ticket="second")
+
+    # A dead run doesn't hold the queue forever
+    now[0] += 301
+    assert gate().wait(None, ticket="third")
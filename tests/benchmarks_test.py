@@ -0,0 +1,17 @@
+"""Test the benchmarks still work"""
+from benchmarks import run
+
+
+def test_benchmarks_quick():
+    """Test all the benchmarks on tiny inputs"""
+    results = run.run_benchmarks(run.QUICK_SIZES, repeat=1)
+    assert sorted(results) == sorted(run.BENCHMARKS)
+
+
+def test_compare():
+    """Test only the benchmarks slower than the tolerance are regressions"""
+    baseline = {"a": {"median": 1.0}, "b": {"median": 1.0}}
+    results = {"a": {"median": 1.4}, "b": {"median": 1.6}, "c": {"median": 9}}
+    regressions = run.compare(results, baseline, 1.5)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("b: 1.600000s is 1.60x")
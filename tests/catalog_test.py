@@ -0,0 +1,127 @@
+"""Test the catalog snapshot"""
+# pylint: disable=redefined-outer-name
+import json
+import os
+import tarfile
+
+import pytest
+from tektonasacode import catalog, config
+from tektonasacode import process_templates as pt
+from tektonasacode import utils
+
+
+@pytest.fixture
+def checkout(tmpdir):
+    """A catalog checkout as it is in a GitHUB tarball"""
+    top = tmpdir.mkdir("tektoncd-catalog-1234abc")
+    for name, version in (("git-clone", "0.2"), ("git-clone", "0.10"),
+                          ("golang-test", "0.1")):
+        top.join("task", name, version, f"{name}.yaml").write(
+            f"name: {name}\nversion: {version}\nrevision: {{{{revision}}}}\n",
+            ensure=True)
+    top.join("task", "git-clone", "0.2", "README.md").write("# git-clone")
+    top.join("README.md").write("# catalog")
+    tarball = str(tmpdir.join("catalog.tar.gz"))
+    with tarfile.open(tarball, "w:gz") as out:
+        out.add(str(top), "tektoncd-catalog-1234abc")
+    return str(top), tarball
+
+
+@pytest.mark.parametrize("output", ["snapshot", "snapshot.tar.gz"])
+def test_build_and_resolve(tmpdir, checkout, output):
+    """Test building a snapshot and getting the tasks from it"""
+    output = str(tmpdir.join(output))
+    assert catalog.build(checkout[1], output, "tektoncd/catalog", "main") == 2
+
+    snapshot = catalog.CatalogSnapshot(output)
+    assert snapshot.index["tasks"]["git-clone"] == {
+        "latest": "0.10",
+        "versions": ["0.2", "0.10"]
+    }
+    name, version, content = snapshot.resolve("git-clone")
+    assert (name, version) == ("git-clone", "0.10")
+    assert "version: 0.10" in content
+    assert snapshot.resolve("git-clone:latest")[1] == "0.10"
+    assert "version: 0.2" in snapshot.resolve("git-clone:0.2")[2]
+    assert snapshot.resolve("git-clone:0.3") is None
+    assert snapshot.resolve("nothere") is None
+
+
+def test_refresh_replaces_snapshot(tmpdir, checkout):
+    """Test refreshing a snapshot from a checkout replaces the previous one"""
+    output = str(tmpdir.join("snapshot"))
+    catalog.build(checkout[0], output, "tektoncd/catalog", "main")
+    os.remove(os.path.join(checkout[0], "task", "golang-test", "0.1",
+                           "golang-test.yaml"))
+    assert catalog.build(checkout[0], output, "tektoncd/catalog", "v1") == 1
+    assert json.load(open(os.path.join(output, "index.json")))["ref"] == "v1"
+    assert not os.path.exists(os.path.join(output, "task", "golang-test"))
+    assert sorted(os.listdir(str(tmpdir))) == [
+        "catalog.tar.gz", "snapshot", "tektoncd-catalog-1234abc"
+    ]
+
+    with pytest.raises(catalog.CatalogException):
+        catalog.build(str(tmpdir.mkdir("empty")), output, "tektoncd/catalog",
+                      "main")
+    with pytest.raises(catalog.CatalogException):
+        assert catalog.CatalogSnapshot(str(tmpdir.join("empty"))).index
+
+
+def test_process_from_snapshot(monkeypatch, tmpdir, checkout):
+    """Test the tasks of tekton.yaml come from the snapshot without going to
+    GitHUB, only the ones it doesn't have"""
+    output = str(tmpdir.join("snapshot.tar.gz"))
+    catalog.build(checkout[1], output, "tektoncd/catalog", "main")
+    monkeypatch.setattr(config, "CATALOG_SNAPSHOT", output)
+
+    class FakeGithub:
+        """Fake Github class"""
+        def get_task_latest_version(self, repo, name):  # pylint: disable=unused-argument,missing-function-docstring,no-self-use
+            return "0.1"
+
+    retrieved = []
+
+    class FakeUtils(utils.Utils):
+        """Fake Utils class"""
+        @staticmethod
+        def retrieve_url(url):
+            retrieved.append(url)
+            return "name: retrieved\n"
+
+    process = pt.Process(FakeGithub())
+    process.utils = FakeUtils()
+    templates = {}
+    for task in ("git-clone", "golang-test:0.1", "buildah:latest"):
+        url, content = process.get_task(task)
+        templates[url] = process.utils.kapply(content, {},
+                                              {"revision": "abc"})[1]
+
+    raw = config.GITHUB_RAW_URL
+    assert templates == {
+        f"{raw}/git-clone/0.10/git-clone.yaml":
+        "name: git-clone\nversion: 0.10\nrevision: abc\n",
+        f"{raw}/golang-test/0.1/golang-test.yaml":
+        "name: golang-test\nversion: 0.1\nrevision: abc\n",
+        f"{raw}/buildah/0.1/buildah.yaml": "name: retrieved\n",
+    }
+    assert retrieved == [f"{raw}/buildah/0.1/buildah.yaml"]
+
+
+@pytest.mark.parametrize("snapshot", ["missing.tar.gz", "corrupt"])
+def test_process_broken_snapshot(monkeypatch, tmpdir, snapshot):
+    """Test the tasks come from GitHUB when the snapshot cannot be used"""
+    tmpdir.mkdir("corrupt").join(catalog.INDEX).write("{not json")
+    monkeypatch.setattr(config, "CATALOG_SNAPSHOT", str(tmpdir.join(snapshot)))
+
+    class FakeUtils(utils.Utils):
+        """Fake Utils class"""
+        @staticmethod
+        def retrieve_url(url):
+            return f"url: {url}\n"
+
+    process = pt.Process(None)
+    process.utils = FakeUtils()
+    raw = config.GITHUB_RAW_URL
+    assert process.get_task("git-clone:0.2") == (
+        f"{raw}/git-clone/0.2/git-clone.yaml",
+        f"url: {raw}/git-clone/0.2/git-clone.yaml\n")
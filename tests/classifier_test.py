@@ -0,0 +1,78 @@
+"""Test classifying the logs"""
+import pytest
+from tektonasacode import classifier
+
+LOGS = """[build : compile] Compiling
+[build : compile] warning: unused variable foo
+[lint : pylint] utils.py:12: Error: bad indentation
+[lint : pylint] Your code has been rated at 9.5/10
+[test : unit] 3 passed, 1 failed in 0.42s
+[test : unit] FAILED tests/foo_test.py::test_bar
+[test : unit] retrying... error ignored\r
+[test : unit] ÉRROR error"""
+
+
+@pytest.mark.parametrize("extra", [[], [r"\d+ passed"]])
+def test_classify(extra):
+    """Test the lines go in the categories of their patterns, literal or
+    not"""
+    log_classifier = classifier.LogClassifier({
+        "warnings": ["warning:"],
+        "tests": ["passed,", "rated at"] + extra,
+        "ignore": ["error ignored"],
+    })
+    assert (log_classifier.literal_scan is None) == bool(extra)
+    assert log_classifier.classify(LOGS) == {
+        "tests": [
+            "[lint : pylint] Your code has been rated at 9.5/10",
+            "[test : unit] 3 passed, 1 failed in 0.42s",
+        ],
+        "errors": [
+            "[lint : pylint] utils.py:12: Error: bad indentation",
+            "[test : unit] FAILED tests/foo_test.py::test_bar",
+            "[test : unit] ÉRROR error",
+        ],
+        "warnings": ["[build : compile] warning: unused variable foo"],
+    }
+
+
+def test_literal_scan_with_unicode():
+    """Test the lowercased logs are not used when they are not aligned with
+    the logs anymore"""
+    log_classifier = classifier.LogClassifier()
+    assert log_classifier.literal_scan is not None
+    assert log_classifier.classify("İİ\nan error\nfine") == {
+        "tests": [],
+        "errors": ["an error"],
+        "warnings": [],
+    }
+
+
+def test_report():
+    """Test the sections of the report"""
+    log_classifier = classifier.LogClassifier({
+        "tests": [r"\d+ passed"],
+        "errors": ["error"],
+    })
+    report = log_classifier.report(log_classifier.classify(LOGS))
+    assert "Tests summary" in report
+    assert "**3 passed**, 1 failed" in report
+    assert "**Error**: bad indentation" in report
+    # failed isn't an error anymore, and there is no warnings patterns
+    assert "FAILED" not in report
+    assert "Warnings" not in report
+
+    assert classifier.LogClassifier({"errors": []}).report(
+        classifier.LogClassifier({"errors": []}).classify(LOGS)) == ""
+
+
+@pytest.mark.parametrize("patterns", [
+    {"errors": ["fail("]},
+    {"fatal": ["panic"]},
+    ["error"],
+    {"errors": ["(?P<a>x)"], "warnings": ["(?P<a>y)"]},
+])
+def test_invalid_patterns(patterns):
+    """Test invalid logs sections are refused"""
+    with pytest.raises(classifier.ClassifierException):
+        classifier.LogClassifier(patterns)
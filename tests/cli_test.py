@@ -0,0 +1,73 @@
+"""Test the command line entry point"""
+import json
+import subprocess
+import sys
+from typing import Dict
+
+import pytest
+from tektonasacode import cli, main
+
+# Microseconds we allow to import everything needed to start the CLI, this is
+# paid on every single event.
+IMPORT_TIME_BUDGET = 250000
+# Modules which are slow to import and only needed on some code paths
+LAZY_MODULES = ("pkg_resources", "tektonbundle", "concurrent.futures")
+
+
+def import_times() -> Dict[str, int]:
+    """Get the cumulative import time of the top level modules imported after
+    the interpreter startup, nested modules are there with 0"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "tektonasacode.cli", "--help"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True).stderr.decode()
+    imported: Dict[str, int] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if name.strip() == "site":
+            imported = {}
+            continue
+        imported[name.strip()] = 0 if name.startswith("  ") else int(
+            cumulative)
+    return imported
+
+
+def test_import_time_budget():
+    """Test the CLI starts under the import time budget"""
+    # The first run may have to compile the bytecode
+    import_times()
+    imported = import_times()
+
+    for module in LAZY_MODULES:
+        assert module not in imported, f"{module} should be imported lazily"
+    total = sum(imported.values())
+    assert total < IMPORT_TIME_BUDGET, f"Importing the CLI took {total}us"
+
+
+@pytest.mark.parametrize("bound", [True, False])
+def test_task_arguments(bound, tmp_path, monkeypatch):
+    """Test the arguments of the task, with or without the payload workspace
+    bound"""
+    payload = {"action": "opened"}
+    runs = []
+
+    class FakeTektonAsaCode:  # pylint: disable=too-few-public-methods
+        """Record what we have been started with"""
+        def __init__(self, github_token, github_json):
+            runs.append((github_token, github_json))
+
+        def runwrap(self):  # pylint: disable=missing-function-docstring
+            pass
+
+    monkeypatch.setattr(main, "TektonAsaCode", FakeTektonAsaCode)
+    if bound:
+        (tmp_path / "github.json").write_text(json.dumps(payload))
+        arguments = [f"--github-json-file={tmp_path}", "", "token"]
+    else:
+        arguments = ["--github-json-file=", json.dumps(payload), "token"]
+    monkeypatch.setattr(sys, "argv", ["tekton-asa-code"] + arguments)
+    cli.run()
+    assert runs == [("token", payload if bound else json.dumps(payload))]
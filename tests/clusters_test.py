@@ -0,0 +1,111 @@
+"""Test spreading the runs over several clusters"""
+import json
+import os
+import subprocess
+
+from tektonasacode import clusters
+
+
+def test_parse_clusters():
+    """Test parsing the clusters and their weight"""
+    assert clusters.parse_clusters("east=3, west,") == [("east", 3.0),
+                                                        ("west", 1.0)]
+    assert clusters.parse_clusters("") == []
+
+
+def test_sticky_and_weighted():
+    """Test a pull request always goes to the same cluster, proportionally to
+    the weights, and removing a cluster only moves its pull requests"""
+    selector = clusters.ClusterSelector([("east", 3), ("west", 1),
+                                         ("north", 0.001)])
+    keys = [f"owner/repo#{i}" for i in range(4000)]
+    chosen = {key: selector.select(key).name for key in keys}
+    assert chosen == {key: selector.select(key).name for key in keys}
+    assert 2800 < list(chosen.values()).count("east") < 3200
+    assert list(chosen.values()).count("north") < 10
+
+    selector = clusters.ClusterSelector([("east", 3), ("north", 0.001)])
+    for key in keys:
+        if chosen[key] == "east":
+            assert selector.select(key).name == "east"
+
+    assert clusters.ClusterSelector([]).select("owner/repo#1") is None
+
+
+def test_load(monkeypatch):
+    """Test choosing the less loaded cluster for its weight"""
+    load = {"east": 5, "west": 2, "down": None}
+
+    def running_namespaces(self):
+        if load[self.name] is None:
+            raise subprocess.CalledProcessError(1, "kubectl")
+        return load[self.name]
+
+    monkeypatch.setattr(clusters.Cluster, "running_namespaces",
+                        running_namespaces)
+    selector = clusters.ClusterSelector([("east", 3), ("west", 1),
+                                         ("down", 100)],
+                                        mode="load")
+    # (5 + 1) / 3 < (2 + 1) / 1
+    assert selector.select("owner/repo#1").name == "east"
+    load["east"] = 9
+    assert selector.select("owner/repo#1").name == "west"
+
+
+def test_running_namespaces(monkeypatch):
+    """Test the namespaces kept after their run has finished don't count"""
+    answers = {
+        "namespace": {
+            "items": [{
+                "metadata": {
+                    "name": name
+                }
+            } for name in ("pull-1", "pull-2", "pull-3")]
+        },
+        "pipelineruns": {
+            "items": [{
+                "metadata": {
+                    "namespace": namespace
+                },
+                "status": {
+                    "conditions": [{
+                        "type": "Succeeded",
+                        "status": status
+                    }] if status else []
+                }
+            } for namespace, status in (
+                ("pull-1", "Unknown"),
+                ("pull-1", "True"),
+                ("pull-2", "True"),
+                ("pull-3", ""),
+                ("other", "Unknown"),
+            )]
+        },
+    }
+    monkeypatch.setattr(
+        clusters.Cluster, "kubectl",
+        lambda self, args: json.dumps(answers[args.split()[1]]))
+    assert clusters.Cluster("east").running_namespaces() == 2
+
+
+def test_activate(monkeypatch):
+    """Test the kubeconfig of the cluster is only used, and only there, in the
+    block"""
+    monkeypatch.setattr(clusters.Cluster, "kubectl",
+                        lambda self, args: f"{self.name}: {args}")
+    monkeypatch.setenv("KUBECONFIG", "/home/kubeconfig")
+    cluster = clusters.Cluster("ctx/east")
+    with cluster.activate():
+        kubeconfig = os.environ["KUBECONFIG"]
+        assert os.path.basename(kubeconfig) == "ctx_east.kubeconfig"
+        with open(kubeconfig, encoding="utf-8") as content:
+            assert content.read() == "ctx/east: config view --minify --flatten"
+        assert oct(os.stat(kubeconfig).st_mode & 0o777) == "0o600"
+    assert os.environ["KUBECONFIG"] == "/home/kubeconfig"
+    # It has the credentials of the cluster in it
+    assert not os.path.exists(os.path.dirname(kubeconfig))
+
+    monkeypatch.delenv("KUBECONFIG")
+    with cluster.activate():
+        pass
+    assert "KUBECONFIG" not in os.environ
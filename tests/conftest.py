@@ -0,0 +1,11 @@
+"""Fixtures shared by all the tests"""
+import pytest
+from tektonasacode import render
+
+
+@pytest.fixture(autouse=True)
+def render_cache(monkeypatch):
+    """Render the templates with a cache of their own, only in memory"""
+    cache = render.RenderCache(directory="")
+    monkeypatch.setattr(render, "CACHE", cache)
+    return cache
@@ -0,0 +1,56 @@
+"""Test reading the GitHUB payload"""
+import io
+import json
+
+from tektonasacode import event
+
+payload = {
+    "repository": {
+        "full_name": "owner/repo",
+        "html_url": "https://github.com/owner/repo",
+        "owner": {
+            "login": "owner"
+        },
+    },
+    "pull_request": {
+        "number": 42,
+        "head": {
+            "sha": "SHA"
+        },
+        "user": {
+            "login": "foo"
+        },
+        "base": {
+            "repo": {
+                "full_name": "owner/repo"
+            }
+        },
+        "body": "Hello\nMoto",
+    },
+}
+
+
+def test_parse_newlines_in_strings():
+    """Test we accept raw newlines inside the strings from Tekton params"""
+    jeez = event.parse(json.dumps(payload).replace("\\n", "\n"))
+    assert jeez["pull_request"]["body"] == "Hello\nMoto"
+
+
+def test_read_sources(tmp_path, monkeypatch):
+    """Test reading from a file, a workspace and stdin"""
+    (tmp_path / event.WORKSPACE_PAYLOAD_FILE).write_text(json.dumps(payload))
+    assert event.read(str(tmp_path / event.WORKSPACE_PAYLOAD_FILE)) == payload
+    assert event.read(str(tmp_path)) == payload
+
+    monkeypatch.setattr("sys.stdin", io.StringIO(json.dumps(payload)))
+    assert event.read("-") == payload
+
+
+def test_event_from_json():
+    """Test extracting what we need from the payload"""
+    pr_event = event.Event.from_json(payload)
+    assert pr_event.repo_full_name == "owner/repo"
+    assert pr_event.pull_request_number == "42"
+    assert pr_event.pull_request_sha == "SHA"
+    assert pr_event.pull_request_user_login == "foo"
+    assert pr_event.base_repo_full_name == "owner/repo"
@@ -0,0 +1,94 @@
+"""Test getting tokens as a GitHUB application"""
+# pylint: disable=redefined-outer-name
+import base64
+import json
+import shutil
+import subprocess
+
+import pytest
+from tektonasacode import github, github_app
+
+
+@pytest.fixture
+def private_key(tmp_path):
+    """Generate a private key"""
+    if not shutil.which("openssl"):
+        pytest.skip("need openssl")
+    key = tmp_path / "private.key"
+    subprocess.run(["openssl", "genrsa", "-out", str(key), "2048"],
+                   stderr=subprocess.DEVNULL,
+                   check=True)
+    return str(key)
+
+
+def test_jwt_signed(private_key, tmp_path):
+    """Test the JWT is signed with the application key"""
+    app = github_app.GithubApp("1234", private_key, clock=lambda: 1000)
+    header, payload, signature = app.jwt().split(".")
+    assert json.loads(base64.urlsafe_b64decode(header + "==")) == {
+        "alg": "RS256",
+        "typ": "JWT"
+    }
+    assert json.loads(base64.urlsafe_b64decode(payload + "==")) == {
+        "iat": 940,
+        "exp": 1540,
+        "iss": "1234"
+    }
+
+    pubkey = tmp_path / "public.key"
+    subprocess.run(
+        ["openssl", "rsa", "-in", private_key, "-pubout", "-out",
+         str(pubkey)],
+        stderr=subprocess.DEVNULL,
+        check=True)
+    (tmp_path / "signature").write_bytes(
+        base64.urlsafe_b64decode(signature + "=" * (-len(signature) % 4)))
+    subprocess.run([
+        "openssl", "dgst", "-sha256", "-verify",
+        str(pubkey), "-signature",
+        str(tmp_path / "signature")
+    ],
+                   input=f"{header}.{payload}".encode(),
+                   stdout=subprocess.DEVNULL,
+                   check=True)
+
+
+def test_installation_token_cached(private_key, tmp_path, monkeypatch):
+    """Test installation tokens are cached until shortly before expiry"""
+    requests = []
+
+    def request(self, method, url, headers=None, data=None, params=None):  # pylint: disable=unused-argument,too-many-arguments
+        requests.append((self.token.count("."), method, url))
+        return (None, {
+            "token": f"token{len(requests)}",
+            "expires_at": "1970-01-01T01:00:00Z"
+        })
+
+    monkeypatch.setattr(github.Github, "request", request)
+    now = [0]
+    app = github_app.GithubApp("1234",
+                               private_key,
+                               cache_dir=str(tmp_path / "cache"),
+                               clock=lambda: now[0])
+    assert app.installation_token("42") == "token1"
+    assert requests == [(2, "POST", "/app/installations/42/access_tokens")]
+
+    # Another run sharing the same cache
+    now[0] = 3000
+    app = github_app.GithubApp("1234",
+                               private_key,
+                               cache_dir=str(tmp_path / "cache"),
+                               clock=lambda: now[0])
+    assert app.installation_token("42") == "token1"
+    assert len(requests) == 1
+
+    # Too close from the expiration
+    now[0] = 3400
+    assert app.installation_token("42") == "token2"
+
+    # Another application sharing the cache doesn't get our token
+    app = github_app.GithubApp("5678",
+                               private_key,
+                               cache_dir=str(tmp_path / "cache"),
+                               clock=lambda: now[0])
+    assert app.installation_token("42") == "token3"
@@ -0,0 +1,204 @@
+"""Test the github operations"""
+# pylint: disable=redefined-outer-name,too-few-public-methods
+import pytest
+from tektonasacode import config, github
+
+event_retest = {
+    "issue": {
+        "number": 42,
+        "user": {
+            "login": "foo"
+        },
+        "pull_request": {
+            "url": "https://api.github.com/repos/owner/repo/pulls/42"
+        },
+    },
+    "comment": {
+        "body": "Hello\n/retest"
+    },
+    "repository": {
+        "full_name": "owner/repo"
+    },
+}
+
+pull_request = {
+    "number": 42,
+    "body": "Hello Moto",
+    "state": "open",
+    "user": {
+        "login": "foo",
+        "id": 1
+    },
+    "head": {
+        "sha": "SHA",
+        "label": "foo:branch",
+        "repo": {
+            "clone_url": "https://github.com/foo/repo.git"
+        },
+    },
+}
+
+graphql_data = {
+    "data": {
+        "repository": {
+            "owners": {
+                "text": "@fakeorg\n"
+            },
+            "tektonyaml": None,
+        },
+        "user": {
+            "organizations": {
+                "nodes": [{
+                    "login": "fakeorg"
+                }]
+            }
+        }
+    }
+}
+
+
+class FakeResponse:
+    """A successful response"""
+    status = 200
+
+
+@pytest.fixture
+def fakegithub():
+    """Github object recording requests instead of doing them"""
+    gh = github.Github("token")
+    gh.requests = []
+
+    def request(method, url, headers=None, data=None, params=None):  # pylint: disable=unused-argument
+        gh.requests.append((method, url))
+        if url == "/graphql":
+            return (None, graphql_data)
+        if url == event_retest["issue"]["pull_request"]["url"]:
+            return (FakeResponse(), pull_request)
+        raise github.GitHUBAPIException(500, "Should not be called")
+
+    gh.request = request
+    return gh
+
+
+def test_load_context_single_query(fakegithub):
+    """Test everything needed to decide if we run comes from one GraphQL
+    query"""
+    fakegithub.load_context(event_retest)
+
+    assert fakegithub.get_file_content(
+        "owner/repo", f"{config.TEKTON_ASA_CODE_DIR}/OWNERS") == b"@fakeorg\n"
+    assert fakegithub.get_file_content(
+        "owner/repo", f"{config.TEKTON_ASA_CODE_DIR}/tekton.yaml") == b""
+    assert fakegithub.check_organization_of_user("fakeorg", "foo")
+    assert not fakegithub.check_organization_of_user("otherorg", "foo")
+    assert fakegithub.requests == [("POST", "/graphql")]
+
+    # The templates get the whole pull request of the REST API
+    jeez = fakegithub.filter_event_json(dict(event_retest))
+    assert jeez["pull_request"] == pull_request
+    assert fakegithub.requests[1] == ("GET", event_retest["issue"]
+                                      ["pull_request"]["url"])
+
+
+def test_load_context_fallback_rest(fakegithub):
+    """Test we fallback to the REST API when GraphQL fails"""
+    def request(method, url, headers=None, data=None, params=None):  # pylint: disable=unused-argument
+        raise github.GitHUBAPIException(502, "Bad Gateway")
+
+    fakegithub.request = request
+    fakegithub.load_context(event_retest)
+    assert not fakegithub.files_cache
+    assert not fakegithub.organizations_cache
+
+    # Not a pull request or a retest, nothing to load
+    fakegithub.load_context({"repository": {}})
+    assert not fakegithub.files_cache
+
+
+def test_load_context_partial_files(fakegithub, monkeypatch):
+    """Test truncated, binary or errored files are left to the REST API"""
+    data = {
+        "repository": {
+            "owners": {
+                "text": "@fakeorg\n" * 10,
+                "isTruncated": True
+            },
+            "tektonyaml": {
+                "text": None,
+                "isTruncated": False
+            },
+        },
+        "user": None,
+    }
+    monkeypatch.setattr(fakegithub, "graphql", lambda *_: data)
+    fakegithub.load_context(event_retest)
+    assert not fakegithub.files_cache
+
+    data["repository"] = None
+    fakegithub.load_context(event_retest)
+    assert not fakegithub.files_cache
+
+
+def test_set_status_annotations_batched(fakegithub, monkeypatch):
+    """Test annotations are sent in batches and capped"""
+    monkeypatch.setattr(config, "MAX_ANNOTATIONS", 120)
+    sent = []
+
+    def request(method, url, headers=None, data=None, params=None):  # pylint: disable=unused-argument
+        sent.append(data)
+        return (None, {})
+
+    fakegithub.request = request
+    annotations = [{
+        "path": "file.py",
+        "start_line": i,
+        "end_line": i,
+        "annotation_level": "failure",
+        "message": "error",
+    } for i in range(200)]
+    fakegithub.set_status("owner/repo",
+                          1,
+                          "",
+                          "failure", {
+                              "title": "CI Run: Report",
+                              "summary": "CI has failed",
+                              "text": "",
+                              "annotations": annotations,
+                          },
+                          status="completed")
+    assert [len(x["output"]["annotations"]) for x in sent] == [50, 50, 20]
+    assert sent[0]["conclusion"] == "failure"
+    assert "conclusion" not in sent[1]
+    assert sent[2]["output"]["annotations"][-1]["start_line"] == 119
+
+
+def test_get_pull_request_files_paginated(fakegithub):
+    """Test we follow the pagination of the pull request files"""
+    def request(method, url, headers=None, data=None, params=None):  # pylint: disable=unused-argument
+        fakegithub.requests.append(params["page"])
+        if params["page"] == 1:
+            return (None, [{"filename": f"file{i}"} for i in range(100)])
+        return (None, [{"filename": "new", "previous_filename": "old"}])
+
+    fakegithub.request = request
+    files = fakegithub.get_pull_request_files("owner/repo", 1)
+    assert len(files) == 102
+    assert files[-2:] == ["new", "old"]
+    assert fakegithub.requests == [1, 2]
+
+
+def test_parse_version():
+    """Test comparing catalog versions"""
+    assert github.parse_version("0.10") > github.parse_version("0.9")
+    assert github.parse_version("1.0") > github.parse_version("0.0")
+    assert github.parse_version("0.1.1") > github.parse_version("0.1")
+
+
+def test_endpoint_name():
+    """Test naming the endpoints for the metrics"""
+    assert github.endpoint_name(
+        "/repos/owner/repo/check-runs/1") == "repos/check-runs"
+    assert github.endpoint_name(
+        "/repos/owner/repo/contents/.tekton/OWNERS") == "repos/contents"
+    assert github.endpoint_name("/graphql") == "graphql"
+    assert github.endpoint_name("/users/foo/orgs") == "users"
@@ -0,0 +1,42 @@
+"""Test the tasks durations history"""
+from tektonasacode import history
+
+
+def test_slower_than_median(tmpdir):
+    """Test we only flag the tasks which got a lot slower"""
+    hist = history.History(str(tmpdir.join("sub", "history.sqlite")))
+    for seconds in (60, 70, 65):
+        hist.record("owner/repo", "pipeline", {"build": seconds, "lint": 10})
+    assert hist.medians("owner/repo", "pipeline", ["build", "lint",
+                                                   "new"]) == {
+                                                       "build": (65, 3),
+                                                       "lint": (10, 3),
+                                                   }
+
+    slower = hist.slower("owner/repo", "pipeline", {
+        "build": 200,
+        "lint": 20,
+        "new": 1000
+    })
+    # lint is twice slower but only by 10 seconds and new has no history
+    assert slower == {"build": (200, 65)}
+    assert hist.report(slower) == (
+        "🐢 **Slower than usual:**\n\n"
+        "• build took 0:03:20 instead of 0:01:05 (3.1x)\n")
+    assert hist.report({}) == ""
+
+    # Not enough runs yet for the other pipelines or repositories
+    assert not hist.slower("owner/repo", "other", {"build": 200})
+    assert not hist.slower("owner/other", "pipeline", {"build": 200})
+
+
+def test_window(tmpdir):
+    """Test we only keep the last runs"""
+    hist = history.History(str(tmpdir.join("history.sqlite")), window=3)
+    for seconds in (1000, 1000, 1000, 10, 20, 30):
+        hist.record("owner/repo", "pipeline", {"build": seconds})
+    assert hist.medians("owner/repo", "pipeline", ["build"]) == {
+        "build": (20, 3)
+    }
+    assert hist.connection.execute(
+        "SELECT COUNT(*) FROM durations").fetchone()[0] == 3
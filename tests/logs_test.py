@@ -0,0 +1,284 @@
+"""Test following the logs through the kubernetes API"""
+# pylint: disable=too-few-public-methods
+import base64
+import http.server
+import os
+import threading
+
+import pytest
+from tektonasacode import logs
+
+
+def pod(name, task, steps):
+    """A pod of a taskRun with its steps, None is a step not started yet"""
+    return {
+        "metadata": {
+            "name": name,
+            "labels": {
+                "tekton.dev/pipelineTask": task
+            }
+        },
+        "status": {
+            "containerStatuses": [{
+                "name": "place-tools",
+                "state": {
+                    "terminated": {}
+                }
+            }] + [{
+                "name": f"step-{step}",
+                "state": state
+            } for step, state in steps]
+        }
+    }
+
+
+class FakeClient:
+    """Two tasks running in parallel"""
+    def __init__(self):
+        self.polls = 0
+
+    def get(self, path, params=None):  # pylint: disable=unused-argument
+        """The PipelineRun finishes at the third poll"""
+        if path.endswith("/pipelineruns"):
+            self.polls += 1
+            status = "True" if self.polls >= 3 else "Unknown"
+            return {
+                "items": [{
+                    "status": {
+                        "conditions": [{
+                            "type": "Succeeded",
+                            "status": status,
+                            "reason": "Succeeded"
+                        }]
+                    }
+                }]
+            }
+        started = self.polls >= 2
+        return {
+            "items": [
+                pod("pod-a", "build", [("compile", {
+                    "terminated": {}
+                })]),
+                pod("pod-b", "test", [("unit", {
+                    "running": {}
+                }), ("e2e", {
+                    "running": {}
+                } if started else {
+                    "waiting": {}
+                })]),
+            ]
+        }
+
+    @staticmethod
+    def lines(path, params):
+        """Logs with timestamps interleaved between the containers"""
+        assert params["follow"] == "true"
+        return {
+            ("pod-a", "step-compile"): [
+                "2020-01-01T00:00:00.1Z compiling",
+                "2020-01-01T00:00:02Z compiled",
+            ],
+            ("pod-b", "step-unit"): [
+                "2020-01-01T00:00:00.05Z running unit tests",
+                "2020-01-01T00:00:00.12Z unit tests error",
+            ],
+            ("pod-b", "step-e2e"): [
+                "2020-01-01T00:00:01.999999999Z e2e",
+            ],
+        }[(path.split("/")[-2], params["container"])]
+
+
+def test_follow_merged(tmpdir):
+    """Test all the steps are streamed and merged in timestamp order"""
+    output = str(tmpdir.join("output"))
+    calls = []
+    logs.LogFollower(FakeClient(), "ns", poll_interval=0,
+                     merge_delay=60).follow(output,
+                                            callback=lambda: calls.append(1))
+    assert open(output).read().splitlines() == [
+        "[test : unit] running unit tests",
+        "[build : compile] compiling",
+        "[test : unit] unit tests error",
+        "[test : e2e] e2e",
+        "[build : compile] compiled",
+    ]
+    assert len(calls) == 3
+
+
+def test_follow_lost(tmpdir):
+    """Test we give up when we cannot get the PipelineRun"""
+    class LostClient:
+        """The API refuses us, then there is no PipelineRun"""
+        def __init__(self):
+            self.polls = 0
+
+        def get(self, path, params=None):  # pylint: disable=unused-argument
+            """Forbidden a few times then nothing"""
+            if not path.endswith("/pipelineruns"):
+                return {"items": []}
+            self.polls += 1
+            if self.polls < 3:
+                raise logs.KubeAPIException(403, "Forbidden")
+            if self.polls == 3:
+                # Seen once, we start counting again
+                return {"items": [{"status": {}}]}
+            return {"items": []}
+
+    # 10 seconds between the polls
+    client = LostClient()
+    with pytest.raises(logs.KubeAPIException) as error:
+        logs.LogFollower(client,
+                         "ns",
+                         poll_interval=0,
+                         clock=lambda: client.polls * 10,
+                         lost_timeout=30).follow(str(tmpdir.join("output")))
+    assert str(error.value) == ("There is no PipelineRun in ns, giving up "
+                                "following the logs after 30s")
+    assert client.polls == 7
+
+
+def test_timestamp_key():
+    """Test sorting the nanoseconds without the trailing zeros"""
+    assert "2020-01-01T00:00:00.1Z" > "2020-01-01T00:00:00.12Z"
+    assert logs.timestamp_key("2020-01-01T00:00:00.1Z") < logs.timestamp_key(
+        "2020-01-01T00:00:00.12Z")
+    assert logs.timestamp_key("2020-01-01T00:00:00.2Z") > logs.timestamp_key(
+        "2020-01-01T00:00:00.12Z")
+    assert logs.timestamp_key("not a timestamp") == ("not a timestamp", 0)
+
+
+def test_pipelinerun_status():
+    """Test getting the status like tkn does"""
+    def pipelinerun(status, reason):
+        return {
+            "status": {
+                "conditions": [{
+                    "type": "Succeeded",
+                    "status": status,
+                    "reason": reason,
+                    "message": "hello"
+                }]
+            }
+        }
+
+    assert logs.pipelinerun_status(pipelinerun("True", "Succeeded")) == (
+        "Succeeded", "Succeeded: hello")
+    assert logs.pipelinerun_status(pipelinerun("False",
+                                               "Failed"))[0] == "Failed"
+    assert logs.pipelinerun_status(pipelinerun(
+        "False", "PipelineRunTimeout"))[0] == "Failed (PipelineRunTimeout)"
+    assert logs.pipelinerun_status(pipelinerun("Unknown",
+                                               "Running"))[0] == "Running"
+    assert logs.pipelinerun_status({})[0] == "Unknown"
+
+
+def test_kubeconfig(tmpdir):
+    """Test using the current context of a kubeconfig"""
+    kubeconfig = tmpdir.join("kubeconfig")
+    kubeconfig.write("""
+current-context: mine
+contexts:
+  - name: other
+    context: {cluster: other, user: other}
+  - name: mine
+    context: {cluster: mine, user: mine}
+clusters:
+  - name: mine
+    cluster:
+      server: https://cluster.example.com:6443/prefix
+      insecure-skip-tls-verify: true
+users:
+  - name: mine
+    user:
+      token: sha256~token
+""")
+    client = logs.KubeClient.from_kubeconfig(str(kubeconfig))
+    assert client.server.netloc == "cluster.example.com:6443"
+    assert client.token == "sha256~token"
+    assert not client.context.check_hostname
+
+    kubeconfig.write("""
+current-context: mine
+contexts: [{name: mine, context: {cluster: nope}}]
+clusters: []
+""")
+    with pytest.raises(logs.KubeAPIException):
+        logs.KubeClient.from_kubeconfig(str(kubeconfig))
+
+
+def test_kubeconfig_data_removed(tmpdir, monkeypatch):
+    """Test the client key from the kubeconfig isn't left on disk"""
+    loaded = []
+
+    class Context:
+        """Check the files exist when they are loaded"""
+        def load_cert_chain(self, cert_file, key_file):  # pylint: disable=missing-function-docstring
+            with open(key_file, "rb") as key:
+                loaded.append((cert_file, key_file, key.read()))
+
+    monkeypatch.setattr(logs.ssl, "create_default_context",
+                        lambda cafile: Context())
+    kubeconfig = tmpdir.join("kubeconfig")
+    kubeconfig.write(f"""
+current-context: mine
+contexts: [{{name: mine, context: {{cluster: mine, user: mine}}}}]
+clusters:
+  - name: mine
+    cluster: {{server: "https://cluster.example.com"}}
+users:
+  - name: mine
+    user:
+      client-certificate-data: {base64.b64encode(b"cert").decode()}
+      client-key-data: {base64.b64encode(b"key").decode()}
+""")
+    logs.KubeClient.from_kubeconfig(str(kubeconfig))
+    cert_file, key_file, key = loaded[0]
+    assert key == b"key"
+    assert not os.path.exists(cert_file)
+    assert not os.path.exists(key_file)
+
+
+def test_in_cluster(tmpdir, monkeypatch):
+    """Test using the service account of the pod"""
+    tmpdir.join("token").write("satoken\n")
+    monkeypatch.setattr(logs, "SERVICE_ACCOUNT_DIR", str(tmpdir))
+    monkeypatch.setenv("KUBERNETES_SERVICE_HOST", "10.0.0.1")
+    monkeypatch.delenv("KUBECONFIG", raising=False)
+    monkeypatch.setattr(logs.ssl, "create_default_context",
+                        lambda cafile: base64)
+    client = logs.KubeClient.from_environment()
+    assert client.server.netloc == "10.0.0.1:443"
+    assert client.token == "satoken"
+
+
+def test_client_get_and_lines():
+    """Test talking to the API"""
+    class Handler(http.server.BaseHTTPRequestHandler):
+        """Answer with the path and the authorization"""
+        def do_GET(self):  # pylint: disable=invalid-name
+            """Reply"""
+            body = (f'{{"path": "{self.path}", '
+                    f'"auth": "{self.headers["Authorization"]}"}}\nline2\n')
+            self.send_response(404 if "missing" in self.path else 200)
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+    server = http.server.HTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = logs.KubeClient(
+            f"http://127.0.0.1:{server.server_address[1]}/prefix",
+            token="token")
+        lines = list(client.lines("/log", {"follow": "true"}))
+        assert lines == [
+            '{"path": "/prefix/log?follow=true", "auth": "Bearer token"}',
+            "line2"
+        ]
+        with pytest.raises(logs.KubeAPIException) as error:
+            client.get("/missing")
+        assert error.value.status == 404
+    finally:
+        server.shutdown()
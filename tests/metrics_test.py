@@ -0,0 +1,62 @@
+"""Test the timings recorder"""
+import json
+
+import pytest
+from tektonasacode import config, metrics
+
+
+class FakeClock:
+    """A clock moving one second every time we look at it"""
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+def test_spans_summary():
+    """Test spans are recorded and aggregated"""
+    recorder = metrics.Recorder(clock=FakeClock())
+    with recorder.span(metrics.PHASE, phase="apply"):
+        pass
+    with pytest.raises(ValueError):
+        with recorder.span(metrics.PHASE, phase="apply"):
+            raise ValueError("boom")
+    recorder.record(metrics.EXECUTE, 0.5, name="kubectl")
+    recorder.record(metrics.EXECUTE, 1.5, name="kubectl")
+    recorder.record(metrics.EXECUTE, 2, name="git")
+
+    summary = recorder.summary()
+    assert summary["phases"] == {"apply": 2}
+    kubectl = [x for x in summary["calls"] if x["labels"]["name"] == "kubectl"]
+    assert kubectl == [{
+        "kind": "execute",
+        "labels": {
+            "name": "kubectl"
+        },
+        "count": 2,
+        "total": 2.0,
+        "max": 1.5,
+    }]
+
+
+def test_export(tmp_path, monkeypatch):
+    """Test writing the JSON summary and the Prometheus textfile"""
+    monkeypatch.setattr(config, "METRICS_JSON_FILE", str(tmp_path / "m.json"))
+    monkeypatch.setattr(config, "METRICS_TEXTFILE", str(tmp_path / "m.prom"))
+    recorder = metrics.Recorder()
+    recorder.record(metrics.PHASE, 3, phase="checkout")
+    recorder.record(metrics.GITHUB_REQUEST,
+                    0.25,
+                    method="GET",
+                    endpoint="repos/contents")
+    recorder.export(repo='owner/"repo"')
+
+    assert json.load(open(tmp_path / "m.json"))["phases"] == {"checkout": 3}
+    prom = open(tmp_path / "m.prom").read()
+    assert ('tkaac_phase_duration_seconds{phase="checkout",'
+            'repo="owner/\\"repo\\""} 3') in prom
+    assert ('tkaac_call_duration_seconds_count{endpoint="repos/contents",'
+            'kind="github_request",method="GET",repo="owner/\\"repo\\""} 1'
+            ) in prom
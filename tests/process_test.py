@@ -6,7 +6,7 @@ import os
 from typing import Optional
 
 import pytest
-from tektonasacode import config
+from tektonasacode import bundle, classifier, config
 from tektonasacode import process_templates as pt
 from tektonasacode import utils
 
@@ -15,6 +15,7 @@ github_json_pr = {
         'user': {
             'login': 'foo',
         },
+        'author_association': 'NONE',
         "base": {
             "repo": {
                 "full_name": "https://github.com/border/land"
@@ -263,3 +264,173 @@ def test_process_yaml_ini(tmp_path, fixtrepo):
     assert list(processed['templates'])[4] == "shuss.secret.yaml"
     assert os.path.basename(list(
         processed['templates'])[5]) == "pr_use_me.yaml"
+    assert processed['log_classifier'].classify("an error")["errors"]
+
+    tektonyaml.write_text("""---
+    logs:
+      errors:
+        - "fail("
+    """)
+    with pytest.raises(classifier.ClassifierException):
+        process.process_yaml_ini(tektonyaml, github_json_pr, {})
+
+
+def test_process_allowed_author_association(fixtrepo):
+    """Allowed user via the author association of the pull request"""
+    class FakeGithub:
+        """Fake Github Class"""
+        def get_file_content(self, owner_repo, path):  # pylint: disable=unused-argument,missing-function-docstring,no-self-use
+            return b''
+
+    process = pt.Process(FakeGithub())
+    process.checked_repo = fixtrepo
+
+    jeez = copy.deepcopy(github_json_pr)
+    jeez['pull_request']['author_association'] = 'CONTRIBUTOR'
+    ret = process.process_tekton_dir(jeez, {})
+    assert ret["allowed"]
+
+
+def test_apply_waves(fixtrepo):
+    """Test the templates are applied by kind ordered waves"""
+    class FakeUtils(utils.Utils):
+        """Record what we create"""
+        created = []
+
+        def execute(self, command, check_error=""):  # pylint: disable=arguments-differ
+            self.created.append(open(command.split()[3]).read())
+
+    templates = {
+        "1-run.yaml":
+        "---\nkind: PipelineRun\nmetadata:\n  name: run\n",
+        "2-all.yaml":
+        "---\nkind: Pipeline\nmetadata:\n  name: pipeline\n"
+        "---\nkind: Task\nmetadata:\n  name: task\n",
+        "3-secret.yaml":
+        "---\nkind: Secret\nmetadata:\n  name: secret\n",
+        "4-broken.yaml":
+        "foo: {{bar\n",
+    }
+    process = pt.Process(None)
+    process.checked_repo = fixtrepo
+    waves = process.plan_apply(templates)
+    assert [[filename for filename, _ in wave]
+            for wave in waves] == [["2-all.yaml", "3-secret.yaml", "4-broken.yaml"],
+                                   ["2-all.yaml"], ["1-run.yaml"]]
+
+    process.utils = FakeUtils()
+    process.apply(templates, "namespace")
+    assert "PipelineRun" in process.utils.created[-1]
+    assert "kind: Pipeline\n" in process.utils.created[-2]
+
+
+def test_moulinette_cached(fixtrepo, tmp_path, monkeypatch):
+    """Test bundling is done in memory and reused when nothing changed"""
+    process = pt.Process(None)
+    process.bundle_cache = bundle.BundleCache(str(tmp_path))
+    templates = {
+        str(path): path.read()
+        for path in (fixtrepo / config.TEKTON_ASA_CODE_DIR).listdir()
+    }
+    ret = process.mouline_this(templates)
+    assert "generateName: pipelinespec-taskspecs-embedded-" in ret[
+        'bundled-file.yaml']
+    assert "image: scratch2" in ret['bundled-file.yaml']
+    assert "taskRef" not in ret['bundled-file.yaml']
+
+    def parse(*_):
+        raise Exception("Should have been cached")
+
+    monkeypatch.setattr(bundle, "parse", parse)
+    assert process.mouline_this(templates) == ret
+
+
+def test_moulinette_cached_new_revision(tmp_path, monkeypatch):
+    """Test a new push reuses the bundle, only putting back the revision"""
+    process = pt.Process(None)
+    process.bundle_cache = bundle.BundleCache(str(tmp_path))
+    templates = {
+        "run.yaml":
+        """---
+apiVersion: tekton.dev/v1beta1
+kind: PipelineRun
+metadata:
+  name: run
+spec:
+  pipelineSpec:
+    tasks:
+      - name: build
+        params:
+          - name: revision
+            value: {{revision}}
+          - name: title
+            value: "{{title}}"
+        taskSpec:
+          steps:
+            - name: build
+              image: scratch
+""",
+    }
+    values = {"revision": "abc123", "title": "Hello: Moto"}
+    ret = process.mouline_this(templates, values.get)
+    assert "value: abc123" in ret['bundled-file.yaml']
+    assert "value: 'Hello: Moto'" in ret['bundled-file.yaml']
+
+    def parse(*_):
+        raise Exception("Should have been cached")
+
+    monkeypatch.setattr(bundle, "parse", parse)
+    values["revision"] = "def456"
+    ret = process.mouline_this(templates, values.get)
+    assert "value: def456" in ret['bundled-file.yaml']
+
+    # The title goes in the bundle before it's made
+    values["title"] = "Hello"
+    with pytest.raises(Exception, match="Should have been cached"):
+        process.mouline_this(templates, values.get)
+
+
+def test_match_paths():
+    """Test the paths and paths_ignore filters"""
+    cfg = {'paths': ['src/', '*.py'], 'paths_ignore': ['docs/*', '*.md']}
+    assert pt.Process.match_paths(cfg, ['README.md', 'src/main.go'])
+    assert pt.Process.match_paths(cfg, ['tests/foo_test.py'])
+    assert not pt.Process.match_paths(cfg, ['README.md', 'docs/index.rst'])
+    assert not pt.Process.match_paths(cfg, ['Makefile'])
+    assert not pt.Process.match_paths(cfg, [])
+    # Changes to the CI are always relevant
+    assert pt.Process.match_paths(
+        cfg, [f"{config.TEKTON_ASA_CODE_DIR}/pipeline.yaml"])
+    assert pt.Process.match_paths({'paths_ignore': ['*.md']},
+                                  ['README.md', 'setup.py'])
+
+
+def test_get_secrets_single_list():
+    """Test the secrets come from a single list of the repository secrets"""
+    class FakeUtils:
+        """List the secrets of the repository"""
+        def __init__(self):
+            self.calls = []
+
+        def kubectl_get(self, obj, output_type="json", labels=None):  # pylint: disable=unused-argument,missing-function-docstring
+            self.calls.append(labels)
+            return {
+                "items": [{
+                    "metadata": {
+                        "name": "shuss",
+                    }
+                }, {
+                    "metadata": {
+                        "name": "unasked",
+                    }
+                }]
+            }
+
+    process = pt.Process(None)
+    process.utils = FakeUtils()
+    templates = process.get_secrets("owner/repo", ["shuss", "other"])
+    assert list(templates) == ["shuss.secret.yaml"]
+    assert process.utils.calls == [{
+        "tekton/asa-code-repository-name": "repo",
+        "tekton/asa-code-repository-owner": "owner"
+    }]
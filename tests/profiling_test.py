@@ -0,0 +1,64 @@
+"""Test the profiling hook"""
+import os
+
+import pytest
+from tektonasacode import profiling
+
+
+def work():
+    """Something to profile"""
+    return sorted([str(x) * 10 for x in range(20000)])
+
+
+def test_cpu_profile(tmp_path):
+    """Test the cpu profile files are written"""
+    with profiling.Profiler("cpu", str(tmp_path),
+                            base_url="https://artifacts/") as profiler:
+        work()
+    assert profiler.url == f"https://artifacts/{profiler.name}.txt"
+    for extension in ("pstats", "txt", "collapsed"):
+        assert os.path.exists(profiler.path(extension))
+    collapsed = open(profiler.path("collapsed")).read().splitlines()
+    assert any("profiling_test.py" in line and "(work)" in line
+               for line in collapsed)
+    for line in collapsed:
+        assert int(line.rsplit(" ", 1)[1]) > 0
+
+
+def test_alloc_profile(tmp_path):
+    """Test the allocation profile files are written"""
+    with profiling.Profiler("alloc", str(tmp_path)) as profiler:
+        keep = work()
+    assert keep
+    assert profiler.url == ""
+    top = open(profiler.path("txt")).read()
+    assert "profiling_test.py" in top
+    assert "profiling_test.py" in open(profiler.path("collapsed")).read()
+
+
+def test_fold_pstats_fan_in():
+    """Test folding doesn't walk every path when callers share callees"""
+    # Two functions per layer, both calling the two of the next layer
+    layers = 40
+    stats = {}
+    for layer in range(layers):
+        cumulative = 0.5 * (layers - layer)
+        for column in range(2):
+            callers = {} if not layer else {
+                ("mod.py", layer - 1, f"f{layer - 1}_{caller}"):
+                (1, 1, 0.25, cumulative / 2)
+                for caller in range(2)
+            }
+            stats[("mod.py", layer, f"f{layer}_{column}")] = (2, 2, 0.5,
+                                                              cumulative,
+                                                              callers)
+    folded = profiling.fold_pstats(stats)
+    total = sum(int(line.rsplit(" ", 1)[1]) for line in folded)
+    # Every function took 0.5s by itself
+    assert total == pytest.approx(layers * 2 * 500000, rel=0.01)
+
+
+def test_unknown_mode():
+    """Test we refuse unknown modes"""
+    with pytest.raises(ValueError):
+        profiling.Profiler("gpu")
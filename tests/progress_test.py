@@ -0,0 +1,101 @@
+"""Test the check run progress reporter"""
+# pylint: disable=too-few-public-methods
+from tektonasacode import progress, utils
+
+
+class FakeGithub:
+    """Record the check run updates"""
+    def __init__(self):
+        self.updates = []
+
+    def set_status(  # pylint: disable=unused-argument,too-many-arguments
+            self, repo, check_run_id, target_url, conclusion, output, status):
+        """Record a status"""
+        self.updates.append((status, conclusion, output["text"]))
+
+
+class FakeClock:
+    """A clock we can move forward ourselves"""
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_progress_debounced_and_flushed():
+    """Test updates are coalesced and the last one is always sent"""
+    fakegithub = FakeGithub()
+    clock = FakeClock()
+    reporter = progress.ProgressReporter(fakegithub,
+                                         None,
+                                         "owner/repo",
+                                         1,
+                                         "",
+                                         "ns",
+                                         interval=10,
+                                         clock=clock)
+
+    reporter.update(["🏃 N/A task1"])
+    clock.now = 1
+    reporter.update(["✅ 0:00:01 task1", "🏃 N/A task2"])
+    clock.now = 2
+    reporter.update(["✅ 0:00:01 task1", "✅ 0:00:01 task2"])
+    assert fakegithub.updates == [("in_progress", None, "🏃 N/A task1")]
+
+    reporter.flush()
+    assert len(fakegithub.updates) == 2
+    assert fakegithub.updates[-1][2] == "✅ 0:00:01 task1\n✅ 0:00:01 task2"
+
+    # Nothing pending, nothing to flush
+    reporter.flush()
+    clock.now = 20
+    reporter.update(["✅ 0:00:01 task1", "✅ 0:00:01 task2"])
+    assert len(fakegithub.updates) == 2
+
+
+def test_progress_poll_pipelinerun():
+    """Test polling the pipelinerun reports task status"""
+    class FakeUtils:
+        """Fake utils returning a running pipelinerun"""
+        calls = 0
+
+        def kubectl_get(self, obj, output_type, namespace):  # pylint: disable=unused-argument,missing-function-docstring
+            self.calls += 1
+            return {
+                "items": [{
+                    "metadata": {
+                        "name": "pr"
+                    },
+                    "status": {
+                        "taskRuns": {
+                            "pr-task1-abcd": {
+                                "status": {
+                                    "conditions": [{
+                                        "status": "Unknown"
+                                    }]
+                                }
+                            }
+                        }
+                    }
+                }]
+            }
+
+        process_pipelineresult = staticmethod(
+            utils.Utils.process_pipelineresult)
+
+    fakegithub = FakeGithub()
+    clock = FakeClock()
+    fakeutils = FakeUtils()
+    reporter = progress.ProgressReporter(fakegithub,
+                                         fakeutils,
+                                         "owner/repo",
+                                         1,
+                                         "",
+                                         "ns",
+                                         poll_interval=5,
+                                         clock=clock)
+    reporter.poll()
+    reporter.poll()
+    assert fakeutils.calls == 1
+    assert fakegithub.updates == [("in_progress", None, "🏃 N/A task1")]
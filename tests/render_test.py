@@ -0,0 +1,100 @@
+"""Test rendering the templates"""
+import types
+
+from tektonasacode import metrics, render, utils
+
+TEMPLATE = """name: {{name}}
+revision: {{revision}}
+again: {{revision}}
+unknown: {{not.there}}
+"""
+
+
+def test_render_stats():
+    """Test the templates are compiled once and only rendered again when the
+    values have changed"""
+    cache = render.RenderCache()
+    resolved = []
+    values = {"name": "foo", "revision": "abc"}
+
+    def resolve(slot):
+        resolved.append(slot)
+        return values.get(slot, "{{%s}}" % slot)
+
+    expected = """name: foo
+revision: abc
+again: abc
+unknown: {{not.there}}
+"""
+    assert cache.render(TEMPLATE, resolve) == expected
+    assert cache.render(TEMPLATE, resolve) == expected
+    values["revision"] = "def"
+    assert cache.render(TEMPLATE, resolve) == expected.replace("abc", "def")
+    assert cache.render("no placeholders", resolve) == "no placeholders"
+    assert cache.stats == {"hit": 1, "partial": 1, "miss": 2}
+    # Every placeholder only gets resolved once for each render
+    assert resolved == ["name", "revision", "not.there"] * 3
+
+
+def test_render_eviction():
+    """Test we only keep the templates used last"""
+    cache = render.RenderCache(max_entries=2)
+    for content in ("a {{x}}", "b {{x}}", "a {{x}}", "c {{x}}", "a {{x}}",
+                    "b {{x}}"):
+        cache.render(content, lambda slot: "1")
+    assert cache.stats == {"hit": 2, "partial": 0, "miss": 4}
+    assert len(cache.entries) == 2
+
+
+def test_render_persisted(tmp_path, monkeypatch):
+    """Test the next runs reuse the templates compiled by the previous ones
+    and only render their slots"""
+    values = {"name": "foo", "revision": "abc", "not.there": "{{not.there}}"}
+    cache = render.RenderCache(directory=str(tmp_path))
+    cache.render(TEMPLATE, values.get)
+    assert cache.stats["miss"] == 1
+
+    def finditer(_):
+        """Make sure we don't look for the placeholders again"""
+        raise AssertionError("Should have been compiled already")
+
+    # A new run, for a new push
+    monkeypatch.setattr(render, "PLACEHOLDER_RE",
+                        types.SimpleNamespace(finditer=finditer))
+    values["revision"] = "def"
+    cache = render.RenderCache(directory=str(tmp_path))
+    assert cache.render(TEMPLATE, values.get) == """name: foo
+revision: def
+again: def
+unknown: {{not.there}}
+"""
+    assert cache.stats == {"hit": 0, "partial": 1, "miss": 0}
+
+
+def test_render_index_compacted(tmp_path):
+    """Test the index doesn't grow forever with the templates changing"""
+    for content in ("a {{x}}", "b {{x}}", "c {{x}}", "d {{x}}"):
+        cache = render.RenderCache(max_entries=2, directory=str(tmp_path))
+        cache.render(content, lambda slot: "1")
+    cache = render.RenderCache(max_entries=2, directory=str(tmp_path))
+    assert cache.render("d {{x}}", lambda slot: "2") == "d 2"
+    assert cache.stats["partial"] == 1
+    with open(cache.index, encoding="utf-8") as index:
+        assert len(index.readlines()) == 2
+
+
+def test_kapply_uses_cache(render_cache, monkeypatch):
+    """Test kapply goes through the cache and records it"""
+    recorder = metrics.Recorder()
+    monkeypatch.setattr(metrics, "RECORDER", recorder)
+    tools = utils.Utils()
+    for revision in ("abc", "abc", "def"):
+        assert tools.kapply(TEMPLATE, {"name": "foo"}, {"revision": revision},
+                            name="tpl") == ("tpl", f"""name: foo
+revision: {revision}
+again: {revision}
+unknown: {{{{not.there}}}}
+""")
+    assert render_cache.stats == {"hit": 1, "partial": 1, "miss": 1}
+    assert sorted(x["labels"]["cache"] for x in recorder.summary()["calls"]
+                  if x["kind"] == metrics.RENDER) == ["hit", "miss", "partial"]
@@ -0,0 +1,90 @@
+"""Test the result cache"""
+# pylint: disable=too-few-public-methods
+import json
+import subprocess
+
+from tektonasacode import results
+
+
+class FakeUtils:
+    """Keep a configmap in memory instead of the cluster, like the API
+    refusing to replace it from a stale resourceVersion"""
+    def __init__(self):
+        self.configmap = None
+        self.version = 0
+
+    def execute(self, command, check_error=""):  # pylint: disable=unused-argument
+        """Fake kubectl get/create/replace"""
+        if command.startswith("kubectl get"):
+            if not self.configmap:
+                return subprocess.CompletedProcess(command, 1, b"")
+            return subprocess.CompletedProcess(
+                command, 0,
+                json.dumps(self.configmap).encode())
+        with open(command.split()[-1], encoding="utf-8") as cmfile:
+            configmap = json.load(cmfile)
+        if command.startswith("kubectl create") and self.configmap:
+            raise subprocess.CalledProcessError(1, command,
+                                                b"Error: AlreadyExists")
+        if command.startswith("kubectl replace") and configmap["metadata"][
+                "resourceVersion"] != str(self.version):
+            raise subprocess.CalledProcessError(1, command,
+                                                b"Error: Conflict")
+        self.version += 1
+        configmap["metadata"]["resourceVersion"] = str(self.version)
+        self.configmap = configmap
+        return subprocess.CompletedProcess(command, 0, b"")
+
+
+def test_fingerprint_ignore_volatiles():
+    """Test the random namespace doesn't change the fingerprint"""
+    first = results.ResultCache.fingerprint({"a.yaml": "ns: pull-1-abcd"},
+                                            "SHA", ["pull-1-abcd"])
+    second = results.ResultCache.fingerprint({"a.yaml": "ns: pull-1-efgh"},
+                                             "SHA", ["pull-1-efgh"])
+    assert first == second
+    assert first != results.ResultCache.fingerprint(
+        {"a.yaml": "ns: pull-1-efgh"}, "SHA2", ["pull-1-efgh"])
+    assert first != results.ResultCache.fingerprint(
+        {"a.yaml": "ns: hello pull-1-efgh"}, "SHA", ["pull-1-efgh"])
+
+
+def test_result_cache_get_set():
+    """Test storing and retrieving results"""
+    fakeutils = FakeUtils()
+    cache = results.ResultCache(fakeutils, configmap="results", namespace="")
+    assert cache.get("fingerprint") == {}
+
+    cache.set("fingerprint", {"check_run_url": "https://check/1"})
+    assert fakeutils.configmap["metadata"]["name"] == "results"
+    cached = cache.get("fingerprint")
+    assert cached["check_run_url"] == "https://check/1"
+    assert "date" in cached
+    assert cache.get("other") == {}
+
+    # Disabled
+    assert results.ResultCache(fakeutils, configmap="").get("fingerprint") == {}
+
+
+def test_result_cache_set_conflict():
+    """Test an entry stored by another run in the meantime is kept"""
+    fakeutils = FakeUtils()
+    cache = results.ResultCache(fakeutils, configmap="results", namespace="")
+    cache.set("first", {"check_run_url": "https://check/1"})
+
+    # Another run storing its result between our get and our replace
+    execute = fakeutils.execute
+
+    def racing_execute(command, check_error=""):
+        if command.startswith("kubectl replace") and "other" not in (
+                fakeutils.configmap["data"]):
+            other = results.ResultCache(fakeutils,
+                                        configmap="results",
+                                        namespace="")
+            fakeutils.execute = execute
+            other.set("other", {"check_run_url": "https://check/2"})
+        return execute(command, check_error)
+
+    fakeutils.execute = racing_execute
+    cache.set("second", {"check_run_url": "https://check/3"})
+    assert sorted(fakeutils.configmap["data"]) == ["first", "other", "second"]
@@ -0,0 +1,60 @@
+"""Test complete runs against the simulated cluster and GitHUB"""
+from benchmarks import simulator
+
+# Generous, the runs take about a second here
+WALL_CLOCK_BUDGET = 30
+
+
+def test_simulated_run_success_then_cached(tmpdir):
+    """Test a successful run and the same one again hitting the result cache"""
+    sim = simulator.Simulator(str(tmpdir), {"logs": 0.1}, log_lines=50)
+
+    report = sim.run()
+    assert report["returncode"] == 0, report["output"]
+    assert report["conclusion"] == "success"
+    assert report["title"] == "CI Run: Report"
+    assert report["wall_clock"] < WALL_CLOCK_BUDGET
+    for phase in ("event_filtering", "check_run_creation", "checkout",
+                  "template_processing", "namespace_creation", "apply",
+                  "log_follow", "status_update", "cleanup"):
+        assert phase in report["phases"]
+    assert "✅ 0:00:30 clone" in report["check_runs"][-1]["output"]["text"]
+
+    report = sim.run()
+    assert report["returncode"] == 0, report["output"]
+    assert report["title"] == "CI Run: Cached"
+    assert "log_follow" not in report["phases"]
+
+
+def test_simulated_run_failure(tmpdir):
+    """Test a failed run is reported with the annotations"""
+    sim = simulator.Simulator(str(tmpdir), {"logs": 0.1},
+                              log_lines=10,
+                              status="Failed")
+    report = sim.run()
+    assert report["returncode"] == 1
+    assert report["conclusion"] == "failure"
+    assert report["check_runs"][-1]["output"]["annotations"][0] == {
+        "path": ".tekton/pipelinerun.yaml",
+        "start_line": 1,
+        "end_line": 1,
+        "annotation_level": "failure",
+        "title": "Error detected",
+        "message": "[build : step] .tekton/pipelinerun.yaml:1: error: "
+        "simulated failure",
+    }
+
+    assert "failure" in simulator.format_reports([report]).splitlines()[1]
+
+
+def test_simulated_run_cancelled_not_cached(tmpdir):
+    """Test a cancelled run is not reused by the next ones"""
+    sim = simulator.Simulator(str(tmpdir), {"logs": 0.1},
+                              log_lines=10,
+                              status="Cancelled(PipelineRunCancelled)")
+    report = sim.run()
+    assert report["returncode"] == 0, report["output"]
+
+    report = sim.run()
+    assert report["title"] != "CI Run: Cached"
+    assert "log_follow" in report["phases"]
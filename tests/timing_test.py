@@ -0,0 +1,109 @@
+"""Test the analysis of the PipelineRun timings"""
+import copy
+
+from tektonasacode import timing
+
+
+def taskrun(task, start, running, end):
+    """A taskRun starting at start minute, running and ending at the other"""
+    return {
+        "pipelineTaskName": task,
+        "status": {
+            "podName": f"pr-{task}-pod",
+            "startTime": f"2020-01-01T00:{start:02d}:00Z",
+            "completionTime": f"2020-01-01T00:{end:02d}:00Z",
+            "steps": [{
+                "terminated": {
+                    "startedAt": f"2020-01-01T00:{running:02d}:00Z",
+                    "finishedAt": f"2020-01-01T00:{end:02d}:00Z",
+                }
+            }],
+        }
+    }
+
+
+PIPELINERUN = {
+    "metadata": {
+        "name": "pr"
+    },
+    "status": {
+        "startTime": "2020-01-01T00:00:00Z",
+        "completionTime": "2020-01-01T00:10:00Z",
+        "pipelineSpec": {
+            "tasks": [{
+                "name": "clone"
+            }, {
+                "name": "lint",
+                "runAfter": ["clone"]
+            }, {
+                "name": "test",
+                "params": [{
+                    "name": "commit",
+                    "value": "$(tasks.clone.results.commit)"
+                }]
+            }, {
+                "name": "build",
+                "runAfter": ["lint", "test"]
+            }],
+            "finally": [{
+                "name": "notify"
+            }],
+        },
+        "taskRuns": {
+            "pr-clone-a": taskrun("clone", 0, 1, 2),
+            "pr-lint-b": taskrun("lint", 2, 2, 5),
+            "pr-test-c": taskrun("test", 2, 4, 7),
+            "pr-build-d": taskrun("build", 7, 7, 9),
+            "pr-notify-e": taskrun("notify", 9, 9, 10),
+        },
+    }
+}
+
+PODS = [{
+    "metadata": {
+        "name": "pr-test-pod",
+        "creationTimestamp": "2020-01-01T00:02:00Z"
+    },
+    "status": {
+        "conditions": [{
+            "type": "PodScheduled",
+            "status": "True",
+            "lastTransitionTime": "2020-01-01T00:03:00Z"
+        }]
+    }
+}]
+
+
+def test_analyze():
+    """Test the critical path, pending and parallelism"""
+    analysis = timing.analyze(PIPELINERUN, PODS)
+    assert analysis["critical_path"] == ["clone", "test", "build", "notify"]
+    assert analysis["wall_clock"] == 600
+    assert analysis["pending"] == 180
+    assert analysis["running"] == 600
+    assert analysis["parallelism"] == 1.0
+    assert analysis["peak"] == 2
+    assert analysis["tasks"]["test"]["scheduling"] == 60
+    assert analysis["tasks"]["lint"]["scheduling"] is None
+
+    rendered = timing.render(analysis)
+    assert rendered.startswith(
+        "⏱️ **0:10:00** wall clock, critical path clone → test → build → "
+        "notify (0:10:00), 0:03:00 pending and 0:10:00 running, 1.0 tasks "
+        "running on average (peak 2)")
+    assert ("★ test   |        ░░░░░░░░████████████            | "
+            "0:02:00 pending, 0:03:00 running, 0:01:00 to schedule"
+            in rendered)
+    assert "  lint   |" in rendered
+
+
+def test_analyze_without_spec():
+    """Test we guess the critical path from the timings without the spec"""
+    pipelinerun = copy.deepcopy(PIPELINERUN)
+    del pipelinerun["status"]["pipelineSpec"]
+    assert timing.analyze(pipelinerun)["critical_path"] == [
+        "clone", "test", "build", "notify"
+    ]
+
+    assert timing.analyze({"metadata": {"name": "pr"}, "status": {}}) == {}
+    assert timing.render({}) == ""
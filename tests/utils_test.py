@@ -3,7 +3,7 @@
 import subprocess
 
 import yaml
-from tektonasacode import utils
+from tektonasacode import config, utils
 
 
 def test_kapply():
@@ -75,3 +75,70 @@ def test_kubectl_get():
     output = tools.kubectl_get(obj="none", output_type="yaml")
     assert 'items' in output
     assert 'namespace' not in output['items'][0]['metadata']
+
+
+def test_get_error_annotations(tmp_path):
+    """Test errors referencing a file in the repository become annotations"""
+    (tmp_path / "tektonasacode").mkdir()
+    (tmp_path / "tektonasacode" / "utils.py").write_text("hello")
+    (tmp_path / "README.md").write_text("moto")
+
+    text = """Running pylint
+/workspace/source/tektonasacode/utils.py:12:0: E0401: Unable to import (import-error)
+/workspace/source/tektonasacode/utils.py:12:0: E0401: Unable to import (import-error)
+README.md:3 has failed
+notthere.py:4 error
+tektonasacode/utils.py:20 all good"""
+    annotations = utils.Utils.get_error_annotations(text, str(tmp_path))
+    assert [(x['path'], x['start_line']) for x in annotations] == [
+        ("tektonasacode/utils.py", 12),
+        ("README.md", 3),
+    ]
+    assert annotations[0]['annotation_level'] == "failure"
+
+
+def test_get_errors_capped(monkeypatch):
+    """Test the errors reported are capped"""
+    monkeypatch.setattr(config, "MAX_REPORTED_ERRORS", 2)
+    output = utils.Utils.get_errors("error 1\nerror 2\nerror 3\n")
+    assert "error** 2" in output
+    assert "error** 3" not in output
+    assert "1 more" in output
+
+
+def test_task_durations():
+    """Test getting how long the succeeded tasks took"""
+    def taskrun(status, completion="2020-01-01T00:01:30Z"):
+        return {
+            "status": {
+                "startTime": "2020-01-01T00:00:00Z",
+                "completionTime": completion,
+                "conditions": [{
+                    "status": status
+                }],
+            }
+        }
+
+    pipelinerun = {
+        "metadata": {
+            "name": "pr"
+        },
+        "status": {
+            "taskRuns": {
+                "pr-build-abcde": dict(taskrun("True"),
+                                       pipelineTaskName="build"),
+                "pr-lint-task-fghij": taskrun("True", "2020-01-01T00:00:10Z"),
+                "pr-test-klmno": taskrun("False"),
+            }
+        }
+    }
+    assert utils.Utils.task_durations(pipelinerun) == {
+        "build": 90,
+        "lint-task": 10,
+    }
+    # The report uses the same names and durations
+    assert utils.Utils.process_pipelineresult(pipelinerun) == [
+        "✅ 0:01:30 build",
+        "✅ 0:00:10 lint-task",
+        "❌ 0:01:30 test",
+    ]
@@ -0,0 +1,36 @@
+"""Test the YAML helpers"""
+from tektonasacode import yamlutil
+
+
+def test_load_dump_roundtrip():
+    """Test we can load and dump documents"""
+    documents = list(
+        yamlutil.load_all("""---
+kind: Task
+metadata:
+  name: héllo
+---
+---
+kind: Pipeline
+"""))
+    assert documents == [{
+        "kind": "Task",
+        "metadata": {
+            "name": "héllo"
+        }
+    }, None, {
+        "kind": "Pipeline"
+    }]
+    assert yamlutil.load(yamlutil.dump(documents[0])) == documents[0]
+    dumped = yamlutil.dump_all([documents[0], documents[2]], allow_unicode=True)
+    assert "héllo" in dumped
+    assert list(yamlutil.load_all(dumped)) == [documents[0], documents[2]]
+
+
+def test_load_is_safe():
+    """Test we don't construct arbitrary python objects"""
+    try:
+        yamlutil.load("!!python/object/apply:os.system ['true']")
+    except yamlutil.YAMLError:
+        return
+    assert False, "Should have refused to load python objects"